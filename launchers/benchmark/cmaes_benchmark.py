@@ -0,0 +1,117 @@
+'''
+Scaling of the CMA-ES variants (my_garage/algos/cmaes.py) over the search dimension n, against the
+full-covariance cma.CMAEvolutionStrategy used so far.
+
+For every n in --ns and every variant:
+    generation_time   median wall time of one generation (ask + tell), popsize and bounds as in cmaes_ppo_opt_*
+    peak_memory       peak memory allocated by the strategy (tracemalloc) over its creation and two generations
+    generations       generations until the objective is below --ftarget (or --max_generations), on
+                      'sum_target' : (sum(x) - target)^2 / n^2, the structure of the hardware search
+                                     (the envs only use the sum of the k's / l's)
+                      'sphere'     : |x - x_opt|^2 / n
+
+Usage:
+    python launchers/benchmark/cmaes_benchmark.py --ns 10,100,1000,5000 --output cmaes_report.json
+'''
+
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from my_garage.algos.cmaes import make_cma_es, CMAES_VARIANTS
+
+
+LB, UB = 0.0, 2.0 # per-element bounds (as k_lb, k_ub of 50 springs)
+
+
+def objectives(n, seed):
+    x_opt = np.random.RandomState(seed).uniform(LB + 0.1 * (UB - LB), UB - 0.1 * (UB - LB), size=n)
+    target = 0.3 * n * (UB - LB)
+    return dict(sum_target=lambda x: float((np.sum(x) - target)**2 / n**2),
+                sphere=lambda x: float(np.sum((x - x_opt)**2) / n))
+
+
+def make_es(n, variant, popsize, seed):
+    options = {'popsize': popsize, 'bounds': [[LB] * n, [UB] * n], 'seed': seed,
+               'verbose': -9, 'verb_log': 0, 'verb_disp': 0, 'tolfun': 0, 'tolx': 0}
+    return make_cma_es([(LB + UB) / 2] * n, (UB - LB) / 4, options, variant=variant)
+
+
+def bench_generation(n, variant, popsize, n_generations, seed):
+    objective = objectives(n, seed)['sphere']
+
+    def run(es, n_generations):
+        times = []
+        for _ in range(n_generations):
+            t1 = time.perf_counter()
+            solutions = es.ask()
+            es.tell(solutions, [objective(x) for x in solutions])
+            times.append(time.perf_counter() - t1)
+        return times
+
+    times = run(make_es(n, variant, popsize, seed), n_generations)
+    # memory in a separate run, tracemalloc slows down the allocations
+    tracemalloc.start()
+    run(make_es(n, variant, popsize, seed), 2)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dict(generation_time=float(np.median(times)), peak_memory=int(peak_memory))
+
+
+def bench_convergence(n, variant, popsize, objective_name, ftarget, max_generations, seed):
+    es = make_es(n, variant, popsize, seed)
+    objective = objectives(n, seed)[objective_name]
+    best = np.inf
+    for generation in range(1, max_generations + 1):
+        solutions = es.ask()
+        values = [objective(x) for x in solutions]
+        es.tell(solutions, values)
+        best = min(best, min(values))
+        if best < ftarget:
+            return dict(generations=generation, best=best, reached=True)
+    return dict(generations=max_generations, best=best, reached=False)
+
+
+def print_table(records):
+    header = '{:>6} {:>5} {:>14} {:>12} {:>14} {:>14}'.format('n', 'var', 'gen [ms]', 'mem [MB]', 'gens sum_tgt', 'gens sphere')
+    print(header)
+    print('-' * len(header))
+    for r in records:
+        def gens(name):
+            c = r[name]
+            return '{}{}'.format(c['generations'], '' if c['reached'] else '+')
+        print('{:>6d} {:>5} {:>14.3f} {:>12.2f} {:>14} {:>14}'.format(r['n'], r['variant'], r['generation_time'] * 1e3,
+              r['peak_memory'] / 1e6, gens('sum_target'), gens('sphere')))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ns', default='10,100,1000,2000', help='comma separated search dimensions')
+    parser.add_argument('--variants', default=','.join(CMAES_VARIANTS), help='comma separated variants out of ' + ','.join(CMAES_VARIANTS))
+    parser.add_argument('--popsize', default=8, type=int, help='as params.cmaes_options')
+    parser.add_argument('--generations', default=10, type=int, help='generations for the timing')
+    parser.add_argument('--ftarget', default=1e-4, type=float)
+    parser.add_argument('--max_generations', default=300, type=int)
+    parser.add_argument('--seed', default=1, type=int)
+    parser.add_argument('--output', default=None, help='json report')
+    args = parser.parse_args()
+
+    records = []
+    for n in [int(n) for n in args.ns.split(',')]:
+        for variant in args.variants.split(','):
+            print('Benchmarking {} CMA-ES with n={} ...'.format(variant, n), file=sys.stderr)
+            record = dict(n=n, variant=variant, popsize=args.popsize)
+            record.update(bench_generation(n, variant, args.popsize, args.generations, args.seed))
+            for objective_name in ['sum_target', 'sphere']:
+                record[objective_name] = bench_convergence(n, variant, args.popsize, objective_name, args.ftarget, args.max_generations, args.seed)
+            records.append(record)
+    print_table(records)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(dict(settings=vars(args), results=records), f, indent=2)
+        print('Report written to {}'.format(args.output), file=sys.stderr)
@@ -0,0 +1,155 @@
+'''
+Accuracy and speed of the env integrators (params.integrator / params.interface_integrator).
+
+Every integrator is run on the same piecewise-constant input force over the same simulated time, at the
+default action window (n_steps_per_action * dt) with the default substeps and with a single substep per
+action, and at 5x / 25x coarser action windows with a single substep. The states are compared with a
+reference from 'midpoint_substep' with 500 substeps per default window, at the end of every coarsest window.
+Stiff settings are used: all springs at k_ub in opt_k, and the interface spring in opt_l. The state clipping of
+the envs is disabled, since clipping at different action rates would dominate the differences. The floor at
+y1 = 0 cannot be disabled, so the masses start Y_OFFSET below their usual position and a constant force of
+k * Y_OFFSET holds them there, far above the floor: only the integrator errors are measured. The reference is checked to stay above the
+floor, and a run that reaches it (an unstable integrator) is marked in the report.
+
+Usage:
+    python launchers/benchmark/integrator_benchmark.py --output integrator_report.json
+'''
+
+import io
+import sys
+import json
+import time
+import types
+import argparse
+import contextlib
+
+import numpy as np
+
+from mass_spring_envs.envs import mass_spring_env_opt_k as envs_opt_k
+from mass_spring_envs.envs import mass_spring_env_opt_l as envs_opt_l
+
+from shared_params import params_opt_k
+from shared_params import params_opt_l
+
+
+# case: (env class, params module, integrator param, substeps param, integrators, reference integrator)
+CASES = {
+    'opt_k_hw_as_action': (envs_opt_k.MassSpringEnv_OptK_HwAsAction, params_opt_k, 'integrator', 'n_steps_per_action',
+                           ['midpoint', 'midpoint_substep', 'implicit_midpoint', 'expm'], 'midpoint_substep'),
+    'opt_l_hw_as_action': (envs_opt_l.MassSpringEnv_OptL_HwAsAction, params_opt_l, 'integrator', 'n_steps_per_action',
+                           ['midpoint', 'midpoint_substep', 'implicit_midpoint', 'expm'], 'midpoint_substep'),
+    'opt_l_hw_as_policy_substep_coupling': (envs_opt_l.MassSpringEnv_OptL_HwAsPolicy_SubstepCoupling, params_opt_l,
+                           'interface_integrator', 'n_steps_per_action_interface', ['midpoint', 'implicit_midpoint', 'expm'], 'midpoint'),
+}
+
+WINDOW_SCALES = [1, 5, 25] # action window relative to the default one
+N_REFERENCE_SUBSTEPS = 500
+Y_OFFSET = 10.0 # [m], the oscillations of the undamped masses stay well within it
+
+
+def make_env(case, integrator, window, n_substeps):
+    env_class, params, integrator_key, substeps_key, _, _ = CASES[case]
+    env_params = types.SimpleNamespace(**{k: v for k, v in vars(params).items() if not k.startswith('__')})
+    setattr(env_params, integrator_key, integrator)
+    setattr(env_params, substeps_key, n_substeps)
+    env_params.dt = window / n_substeps
+    env_params.n_steps_per_episode = -1 # no end-of-episode prints
+    env_params.pos_range = env_params.half_vel_range = 1e6 # no state clipping (but the floor at y1 = 0)
+    env_params.half_force_range = 1e6 # room for the offset force
+    env = env_class(env_params)
+    env.reset()
+    env.y1, env.v1 = 0.1 + Y_OFFSET, 0.0
+    if hasattr(env, 'y2'):
+        env.y2, env.v2 = env.y1 + 0.2, 0.0
+    return env
+
+
+def make_action(case, env, force):
+    '''
+    The action with the input force plus the force that holds the mass Y_OFFSET lower
+    '''
+    if case == 'opt_k_hw_as_action':
+        return np.array([force + env.k_ub * env.n_springs * Y_OFFSET] + [env.k_ub] * env.n_springs) # the stiffest springs
+    if case == 'opt_l_hw_as_action':
+        return np.array([force + env.k * Y_OFFSET] + [env.l_ub] * env.n_segments)
+    return np.array([0.2, force + env.k * Y_OFFSET])
+
+
+def observe(env):
+    return [env.y1, env.v1, env.y2, env.v2] if hasattr(env, 'y2') else [env.y1, env.v1]
+
+
+def run(case, integrator, window, n_substeps, forces, hold):
+    '''
+    States at the end of every hold period, the wall time per env step and whether the mass reached the floor.
+    '''
+    env = make_env(case, integrator, window, n_substeps)
+    n_actions_per_hold = int(round(hold / window))
+    states = []
+    min_y1 = np.inf
+    with contextlib.redirect_stdout(io.StringIO()):
+        t1 = time.perf_counter()
+        for force in forces:
+            action = make_action(case, env, force)
+            for _ in range(n_actions_per_hold):
+                env.step(action)
+                min_y1 = min(min_y1, env.y1)
+            states.append(observe(env))
+        elapsed = time.perf_counter() - t1
+    return np.array(states), elapsed / (len(forces) * n_actions_per_hold), min_y1 <= 0.0
+
+
+def benchmark(case, duration, seed):
+    _, params, _, substeps_key, integrators, reference_integrator = CASES[case]
+    window = getattr(params, substeps_key) * params.dt
+    hold = window * max(WINDOW_SCALES)
+    forces = np.random.RandomState(seed).uniform(-params.half_force_range, params.half_force_range, size=int(round(duration / hold)))
+
+    reference, _, reference_hit_floor = run(case, reference_integrator, window, N_REFERENCE_SUBSTEPS, forces, hold)
+    assert not reference_hit_floor, '{}: the reference reached the floor at y1 = 0, raise Y_OFFSET'.format(case)
+
+    records = []
+    settings = [(1, getattr(params, substeps_key))] + [(scale, 1) for scale in WINDOW_SCALES]
+    for integrator in integrators:
+        for scale, n_substeps in settings:
+            states, step_time, hit_floor = run(case, integrator, scale * window, n_substeps, forces, hold)
+            errors = np.abs(states - reference)
+            records.append(dict(case=case,
+                                integrator=integrator,
+                                window=scale * window,
+                                n_substeps=n_substeps,
+                                dt=scale * window / n_substeps,
+                                max_pos_error=float(np.max(errors[:, 0::2])),
+                                max_vel_error=float(np.max(errors[:, 1::2])),
+                                hit_floor=bool(hit_floor), # only an unstable integrator gets there
+                                step_time=step_time,
+                                sim_time_per_wall_time=scale * window / step_time))
+    return records
+
+
+def print_table(records):
+    header = '{:<38} {:<18} {:>8} {:>5} {:>13} {:>13} {:>12} {:>6}'.format('case', 'integrator', 'window', 'sub', 'pos error', 'vel error', 'step [us]', 'floor')
+    print(header)
+    print('-' * len(header))
+    for r in records:
+        print('{:<38} {:<18} {:>8.3f} {:>5d} {:>13.3e} {:>13.3e} {:>12.1f} {:>6}'.format(r['case'], r['integrator'], r['window'], r['n_substeps'],
+              r['max_pos_error'], r['max_vel_error'], r['step_time'] * 1e6, 'hit' if r['hit_floor'] else ''))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cases', default=','.join(CASES), help='comma separated cases out of ' + ','.join(CASES))
+    parser.add_argument('--duration', default=5.0, type=float, help='simulated time in seconds')
+    parser.add_argument('--seed', default=0, type=int, help='seed of the input force sequence')
+    parser.add_argument('--output', default=None, help='json report')
+    args = parser.parse_args()
+
+    records = []
+    for case in args.cases.split(','):
+        records += benchmark(case, args.duration, args.seed)
+    print_table(records)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(dict(duration=args.duration, seed=args.seed, n_reference_substeps=N_REFERENCE_SUBSTEPS, results=records), f, indent=2)
+        print('Report written to {}'.format(args.output), file=sys.stderr)
@@ -0,0 +1,112 @@
+'''
+Inner trainings needed by the hardware outer loops of cmaes_ppo_opt_*: CMA-ES (my_garage/algos/cmaes.py)
+against Bayesian optimization (my_garage/algos/bayes_opt.py), on cheap stand-ins for the inner PPO run.
+
+Every evaluation of the outer loop is a full PPO training, so the cost is the number of evaluations.
+The stand-in objective has the structure of the final return over the hardware: smooth, with the
+optimum inside the box, the k's / l's mostly acting through their sum, and noisy:
+
+    f(x) = (mean(x) - target)^2 + 0.05 * |x - mean(x)|^2 / dim + noise * N(0, 1)
+
+on the box of params.k_hw ('groups' / 'total' parameterizations, dim = --dims). For each optimizer and
+seed it records the evaluations until the noise-free value of the best evaluated point is below --ftarget.
+
+Usage:
+    python launchers/benchmark/outer_loop_benchmark.py --dims 2,5,10 --seeds 5 --output outer_loop_report.json
+'''
+
+import sys
+import json
+import argparse
+
+import numpy as np
+
+from my_garage.algos.cmaes import make_cma_es
+from my_garage.algos.bayes_opt import BayesOpt
+
+
+LB, UB = 0.0, 2.0 # per-element bounds (k_lb, k_ub)
+
+
+def make_objective(dim, noise, seed):
+    target = np.random.RandomState(seed).uniform(LB + 0.2 * (UB - LB), UB - 0.2 * (UB - LB))
+
+    def true_f(x):
+        x = np.asarray(x)
+        return float((np.mean(x) - target)**2 + 0.05 * np.sum((x - np.mean(x))**2) / dim)
+
+    rng = np.random.RandomState(seed + 1000)
+    return true_f, lambda x: true_f(x) + noise * rng.randn()
+
+
+def run_cmaes(dim, true_f, noisy_f, max_evals, seed, popsize):
+    # as params.cmaes_options / cmaes_x0 / cmaes_sigma0
+    options = {'popsize': popsize, 'bounds': [[LB] * dim, [UB] * dim], 'seed': seed + 1, 'verbose': -9, 'verb_log': 0, 'verb_disp': 0, 'tolfun': 0, 'tolx': 0}
+    es = make_cma_es([(LB + UB) / 2] * dim, (UB - LB) / 4, options)
+    trace = []
+    while len(trace) < max_evals:
+        solutions = es.ask()
+        es.tell(solutions, [noisy_f(x) for x in solutions])
+        trace.extend(true_f(x) for x in solutions)
+    return trace[:max_evals]
+
+
+def run_bo(dim, true_f, noisy_f, max_evals, seed, batch_size, n_init):
+    bo = BayesOpt([LB] * dim, [UB] * dim, batch_size=batch_size, n_init=n_init, seed=seed)
+    trace = []
+    while bo.n_evals < max_evals:
+        candidates = bo.ask()
+        bo.tell(candidates, [noisy_f(x) for x in candidates])
+        trace.extend(true_f(x) for x in candidates)
+    return trace[:max_evals]
+
+
+def evals_to_target(trace, ftarget):
+    best = np.minimum.accumulate(trace)
+    reached = np.flatnonzero(best < ftarget)
+    return int(reached[0]) + 1 if reached.size else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dims', default='2,5,10', help='comma separated dimensions of the hardware search space')
+    parser.add_argument('--seeds', default=5, type=int)
+    parser.add_argument('--noise', default=1e-3, type=float, help='std of the evaluation noise')
+    parser.add_argument('--ftarget', default=1e-3, type=float)
+    parser.add_argument('--max_evals', default=80, type=int, help='inner trainings per run (cmaes_ppo_opt_* use 40)')
+    parser.add_argument('--popsize', default=8, type=int, help='as params.cmaes_options')
+    parser.add_argument('--batch_size', default=4, type=int, help='as params.bo_options')
+    parser.add_argument('--n_init', default=8, type=int, help='as params.bo_options')
+    parser.add_argument('--output', default=None, help='json report')
+    args = parser.parse_args()
+
+    records = []
+    for dim in [int(d) for d in args.dims.split(',')]:
+        for optimizer in ['cmaes', 'bo']:
+            print('Benchmarking {} with dim={} ...'.format(optimizer, dim), file=sys.stderr)
+            evals, finals = [], []
+            for seed in range(args.seeds):
+                true_f, noisy_f = make_objective(dim, args.noise, seed)
+                if optimizer == 'cmaes':
+                    trace = run_cmaes(dim, true_f, noisy_f, args.max_evals, seed, args.popsize)
+                else:
+                    trace = run_bo(dim, true_f, noisy_f, args.max_evals, seed, args.batch_size, args.n_init)
+                evals.append(evals_to_target(trace, args.ftarget))
+                finals.append(float(np.min(trace)))
+            reached = [e for e in evals if e is not None]
+            records.append(dict(dim=dim, optimizer=optimizer, evals_to_target=evals,
+                                median_evals=float(np.median(reached)) if reached else None,
+                                n_reached=len(reached), median_best=float(np.median(finals))))
+
+    header = '{:>5} {:>7} {:>14} {:>9} {:>12}'.format('dim', 'opt', 'median evals', 'reached', 'median best')
+    print(header)
+    print('-' * len(header))
+    for r in records:
+        print('{:>5d} {:>7} {:>14} {:>9} {:>12.2e}'.format(r['dim'], r['optimizer'],
+              '-' if r['median_evals'] is None else '{:.1f}'.format(r['median_evals']),
+              '{}/{}'.format(r['n_reached'], args.seeds), r['median_best']))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(dict(settings=vars(args), results=records), f, indent=2)
+        print('Report written to {}'.format(args.output), file=sys.stderr)
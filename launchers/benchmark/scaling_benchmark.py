@@ -0,0 +1,337 @@
+'''
+Scaling benchmark over the number of springs (opt_k) / bar segments (opt_l).
+
+For every n in --ns and every case, a fresh worker process is started with
+HWASP_N_SPRINGS / HWASP_N_SEGMENTS set to n (so shared_params derives all
+n-dependent values as usual) and measures:
+    env         env step throughput of every env class
+    policy      forward and backward time of every MechPolicyModel_* (and the HwInPolicyAndAction model)
+    ppo         PPO optimize_policy time (and the whole epoch time) for the HwAsAction / HwAsPolicy setups
+    cmaes       CMA-ES generation time (ask + tell) over the hardware vector and over the policy parameters
+    ars         ARS iteration time (train_step) with a reduced number of directions / rollout length
+The results are written as one json report, one record per (case, n, stage, name).
+
+Usage:
+    python launchers/benchmark/scaling_benchmark.py --output scaling_report.json
+    python launchers/benchmark/scaling_benchmark.py --ns 1,10,50 --cases opt_k --stages env,policy
+'''
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2' # only show errors in TF
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1' # only use CPU
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import importlib
+import traceback
+
+import numpy as np
+
+
+STAGES = ['env', 'policy', 'ppo', 'cmaes', 'ars']
+CASES = ['opt_k', 'opt_l']
+N_ENV_VARS = {'opt_k': 'HWASP_N_SPRINGS', 'opt_l': 'HWASP_N_SEGMENTS'}
+
+
+def _timeit(fcn, n_repeats):
+    '''
+    Median wall time of n_repeats calls, after one warm-up call.
+    '''
+    fcn()
+    times = []
+    for _ in range(n_repeats):
+        t1 = time.perf_counter()
+        fcn()
+        times.append(time.perf_counter() - t1)
+    return float(np.median(times))
+
+
+def _record(records, stage, name, fcn):
+    '''
+    Run one measurement, keeping going (and recording the error) if it fails.
+    '''
+    t1 = time.perf_counter()
+    try:
+        metrics = fcn()
+        records.append(dict(stage=stage, name=name, **metrics))
+    except Exception as e:
+        records.append(dict(stage=stage, name=name, error=repr(e), traceback=traceback.format_exc()))
+    print('[{}] {} done in {:.2f} s'.format(stage, name, time.perf_counter() - t1), file=sys.stderr)
+
+
+#################################### Stages ####################################
+
+
+def bench_env(case, params, records, n_steps):
+    if case == 'opt_k':
+        from mass_spring_envs.envs import mass_spring_env_opt_k as envs
+        env_classes = [envs.MassSpringEnv_OptK_HwAsAction, envs.MassSpringEnv_OptK_HwAsPolicy]
+    else:
+        from mass_spring_envs.envs import mass_spring_env_opt_l as envs
+        env_classes = [envs.MassSpringEnv_OptL_HwAsAction, envs.MassSpringEnv_OptL_HwAsPolicy]
+
+    for env_class in env_classes:
+        def run():
+            env = env_class(params)
+            env.reset()
+            actions = [env.action_space.sample() for _ in range(100)]
+            with contextlib.redirect_stdout(io.StringIO()): # the envs print at the end of each episode
+                t1 = time.perf_counter()
+                for i in range(n_steps):
+                    _, _, done, _ = env.step(actions[i % len(actions)])
+                    if done or env.step_cnt >= params.n_steps_per_episode:
+                        env.reset()
+                elapsed = time.perf_counter() - t1
+            return dict(steps=n_steps, time=elapsed, steps_per_sec=n_steps / elapsed, action_dim=int(env.action_space.shape[0]))
+        _record(records, 'env', env_class.__name__, run)
+
+
+def _model_specs(case):
+    '''
+    (model class name, input shapes) of the policy models of a case
+    '''
+    if case == 'opt_k':
+        return [('MechPolicyModel_OptK_FixedHW', [(None, 2)]),
+                ('MechPolicyModel_OptK_HwAsAction', [(None, 2)]),
+                ('MechPolicyModel_OptK_HwAsPolicy', [(None, 1), (None, 2)]),
+                ('CompMechPolicyModel_OptK_HwInPolicyAndAction', [(None, 2)])]
+    return [('MechPolicyModel_OptL_FixedHW', [(None, 2)]),
+            ('MechPolicyModel_OptL_HwAsAction', [(None, 2)]),
+            ('MechPolicyModel_OptL_HwAsPolicy', [(None, 1), (None, 4)])]
+
+
+def bench_policy(case, params, records, batch_size, n_repeats):
+    import tensorflow as tf
+    models = importlib.import_module('policies.{}.models'.format(case))
+
+    for class_name, input_shapes in _model_specs(case):
+        def run():
+            tf.compat.v1.reset_default_graph()
+            with tf.compat.v1.Session() as sess:
+                phs = [tf.compat.v1.placeholder(tf.float32, shape=shape) for shape in input_shapes]
+                model = getattr(models, class_name)(params=params)
+                outputs = model.build(phs if len(phs) > 1 else phs[0])
+                loss = tf.add_n([tf.reduce_sum(out) for out in outputs])
+                train_vars = tf.compat.v1.trainable_variables()
+                grads = [g for g in tf.gradients(loss, train_vars) if g is not None]
+                sess.run(tf.compat.v1.global_variables_initializer())
+
+                feed = {ph: np.random.uniform(-1, 1, size=(batch_size, ph.shape.as_list()[1])) for ph in phs}
+                forward = _timeit(lambda: sess.run(outputs, feed_dict=feed), n_repeats)
+                backward = _timeit(lambda: sess.run(grads, feed_dict=feed), n_repeats)
+                n_params = int(sum(np.prod(v.shape.as_list()) for v in train_vars))
+            return dict(batch_size=batch_size, forward_time=forward, backward_time=backward, n_params=n_params)
+        _record(records, 'policy', class_name, run)
+
+
+def _build_policy(case, mode, env, params):
+    import tensorflow as tf
+    from garage.tf.models.mlp_model import MLPModel
+    models = importlib.import_module('policies.{}.models'.format(case))
+    policies = importlib.import_module('policies.{}.policies'.format(case))
+    case_cls = 'OptK' if case == 'opt_k' else 'OptL'
+
+    comp_policy_model = MLPModel(output_dim=1,
+        hidden_sizes=params.comp_policy_network_size,
+        hidden_nonlinearity=tf.nn.tanh,
+        output_nonlinearity=tf.nn.tanh)
+    mech_policy_model = getattr(models, 'MechPolicyModel_{}_{}'.format(case_cls, mode))(params)
+    return getattr(policies, 'CompMechPolicy_{}_{}'.format(case_cls, mode))(name='comp_mech_policy',
+        env_spec=env.spec,
+        comp_policy_model=comp_policy_model,
+        mech_policy_model=mech_policy_model)
+
+
+def _make_env(case, mode, params):
+    from garage.tf.envs import TfEnv
+    envs = importlib.import_module('mass_spring_envs.envs.mass_spring_env_{}'.format(case))
+    case_cls = 'OptK' if case == 'opt_k' else 'OptL'
+    return TfEnv(getattr(envs, 'MassSpringEnv_{}_{}'.format(case_cls, mode))(params))
+
+
+def bench_ppo(case, params, records, n_epochs, batch_size):
+    import tensorflow as tf
+    from garage.experiment import SnapshotConfig
+    from garage.tf.algos.ppo import PPO
+    from garage.np.baselines import LinearFeatureBaseline
+    from garage.tf.experiment import LocalTFRunner
+
+    for mode in ['HwAsAction', 'HwAsPolicy']:
+        def run():
+            tf.compat.v1.reset_default_graph()
+            timings = dict(optimize_policy=[], process_samples=[])
+            with tempfile.TemporaryDirectory() as snapshot_dir, contextlib.redirect_stdout(io.StringIO()):
+                snapshot_config = SnapshotConfig(snapshot_dir=snapshot_dir, snapshot_mode='none', snapshot_gap=1)
+                with LocalTFRunner(snapshot_config=snapshot_config) as runner:
+                    env = _make_env(case, mode, params)
+                    policy = _build_policy(case, mode, env, params)
+                    baseline = LinearFeatureBaseline(env_spec=env.spec)
+                    algo = PPO(env_spec=env.spec, policy=policy, baseline=baseline, **params.ppo_algo_kwargs)
+
+                    # time the algo steps without touching the training loop
+                    for key in timings:
+                        method = getattr(algo, key)
+                        def timed(*args, _method=method, _key=key, **kwargs):
+                            t1 = time.perf_counter()
+                            out = _method(*args, **kwargs)
+                            timings[_key].append(time.perf_counter() - t1)
+                            return out
+                        setattr(algo, key, timed)
+
+                    runner.setup(algo, env)
+                    t1 = time.perf_counter()
+                    runner.train(n_epochs=n_epochs, batch_size=batch_size, plot=False)
+                    epoch_time = (time.perf_counter() - t1) / n_epochs
+            steady = lambda ts: float(np.median(ts[1:] if len(ts) > 1 else ts)) # skip the first (graph warm-up) iteration
+            return dict(n_epochs=n_epochs, batch_size=batch_size, epoch_time=epoch_time,
+                        optimize_time=steady(timings['optimize_policy']),
+                        process_samples_time=steady(timings['process_samples']))
+        _record(records, 'ppo', mode, run)
+
+
+def bench_cmaes(case, params, records, n_generations):
+    import cma
+
+    def run_es(x0, sigma0, popsize, bounds=None):
+        options = {'popsize': popsize, 'verbose': -9, 'seed': 1, 'verb_log': 0, 'verb_disp': 0}
+        if bounds is not None:
+            options['bounds'] = bounds
+        es = cma.CMAEvolutionStrategy(x0, sigma0, options)
+        x0 = np.asarray(x0)
+        def generation():
+            solutions = es.ask()
+            es.tell(solutions, [float(np.sum((np.asarray(x) - x0)**2)) for x in solutions])
+        return dict(dim=int(x0.size), popsize=popsize, generation_time=_timeit(generation, n_generations))
+
+    # the hardware outer loop of cmaes_ppo_opt_*
+    _record(records, 'cmaes', 'hardware_outer_loop',
+        lambda: run_es(params.cmaes_x0, params.cmaes_sigma0, params.cmaes_options['popsize'], params.cmaes_options['bounds']))
+
+    # the policy-parameter search of cmaes_opt_*_hw_as_action (garage CMAES uses n_samples as popsize)
+    def policy_dim():
+        n_hw = params.n_springs if case == 'opt_k' else params.n_segments
+        sizes = (2,) + tuple(params.comp_policy_network_size) + (1,)
+        n_mlp = sum(a * b + b for a, b in zip(sizes[:-1], sizes[1:]))
+        return n_mlp + n_hw + (1 + n_hw) # mlp + hw logits + log_stds
+    _record(records, 'cmaes', 'policy_params',
+        lambda: run_es(np.zeros(policy_dim()), params.cmaes_algo_kwargs['sigma0'], params.cmaes_algo_kwargs['n_samples']))
+
+
+def bench_ars(case, params, records, n_iter, rollout_length):
+    import tensorflow as tf
+    from my_garage.algos.ars import ARS
+
+    def run():
+        tf.compat.v1.reset_default_graph()
+        with tf.compat.v1.Session() as sess, contextlib.redirect_stdout(io.StringIO()):
+            env = _make_env(case, 'HwAsAction', params)
+            policy = _build_policy(case, 'HwAsAction', env, params)
+            sess.run(tf.compat.v1.global_variables_initializer())
+            ars_kwargs = dict(params.ars_kwargs, num_workers=1, num_deltas=2, deltas_used=2, rollout_length=rollout_length)
+            ars = ARS(env_name=None, env=env, policy_params=None, policy=policy, seed=0, **ars_kwargs)
+            iteration = _timeit(ars.train_step, n_iter)
+            dim = int(ars.w_policy.size)
+        return dict(num_deltas=2, rollout_length=rollout_length, iteration_time=iteration, dim=dim)
+    _record(records, 'ars', 'HwAsAction', run)
+
+
+#################################### Driver ####################################
+
+
+def run_worker(case, n, stages, args):
+    '''
+    Runs inside the worker process, the params module is imported with n already set by the env var.
+    '''
+    params = importlib.import_module('shared_params.params_{}'.format(case))
+    n_hw = params.n_springs if case == 'opt_k' else params.n_segments
+    assert n_hw == n, 'the params module did not pick up {}={}'.format(N_ENV_VARS[case], n)
+    np.random.seed(0)
+
+    records = []
+    if 'env' in stages:
+        bench_env(case, params, records, n_steps=args.env_steps)
+    if 'policy' in stages:
+        bench_policy(case, params, records, batch_size=args.policy_batch_size, n_repeats=args.n_repeats)
+    if 'ppo' in stages:
+        bench_ppo(case, params, records, n_epochs=args.ppo_epochs, batch_size=args.ppo_batch_size)
+    if 'cmaes' in stages:
+        bench_cmaes(case, params, records, n_generations=args.cmaes_generations)
+    if 'ars' in stages:
+        bench_ars(case, params, records, n_iter=args.ars_iters, rollout_length=args.ars_rollout_length)
+    for record in records:
+        record.update(case=case, n=n)
+    return records
+
+
+def main(args):
+    ns = [int(n) for n in args.ns.split(',')]
+    cases = args.cases.split(',')
+    stages = args.stages.split(',')
+
+    report = dict(meta=dict(created=time.strftime('%Y-%m-%d %H:%M:%S'),
+                            python=platform.python_version(),
+                            numpy=np.__version__,
+                            machine=platform.machine(),
+                            processor=platform.processor(),
+                            cpu_count=os.cpu_count(),
+                            ns=ns, cases=cases, stages=stages,
+                            settings={k: v for k, v in vars(args).items() if k not in ('ns', 'cases', 'stages', 'output', 'worker_output')}),
+                  results=[])
+
+    for case in cases:
+        for n in ns:
+            print('Benchmarking {} with n={} ...'.format(case, n), file=sys.stderr)
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                worker_output = os.path.join(tmp_dir, 'records.json')
+                cmd = [sys.executable, os.path.abspath(__file__), '--worker_output', worker_output,
+                       '--ns', str(n), '--cases', case, '--stages', ','.join(stages)]
+                for key in ['env_steps', 'policy_batch_size', 'n_repeats', 'ppo_epochs', 'ppo_batch_size',
+                            'cmaes_generations', 'ars_iters', 'ars_rollout_length']:
+                    cmd += ['--' + key, str(getattr(args, key))]
+                env = dict(os.environ, **{N_ENV_VARS[case]: str(n)})
+                try:
+                    proc = subprocess.run(cmd, env=env, timeout=args.timeout)
+                    if os.path.isfile(worker_output):
+                        with open(worker_output) as f:
+                            report['results'] += json.load(f)
+                    else:
+                        report['results'].append(dict(case=case, n=n, error='worker exited with code {}'.format(proc.returncode)))
+                except subprocess.TimeoutExpired:
+                    report['results'].append(dict(case=case, n=n, error='timeout after {} s'.format(args.timeout)))
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Report written to {}'.format(args.output), file=sys.stderr)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ns', default='1,10,50,500,5000', help='comma separated numbers of springs / segments')
+    parser.add_argument('--cases', default=','.join(CASES), help='comma separated cases')
+    parser.add_argument('--stages', default=','.join(STAGES), help='comma separated stages out of ' + ','.join(STAGES))
+    parser.add_argument('--output', default='scaling_report.json', help='json report')
+    parser.add_argument('--timeout', default=None, type=float, help='timeout in seconds for each (case, n) worker')
+    parser.add_argument('--env_steps', default=5000, type=int)
+    parser.add_argument('--policy_batch_size', default=2000, type=int)
+    parser.add_argument('--n_repeats', default=20, type=int)
+    parser.add_argument('--ppo_epochs', default=3, type=int)
+    parser.add_argument('--ppo_batch_size', default=2000, type=int)
+    parser.add_argument('--cmaes_generations', default=10, type=int)
+    parser.add_argument('--ars_iters', default=2, type=int)
+    parser.add_argument('--ars_rollout_length', default=100, type=int)
+    parser.add_argument('--worker_output', default=None, help=argparse.SUPPRESS) # internal: run one (case, n) in this process
+    args = parser.parse_args()
+
+    if args.worker_output is not None:
+        records = run_worker(args.cases, int(args.ns), args.stages.split(','), args)
+        with open(args.worker_output, 'w') as f:
+            json.dump(records, f)
+    else:
+        main(args)
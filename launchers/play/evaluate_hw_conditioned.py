@@ -0,0 +1,126 @@
+"""Score hardware candidates with a hardware-conditioned controller, without retraining.
+
+A controller trained by ppo_opt_k_hw_conditioned.py / ppo_opt_l_hw_conditioned.py takes the hardware
+as part of its observation, so one training replaces the inner PPO run of every candidate of
+cmaes_ppo_opt_*: a candidate is scored by batched rollouts of the controller on the env with the
+candidate's hardware fixed (MassSpringEnv_Opt*_HwConditioned.set_hardware). All candidates of a
+batch and all their episodes are stepped in lockstep, one policy call per time step, and every
+candidate sees the same initial states (seeds seed, seed+1, ...).
+
+The fitness is the mean discounted return over --n_episodes episodes. Candidates are given in the
+search space of params.k_hw / params.l_hw (policies/hw_parameterization.py).
+
+Usage:
+    # score the given candidates, one per --hardware
+    python launchers/play/evaluate_hw_conditioned.py data/local/.../params.pkl --hardware 1.0,1.0,1.0,1.0,1.0
+    # search the hardware with CMA-ES (my_garage/algos/cmaes.py) or BO (my_garage/algos/bayes_opt.py) on the controller
+    python launchers/play/evaluate_hw_conditioned.py data/local/.../params.pkl --optimizer cmaes --max_evals 400
+"""
+import argparse
+import copy
+import json
+import time
+import numpy as np
+import os
+os.environ["CUDA_VISIBLE_DEVICES"]="-1"
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1' # only show warning and errors in TF
+import tensorflow as tf
+
+from launchers.play.evaluate_policy import evaluate_envs, load_snapshot
+from my_garage.algos.cmaes import make_cma_es
+from my_garage.algos.bayes_opt import BayesOpt
+
+
+class HwConditionedEvaluator:
+    '''
+    Fitness of hardware candidates under a hardware-conditioned controller.
+
+    Args:
+        env: MassSpringEnv_Opt*_HwConditioned (possibly wrapped in a TfEnv), from the snapshot
+        policy: the controller, a vectorized policy
+        n_episodes (int): episodes per candidate
+        seed (int): seed of the first episode, the same seeds for every candidate
+        max_path_length (int), discount (float), deterministic (bool): as evaluate_policy
+    '''
+    def __init__(self, env, policy, n_episodes=16, seed=0, max_path_length=1000, discount=0.99, deterministic=True):
+        self.env = env
+        self.policy = policy
+        self.seeds = list(range(seed, seed + n_episodes))
+        self.eval_kwargs = dict(max_path_length=max_path_length, discount=discount, deterministic=deterministic)
+        self.hw = env.k_hw if hasattr(env, 'k_hw') else env.l_hw
+        self.n_evals = 0
+
+
+    def __call__(self, candidates):
+        '''
+        candidates (M, hw.dim) -> (M,) mean discounted returns
+        '''
+        candidates = np.atleast_2d(np.asarray(candidates, dtype=np.float64))
+        envs = []
+        for hw in candidates:
+            env = copy.deepcopy(self.env)
+            env.set_hardware(hw)
+            envs.extend(copy.deepcopy(env) for _ in self.seeds)
+        result = evaluate_envs(envs, self.policy, self.seeds * len(candidates), **self.eval_kwargs)
+        self.n_evals += len(candidates)
+        return result['discounted_returns'].reshape(len(candidates), len(self.seeds)).mean(axis=1)
+
+
+def search_hardware(evaluator, optimizer='cmaes', max_evals=400, popsize=16, seed=0):
+    '''
+    Maximize the fitness of evaluator over the search space of the hardware, one batched evaluation per
+    generation (CMA-ES) or batch (BO). Returns (best hardware, its fitness).
+    '''
+    hw = evaluator.hw
+    if optimizer == 'cmaes':
+        assert hw.dim >= 2, 'cma needs at least 2 dimensions, use --optimizer bo'
+        options = {'popsize': popsize, 'bounds': [hw.lower.tolist(), hw.upper.tolist()], 'seed': seed + 1, 'verbose': -9, 'verb_log': 0}
+        es = make_cma_es(hw.center.tolist(), (hw.upper[0] - hw.lower[0]) / 4, options)
+        while evaluator.n_evals < max_evals and not es.stop():
+            candidates = es.ask()
+            es.tell(candidates, (-evaluator(candidates)).tolist())
+        return np.asarray(es.result.xbest), -float(es.result.fbest)
+    bo = BayesOpt(hw.lower, hw.upper, batch_size=popsize, n_init=popsize, seed=seed)
+    while bo.n_evals < max_evals:
+        candidates = bo.ask()
+        bo.tell(candidates, -evaluator(candidates))
+    return bo.best_x, -bo.best_f
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', type=str, help='snapshot (params.pkl) of ppo_opt_*_hw_conditioned')
+    parser.add_argument('--hardware', action='append', default=None, help='comma separated candidate in the search space of params.k_hw / l_hw, repeatable')
+    parser.add_argument('--optimizer', default='cmaes', choices=['cmaes', 'bo'], help='search the hardware if no --hardware is given')
+    parser.add_argument('--max_evals', type=int, default=400, help='candidates scored by the search')
+    parser.add_argument('--popsize', type=int, default=16, help='candidates per CMA-ES generation / BO batch')
+    parser.add_argument('--n_episodes', type=int, default=16, help='episodes per candidate')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max_path_length', type=int, default=1000, help='Max length of rollout')
+    parser.add_argument('--discount', type=float, default=0.99, help='discount for the discounted return')
+    parser.add_argument('--stochastic', help='sample the actions instead of using the mean', action='store_true')
+    parser.add_argument('--output', type=str, default=None, help='also write the json report to this file')
+    args = parser.parse_args()
+
+    with tf.compat.v1.Session():
+        env, policy = load_snapshot(args.file)
+        evaluator = HwConditionedEvaluator(env, policy, n_episodes=args.n_episodes, seed=args.seed, max_path_length=args.max_path_length,
+                                           discount=args.discount, deterministic=not args.stochastic)
+        t_start = time.time()
+        if args.hardware is not None:
+            candidates = np.array([[float(v) for v in hw.split(',')] for hw in args.hardware])
+            fitness = evaluator(candidates)
+            report = dict(candidates=candidates.tolist(), fitness=fitness.tolist())
+        else:
+            best_hw, best_fitness = search_hardware(evaluator, args.optimizer, args.max_evals, args.popsize, args.seed)
+            report = dict(optimizer=args.optimizer, best_hardware=best_hw.tolist(), best_elements=evaluator.hw.to_elements(best_hw).tolist(),
+                          best_fitness=best_fitness)
+        eval_time = time.time() - t_start
+
+    report.update(snapshot=os.path.abspath(args.file), n_episodes=args.n_episodes, n_evals=evaluator.n_evals,
+                  eval_time=eval_time, time_per_candidate=eval_time / max(evaluator.n_evals, 1))
+    report_json = json.dumps(report, indent=2)
+    print(report_json)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(report_json)
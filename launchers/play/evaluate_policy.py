@@ -0,0 +1,199 @@
+"""Headless, batched evaluation of a saved policy snapshot.
+
+The snapshot is loaded once, M seeded episodes are run side by side (one copy
+of the env per episode, one batched policy call per time step), optionally
+split over a pool of worker processes, and the return statistics plus the
+hardware parameters (k / l) reported by the policy are printed as json.
+Besides garage snapshots (params.pkl), policies exported with policies/export.py
+(.npz) are accepted; those run the numpy forward pass, without TF.
+
+Usage:
+    python launchers/play/evaluate_policy.py data/local/.../params.pkl --n_episodes 1000 --deterministic
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import multiprocessing
+import time
+import numpy as np
+import joblib
+import os
+os.environ["CUDA_VISIBLE_DEVICES"]="-1"
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1' # only show warning and errors in TF
+import tensorflow as tf
+
+from policies.export import load_numpy_policy, make_env
+
+
+HARDWARE_INFO_KEYS = ['k', 'k_sum', 'l'] # agent_infos keys with the hardware params, see policies/opt_*/policies.py
+
+
+def reset_seeded(env, seed):
+    '''
+    The envs draw their initial states from the global numpy RNG.
+    '''
+    np.random.seed(seed)
+    return env.reset()
+
+
+def evaluate_policy(env, policy, seeds, max_path_length=1000, deterministic=True, discount=0.99, quiet=True):
+    '''
+    Run one episode per seed, all episodes stepped in lockstep so that the policy is queried once per time step.
+
+    Args:
+        env: env from the snapshot, deep-copied once per episode
+        policy: a vectorized policy (get_actions on a batch of observations)
+        seeds (list[int]): one seed per episode (initial state and, if stochastic, action noise)
+        max_path_length (int): max episode length
+        deterministic (bool): use the mean action instead of sampling
+        discount (float): discount for the discounted return
+        quiet (bool): swallow the prints of the envs
+    Returns:
+        dict of per-episode numpy arrays: returns, discounted_returns, lengths, and one entry per hardware info key
+    '''
+    envs = [copy.deepcopy(env) for _ in range(len(seeds))]
+    return evaluate_envs(envs, policy, seeds, max_path_length=max_path_length, deterministic=deterministic, discount=discount, quiet=quiet)
+
+
+def evaluate_envs(envs, policy, seeds, max_path_length=1000, deterministic=True, discount=0.99, quiet=True):
+    '''
+    As evaluate_policy, one episode per env and seed, e.g. for envs that differ in their hardware.
+    '''
+    n_episodes = len(seeds)
+    assert len(envs) == n_episodes, 'one env per seed'
+    obs = np.array([reset_seeded(env_i, seed) for env_i, seed in zip(envs, seeds)], dtype=np.float64)
+    np.random.seed(seeds[0] if n_episodes > 0 else 0) # action noise in stochastic mode
+
+    returns = np.zeros(n_episodes)
+    discounted_returns = np.zeros(n_episodes)
+    lengths = np.zeros(n_episodes, dtype=np.int64)
+    alive = np.ones(n_episodes, dtype=bool)
+    hardware = {}
+
+    stdout = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.suppress()
+    with stdout:
+        for t in range(max_path_length):
+            idx = np.flatnonzero(alive)
+            if idx.size == 0:
+                break
+            actions, infos = policy.get_actions(obs[idx])
+            if deterministic:
+                actions = infos['mean']
+            if t == 0:
+                for key in HARDWARE_INFO_KEYS:
+                    if key in infos:
+                        hw = np.asarray(infos[key], dtype=np.float64).reshape(idx.size, -1)
+                        hardware[key] = hw[:, 0]
+            gamma_t = discount ** t
+            for j, i in enumerate(idx):
+                ob, reward, done, _ = envs[i].step(actions[j])
+                obs[i] = ob
+                returns[i] += reward
+                discounted_returns[i] += gamma_t * reward
+                lengths[i] += 1
+                if done:
+                    alive[i] = False
+
+    result = dict(returns=returns, discounted_returns=discounted_returns, lengths=lengths)
+    result.update(hardware)
+    return result
+
+
+def summarize(values):
+    values = np.asarray(values, dtype=np.float64)
+    return dict(mean=float(np.mean(values)),
+                std=float(np.std(values)),
+                min=float(np.min(values)),
+                median=float(np.median(values)),
+                max=float(np.max(values)))
+
+
+def load_snapshot(snapshot_file):
+    '''
+    Returns (env, policy) from a garage snapshot (needs a default TF session) or a policy export (.npz).
+    '''
+    if snapshot_file.endswith('.npz'):
+        policy = load_numpy_policy(snapshot_file)
+        return make_env(policy.config, tf_env=False), policy
+    data = joblib.load(snapshot_file)
+    return data['env'], data['algo'].policy
+
+
+_worker_data = None
+
+
+def _init_worker(snapshot_file):
+    global _worker_data
+    sess = tf.compat.v1.Session()
+    sess.__enter__() # keep the default session for the lifetime of the worker
+    _worker_data = load_snapshot(snapshot_file)
+
+
+def _evaluate_chunk(kwargs):
+    env, policy = _worker_data
+    return evaluate_policy(env, policy, **kwargs)
+
+
+def evaluate_snapshot(snapshot_file, n_episodes=1000, seed=0, n_workers=1, max_path_length=1000, deterministic=True, discount=0.99):
+    '''
+    Load a snapshot once (per worker) and evaluate it on n_episodes seeded episodes (seeds seed, seed+1, ...).
+    Returns a json-serializable report.
+    '''
+    seeds = list(range(seed, seed + n_episodes))
+    eval_kwargs = dict(max_path_length=max_path_length, deterministic=deterministic, discount=discount)
+    t_start = time.time()
+    if n_workers <= 1:
+        with tf.compat.v1.Session():
+            env, policy = load_snapshot(snapshot_file)
+            t_loaded = time.time()
+            results = [evaluate_policy(env, policy, seeds, **eval_kwargs)]
+    else:
+        chunks = [list(c) for c in np.array_split(seeds, n_workers) if len(c) > 0]
+        ctx = multiprocessing.get_context('spawn') # TF sessions do not survive fork
+        with ctx.Pool(len(chunks), initializer=_init_worker, initargs=(snapshot_file,)) as pool:
+            t_loaded = time.time()
+            results = pool.map(_evaluate_chunk, [dict(seeds=[int(s) for s in c], **eval_kwargs) for c in chunks])
+    t_end = time.time()
+
+    merged = {key: np.concatenate([r[key] for r in results]) for key in results[0]}
+    report = dict(snapshot=os.path.abspath(snapshot_file),
+                  n_episodes=n_episodes,
+                  seeds=[seed, seed + n_episodes - 1],
+                  deterministic=deterministic,
+                  max_path_length=max_path_length,
+                  discount=discount,
+                  average_return=summarize(merged['returns']),
+                  average_discounted_return=summarize(merged['discounted_returns']),
+                  average_length=float(np.mean(merged['lengths'])),
+                  hardware={key: summarize(merged[key]) for key in HARDWARE_INFO_KEYS if key in merged},
+                  load_time=t_loaded - t_start,
+                  eval_time=t_end - t_loaded)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', type=str, help='path to the snapshot file (params.pkl) or policy export (.npz)')
+    parser.add_argument('--n_episodes', type=int, default=1000, help='number of seeded episodes')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first episode, the others use seed+1, seed+2, ...')
+    parser.add_argument('--n_workers', type=int, default=1, help='number of worker processes (each loads the snapshot once)')
+    parser.add_argument('--max_path_length', type=int, default=1000, help='Max length of rollout')
+    parser.add_argument('--discount', type=float, default=0.99, help='discount for the discounted return')
+    parser.add_argument('--deterministic', help='use the mean action or stochastic action', action='store_true')
+    parser.add_argument('--output', type=str, default=None, help='also write the json report to this file')
+    args = parser.parse_args()
+
+    report = evaluate_snapshot(args.file,
+                               n_episodes=args.n_episodes,
+                               seed=args.seed,
+                               n_workers=args.n_workers,
+                               max_path_length=args.max_path_length,
+                               deterministic=args.deterministic,
+                               discount=args.discount)
+    report_json = json.dumps(report, indent=2)
+    print(report_json)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(report_json)
@@ -1,5 +1,6 @@
 """Simulates pre-learned policy."""
 import argparse
+import json
 import sys
 import numpy as np
 import joblib
@@ -8,7 +9,8 @@ os.environ["CUDA_VISIBLE_DEVICES"]="-1"
 import tensorflow as tf
 
 from garage.sampler.utils import rollout
-import matplotlib.pyplot as plt
+
+from launchers.play.evaluate_policy import evaluate_snapshot
 
 
 def query_yes_no(question, default='yes'):
@@ -53,8 +55,24 @@ if __name__ == '__main__':
                         help='Max length of rollout')
     parser.add_argument('--speedup', type=float, default=1, help='Speedup')
     parser.add_argument('--deterministic', help='use the mean action or stochastic action', action='store_true')
+    parser.add_argument('--headless', help='no animation/plots/prompt, evaluate n_episodes seeded episodes and print a json report', action='store_true')
+    parser.add_argument('--n_episodes', type=int, default=1000, help='number of seeded episodes in headless mode')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first episode in headless mode')
+    parser.add_argument('--n_workers', type=int, default=1, help='number of worker processes in headless mode')
     args = parser.parse_args()
     print(args)
+
+    if args.headless:
+        report = evaluate_snapshot(args.file,
+                                   n_episodes=args.n_episodes,
+                                   seed=args.seed,
+                                   n_workers=args.n_workers,
+                                   max_path_length=args.max_path_length,
+                                   deterministic=args.deterministic)
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+
+    import matplotlib.pyplot as plt
     # If the snapshot file use tensorflow, do:
     # import tensorflow as tf
     # with tf.compat.v1.Session():
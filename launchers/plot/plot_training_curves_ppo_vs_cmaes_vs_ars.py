@@ -1,9 +1,9 @@
-import glob
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib
 import argparse
+
+from launchers.utils.log_aggregation import LogAggregator
 # import shared_params.params_opt_k as params
 import shared_params.params_opt_l as params
 
@@ -17,6 +17,7 @@ if __name__=='__main__':
     parser.add_argument('cmaes_ppo_log_list', help='a list of cmaes+ppo log dirs, seperate by comma')
     parser.add_argument('cmaes_log_list', help='a list of cmaes log dirs, seperate by comma')
     parser.add_argument('ars_log_list', help='a list of ars log dirs, seperate by comma')
+    parser.add_argument('--no_cache', help='do not read or write the aggregation cache', action='store_true')
 
     args = parser.parse_args()
 
@@ -35,64 +36,41 @@ if __name__=='__main__':
 
     color_dict = matplotlib.colors.TABLEAU_COLORS
 
+    aggregator = LogAggregator(root='.', cache_dir=None if args.no_cache else '')
+
     for i, log_path in enumerate(ppo_log_list):
         color = list(color_dict.keys())[i]
-        csv_paths = glob.glob('**/'+log_path+'/**/*.csv', recursive=True)
-
-        ppo_avg_discounted_return = pd.DataFrame(columns = None)
-        for j, csv_path in enumerate(csv_paths):
-            csv_df = pd.read_csv(csv_path)
-            ppo_avg_discounted_return.insert(j, 'AverageDiscountedReturn{}'.format(j), csv_df['AverageDiscountedReturn'])
-
-        mean = ppo_avg_discounted_return.mean(numeric_only=True, axis=1)
+        result = aggregator.aggregate(log_path)
+        ppo_avg_discounted_return = result['curves'].T
+        mean = result['mean']
         plt.plot((np.array(range(ppo_avg_discounted_return.shape[0])) * ppo_batch_size)[::SKIP], ppo_avg_discounted_return[::SKIP], color, alpha=0.1)
         plt.plot((np.array(range(mean.shape[0])) * ppo_batch_size)[::SKIP], mean[::SKIP], color, alpha=1.0, label=legend[i])
-        del ppo_avg_discounted_return
     
     for k, log_path in enumerate(cmaes_ppo_log_list):
         color = list(color_dict.keys())[i+k+1]
-        csv_paths = glob.glob('**/'+log_path+'/**/*.csv', recursive=True)
-
-        cmaes_avg_discounted_return = pd.DataFrame(columns = None)
-        for j, csv_path in enumerate(csv_paths):
-            csv_df = pd.read_csv(csv_path)
-            cmaes_avg_discounted_return.insert(j, 'AverageDiscountedReturn{}'.format(j), csv_df['AverageDiscountedReturn'])
-
-        mean = cmaes_avg_discounted_return.mean(numeric_only=True, axis=1)
+        result = aggregator.aggregate(log_path)
+        cmaes_avg_discounted_return = result['curves'].T
+        mean = result['mean']
         plt.plot((np.array(range(cmaes_avg_discounted_return.shape[0])) * cmaes_ppo_batch_size), cmaes_avg_discounted_return, color, alpha=0.1)
         plt.plot((np.array(range(mean.shape[0])) * cmaes_ppo_batch_size), mean, color, alpha=1.0, label=legend[i+k+1])
 
-        del cmaes_avg_discounted_return
-
     for l, log_path in enumerate(cmaes_log_list):
         color = list(color_dict.keys())[i+k+l+2]
-        csv_paths = glob.glob('**/'+log_path+'/**/*.csv', recursive=True)
-
-        cmaes_avg_discounted_return = pd.DataFrame(columns = None)
-        for j, csv_path in enumerate(csv_paths):
-            csv_df = pd.read_csv(csv_path)
-            cmaes_avg_discounted_return.insert(j, 'AverageDiscountedReturn{}'.format(j), csv_df['AverageDiscountedReturn'])
-
-        mean = cmaes_avg_discounted_return.mean(numeric_only=True, axis=1)
+        result = aggregator.aggregate(log_path)
+        cmaes_avg_discounted_return = result['curves'].T
+        mean = result['mean']
         plt.plot((np.array(range(cmaes_avg_discounted_return.shape[0])) * cmaes_batch_size)[::SKIP], cmaes_avg_discounted_return[::SKIP], color, alpha=0.1)
         plt.plot((np.array(range(mean.shape[0])) * cmaes_batch_size)[::SKIP], mean[::SKIP], color, alpha=1.0, label=legend[i+k+l+2])
-        del cmaes_avg_discounted_return
 
 
     for m, log_path in enumerate(ars_log_list):
         color = list(color_dict.keys())[i+k+l+m+3]
-        csv_paths = glob.glob('**/'+log_path+'/**/*.csv', recursive=True)
-
-        ars_avg_discounted_return = pd.DataFrame(columns = None)
-        for j, csv_path in enumerate(csv_paths):
-            csv_df = pd.read_csv(csv_path)
-            ars_avg_discounted_return.insert(j, 'AverageDiscountedReturn{}'.format(j), csv_df['AverageDiscountedReturn'])
-
-        mean = ars_avg_discounted_return.mean(numeric_only=True, axis=1)
+        result = aggregator.aggregate(log_path)
+        ars_avg_discounted_return = result['curves'].T
+        mean = result['mean']
         plt.plot((np.array(range(ars_avg_discounted_return.shape[0])) * ars_batch_size), ars_avg_discounted_return, color, alpha=0.1)
         # import ipdb; ipdb.set_trace()
         plt.plot((np.array(range(mean.shape[0])) * ars_batch_size), mean, color, alpha=1.0, label=legend[i+k+l+m+3])
-        del ars_avg_discounted_return
 
 
     # plt.plot([1, 4e6], [-268.93, -268.93], color='k') # with optimal params under quasi-static assumption
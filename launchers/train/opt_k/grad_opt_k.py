@@ -0,0 +1,125 @@
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1' # only show warning and errors in TF
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1' # only use CPU
+import tensorflow as tf
+import numpy as np
+import pathlib
+import dateutil
+import dowel
+from dowel import logger, tabular
+from datetime import datetime
+import argparse
+
+from garage.tf.models.mlp_model import MLPModel
+
+from policies.opt_k.differentiable_rollout import DifferentiableRollout_OptK
+
+from launchers.utils.zip_project import zip_project
+from launchers.utils.run_catalog import record_run
+
+from shared_params import params_opt_k as params
+
+
+class DowelManager:
+    """
+        This is kinda wierd since this is actually handling global
+        resource. This is just a context manager to avoid mannually
+        catching the exception for handling dowel.
+    """
+
+    def __init__(self, exp_prefix='exp', log_dir='./data/local'):
+        log_dir = os.path.join(log_dir, exp_prefix)
+
+        now = datetime.now(dateutil.tz.tzlocal())
+        timestamp = now.strftime('%Y_%m_%d_%H_%M_%S_%f_%Z')
+        exp_name = '{}_{}'.format(exp_prefix, timestamp)
+
+        log_dir = os.path.join(log_dir, exp_name)
+
+        self.log_dir = log_dir
+        self.exp_name = exp_name
+        self.model_path = os.path.join(self.log_dir, 'models')
+        pathlib.Path(self.model_path).mkdir(parents=True, exist_ok=True)
+
+    def __enter__(self):
+        tabular_log_file = os.path.join(self.log_dir, 'progress.csv')
+        text_log_file = os.path.join(self.log_dir, 'debug.log')
+
+        logger.add_output(dowel.TextOutput(text_log_file))
+        logger.add_output(dowel.CsvOutput(tabular_log_file))
+        logger.add_output(dowel.TensorBoardOutput(self.log_dir))
+        logger.add_output(dowel.StdOutput())
+
+        logger.push_prefix('[%s] ' % self.exp_name)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        logger.remove_all()
+        logger.pop_prefix()
+
+
+def build_grad_opt(kwargs, n_steps=None):
+    '''
+    The differentiable rollout (n_steps actions, params.n_steps_per_episode by default) and the Adam step on
+    the hardware and the controller in the default graph, with all their variables initialized in the default session.
+    Returns the rollout and the train op.
+    '''
+    comp_policy_model = MLPModel(output_dim=1,
+        hidden_sizes=params.comp_policy_network_size,
+        hidden_nonlinearity=tf.nn.tanh,
+        output_nonlinearity=tf.nn.tanh,
+        )
+    rollout = DifferentiableRollout_OptK(params, comp_policy_model, n_steps=n_steps, discount=kwargs['discount'])
+    rollout.build() # initializes k_pre only
+
+    # gradient ascent on the average discounted return, hardware and controller jointly
+    optimizer = tf.compat.v1.train.AdamOptimizer(learning_rate=kwargs['learning_rate'])
+    train_vars = [rollout.k_pre] + rollout.controller_vars
+    train_op = optimizer.apply_gradients([(-g, v) for g, v in zip([rollout.grad_k_pre_ts] + rollout.grad_controller_ts, train_vars)])
+    tf.compat.v1.get_default_session().run(tf.compat.v1.variables_initializer(rollout.controller_vars + optimizer.variables()))
+    return rollout, train_op
+
+
+def run_grad_opt(exp_prefix, seed):
+    np.random.seed(seed)
+    tf.compat.v1.set_random_seed(seed)
+    kwargs = params.grad_opt_kwargs
+
+    with tf.compat.v1.Session() as sess:
+        rollout, train_op = build_grad_opt(kwargs)
+
+        with DowelManager(exp_prefix=exp_prefix) as manager:
+            zip_project(log_dir=manager.log_dir)
+            for i in range(kwargs['n_iters']):
+                y1_init, v1_init = rollout.sample_initial_states(kwargs['batch_size'])
+                feed_dict = {rollout.y1_init: y1_init, rollout.v1_init: v1_init}
+                avg_return, avg_discounted_return, k_sum, grad_k_pre, _ = sess.run([rollout.average_return_ts,
+                    rollout.average_discounted_return_ts, rollout.k_sum_ts, rollout.grad_k_pre_ts, train_op], feed_dict=feed_dict)
+                with logger.prefix(' | Iteration {} |'.format(i)):
+                    tabular.record('Iteration', i)
+                    tabular.record('AverageReturn', avg_return)
+                    tabular.record('AverageDiscountedReturn', avg_discounted_return)
+                    tabular.record('Env/k', k_sum)
+                    tabular.record('GradNormKPre', np.linalg.norm(grad_k_pre))
+                    logger.log(tabular)
+                    logger.dump_all(i)
+                    tabular.clear()
+
+            k_pre, k = sess.run([rollout.k_pre, rollout.k_ts])
+            np.savez(os.path.join(manager.model_path, 'hardware_and_controller.npz'),
+                k_pre=k_pre, k=k, **{v.name: value for v, value in zip(rollout.controller_vars, sess.run(rollout.controller_vars))})
+
+        record_run(manager.log_dir, launcher='grad_opt_k', params=params, seed=seed)
+
+
+if __name__ == '__main__':
+
+    now = datetime.now()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', default=int(now.timestamp()), type=int, help='seed')
+    parser.add_argument('--exp_id', default=now.strftime("%Y_%m_%d_%H_%M_%S"), help='experiment id (suffix to data directory name)')
+
+    args = parser.parse_args()
+
+    run_grad_opt(exp_prefix='grad_opt_k_{}_'.format(args.exp_id) + str(params.n_springs)+'_params', seed = args.seed)
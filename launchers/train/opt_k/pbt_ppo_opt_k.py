@@ -0,0 +1,53 @@
+import os
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1' # as run_experiment(force_cpu=True)
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1' # only show warning and errors in TF
+import importlib
+
+from my_garage.experiment.pbt import PBTMember, PopulationBasedTraining
+
+from shared_params import params_opt_k as params
+
+from launchers.utils.zip_project import zip_project
+from launchers.utils.run_catalog import record_run
+
+from datetime import datetime
+import argparse
+
+# PBT of one of the co-design launchers, whose build_task(runner, algo_kwargs) builds a member
+LAUNCHERS = dict(hw_as_action='launchers.train.opt_k.ppo_opt_k_hw_as_action',
+                 hw_as_policy='launchers.train.opt_k.ppo_opt_k_hw_as_policy',
+                 hw_in_policy_and_action='launchers.train.opt_k.ppo_opt_k_hw_in_policy_and_action')
+
+
+if __name__=='__main__':
+
+    now = datetime.now()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', default=int(now.timestamp()), type=int, help='seed of member 0, member i has seed + i')
+    parser.add_argument('--exp_id', default=now.strftime("%Y_%m_%d_%H_%M_%S"), help='experiment id (suffix to data directory name)')
+    parser.add_argument('--launcher', default='hw_as_action', choices=sorted(LAUNCHERS), help='the co-design setup of the members')
+    parser.add_argument('--n_members', default=params.pbt_options['n_members'], type=int, help='members (seeds) of the population')
+    parser.add_argument('--interval', default=params.pbt_options['interval'], type=int, help='epochs between two exploit / explore steps')
+    parser.add_argument('--n_rounds', default=params.pbt_options['n_rounds'], type=int, help='rounds of interval epochs')
+    parser.add_argument('--no_exploit', action='store_true', help='train the members independently, the seed sweep with the same budget')
+    args = parser.parse_args()
+
+    launcher = importlib.import_module(LAUNCHERS[args.launcher])
+    exp_prefix = 'pbt_ppo_opt_k_{0}_{1}_{2}_params/seed_{3}'.format(args.launcher, args.exp_id, params.n_springs, args.seed)
+    log_root = os.path.join(os.environ['PROJECTDIR'], 'data/local', exp_prefix.replace('_', '-'))
+
+    members = [PBTMember(launcher.build_task, os.path.join(log_root, 'member_{}'.format(idx)), args.seed + idx, params.ppo_algo_kwargs, hw_var_name='k_pre')
+               for idx in range(args.n_members)]
+    pbt = PopulationBasedTraining(members, args.interval, quantile=params.pbt_options['quantile'], hw_perturb_std=params.pbt_options['hw_perturb_std'],
+        explore_keys=params.pbt_options['explore_keys'], perturb_factors=params.pbt_options['perturb_factors'], exploit=not args.no_exploit, seed=args.seed)
+    pbt.run(args.n_rounds, batch_size=params.ppo_train_kwargs['batch_size'], callback=lambda pbt: pbt.save(os.path.join(log_root, 'pbt.json')))
+    print('PBT best member {} (seed {}), fitness {} after {} epochs'.format(pbt.best_member, members[pbt.best_member].seed,
+        members[pbt.best_member].fitness, members[pbt.best_member].epoch))
+    pbt.close()
+
+    for member in members:
+        record_run(member.log_dir, launcher='pbt_ppo_opt_k_{}'.format(args.launcher), params=params, seed=member.seed,
+                   extra=dict(pbt=os.path.join(log_root, 'pbt.json'), exploit=not args.no_exploit, algo_kwargs=member.algo_kwargs))
+
+    zip_project(log_dir=log_root)
@@ -7,6 +7,7 @@ import numpy as np
 
 from garage.envs import normalize
 from garage.experiment import run_experiment
+from garage.experiment import deterministic
 from garage.tf.algos.ppo import PPO
 from garage.tf.baselines import GaussianMLPBaseline
 from garage.np.baselines import LinearFeatureBaseline
@@ -22,53 +23,61 @@ from policies.opt_k.policies import CompMechPolicy_OptK_HwAsPolicy
 from shared_params import params_opt_k as params
 
 from launchers.utils.zip_project import zip_project
+from launchers.utils.run_catalog import record_run
 
 from datetime import datetime
 import sys
 import argparse
 
 
-def run_task(snapshot_config, *_):
-    """Run task."""
-    with LocalTFRunner(snapshot_config=snapshot_config) as runner:
+def build_task(runner, algo_kwargs=None):
+    """Build the env, policy, baseline and PPO (algo_kwargs, params.ppo_algo_kwargs by default) and set up runner."""
+    env = TfEnv(MassSpringEnv_OptK_HwAsPolicy(params))
 
-        zip_project(log_dir=runner._snapshotter._snapshot_dir)
+    comp_policy_model = MLPModel(output_dim=1, 
+        hidden_sizes=params.comp_policy_network_size, 
+        hidden_nonlinearity=tf.nn.tanh,
+        output_nonlinearity=tf.nn.tanh)
 
-        env = TfEnv(MassSpringEnv_OptK_HwAsPolicy(params))
+    mech_policy_model = MechPolicyModel_OptK_HwAsPolicy(params)
 
-        comp_policy_model = MLPModel(output_dim=1, 
-            hidden_sizes=params.comp_policy_network_size, 
-            hidden_nonlinearity=tf.nn.tanh,
-            output_nonlinearity=tf.nn.tanh)
+    policy = CompMechPolicy_OptK_HwAsPolicy(name='comp_mech_policy', 
+            env_spec=env.spec, 
+            comp_policy_model=comp_policy_model, 
+            mech_policy_model=mech_policy_model)
 
-        mech_policy_model = MechPolicyModel_OptK_HwAsPolicy(params)
+    # baseline = GaussianMLPBaseline(
+    #     env_spec=env.spec,
+    #     regressor_args=dict(
+    #         hidden_sizes=params.baseline_network_size,
+    #         hidden_nonlinearity=tf.nn.tanh,
+    #         use_trust_region=True,
+    #     ),
+    # )
+    baseline = LinearFeatureBaseline(env_spec=env.spec)
 
-        policy = CompMechPolicy_OptK_HwAsPolicy(name='comp_mech_policy', 
-                env_spec=env.spec, 
-                comp_policy_model=comp_policy_model, 
-                mech_policy_model=mech_policy_model)
+    algo = PPO(
+        env_spec=env.spec,
+        policy=policy,
+        baseline=baseline,
+        **(algo_kwargs or params.ppo_algo_kwargs)
+    )
 
-        # baseline = GaussianMLPBaseline(
-        #     env_spec=env.spec,
-        #     regressor_args=dict(
-        #         hidden_sizes=params.baseline_network_size,
-        #         hidden_nonlinearity=tf.nn.tanh,
-        #         use_trust_region=True,
-        #     ),
-        # )
-        baseline = LinearFeatureBaseline(env_spec=env.spec)
+    runner.setup(algo, env)
 
-        algo = PPO(
-            env_spec=env.spec,
-            policy=policy,
-            baseline=baseline,
-            **params.ppo_algo_kwargs
-        )
 
-        runner.setup(algo, env)
+def run_task(snapshot_config, *_):
+    """Run task."""
+    with LocalTFRunner(snapshot_config=snapshot_config) as runner:
+
+        zip_project(log_dir=runner._snapshotter._snapshot_dir)
+
+        build_task(runner)
 
         runner.train(**params.ppo_train_kwargs)
 
+        record_run(runner._snapshotter._snapshot_dir, launcher='ppo_opt_k_hw_as_policy', params=params, seed=deterministic.get_seed())
+
     
 if __name__=='__main__':
     now = datetime.now()
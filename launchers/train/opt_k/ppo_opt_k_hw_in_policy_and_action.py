@@ -7,6 +7,7 @@ import numpy as np
 
 from garage.envs import normalize
 from garage.experiment import run_experiment
+from garage.experiment import deterministic
 from garage.tf.algos.ppo import PPO
 from garage.tf.baselines import GaussianMLPBaseline
 from garage.np.baselines import LinearFeatureBaseline
@@ -21,48 +22,56 @@ from policies.opt_k.policies import CompMechPolicy_OptK_HwInPolicyAndAction
 
 from shared_params import params_opt_k as params
 from launchers.utils.zip_project import zip_project
+from launchers.utils.run_catalog import record_run
 
 from datetime import datetime
 import sys
 import argparse
 
 
-def run_task(snapshot_config, *_):
-    """Run task."""
-    with LocalTFRunner(snapshot_config=snapshot_config) as runner:
+def build_task(runner, algo_kwargs=None):
+    """Build the env, policy, baseline and PPO (algo_kwargs, params.ppo_algo_kwargs by default) and set up runner."""
+    env = TfEnv(MassSpringEnv_OptK_HwAsAction(params))
 
-        zip_project(log_dir=runner._snapshotter._snapshot_dir)
+    comp_mech_policy_model = CompMechPolicyModel_OptK_HwInPolicyAndAction(params)
+
+    policy = CompMechPolicy_OptK_HwInPolicyAndAction(name='comp_mech_policy', 
+            env_spec=env.spec, 
+            comp_mech_policy_model=comp_mech_policy_model)
+
+    # baseline = GaussianMLPBaseline(
+    #     env_spec=env.spec,
+    #     regressor_args=dict(
+    #         hidden_sizes=params.baseline_network_size,
+    #         hidden_nonlinearity=tf.nn.tanh,
+    #         use_trust_region=True,
+    #     ),
+    # )
 
-        env = TfEnv(MassSpringEnv_OptK_HwAsAction(params))
+    baseline = LinearFeatureBaseline(env_spec=env.spec)
 
-        comp_mech_policy_model = CompMechPolicyModel_OptK_HwInPolicyAndAction(params)
+    algo = PPO(
+        env_spec=env.spec,
+        policy=policy,
+        baseline=baseline,
+        **(algo_kwargs or params.ppo_algo_kwargs)
+    )
 
-        policy = CompMechPolicy_OptK_HwInPolicyAndAction(name='comp_mech_policy', 
-                env_spec=env.spec, 
-                comp_mech_policy_model=comp_mech_policy_model)
+    runner.setup(algo, env)
 
-        # baseline = GaussianMLPBaseline(
-        #     env_spec=env.spec,
-        #     regressor_args=dict(
-        #         hidden_sizes=params.baseline_network_size,
-        #         hidden_nonlinearity=tf.nn.tanh,
-        #         use_trust_region=True,
-        #     ),
-        # )
-        
-        baseline = LinearFeatureBaseline(env_spec=env.spec)
 
-        algo = PPO(
-            env_spec=env.spec,
-            policy=policy,
-            baseline=baseline,
-            **params.ppo_algo_kwargs
-        )
+def run_task(snapshot_config, *_):
+    """Run task."""
+    with LocalTFRunner(snapshot_config=snapshot_config) as runner:
 
-        runner.setup(algo, env)
+        zip_project(log_dir=runner._snapshotter._snapshot_dir)
+
+        build_task(runner)
 
         runner.train(**params.ppo_train_kwargs)
 
+        record_run(runner._snapshotter._snapshot_dir, launcher='ppo_opt_k_hw_in_policy_and_action', params=params, seed=deterministic.get_seed())
+
     
 if __name__=='__main__':
 
@@ -15,12 +15,14 @@ from garage.tf.envs import TfEnv
 from garage.tf.models.mlp_model import MLPModel
 
 from my_garage.algos.ars import ARS
+from my_garage.algos.ars_distributed import DistributedARS, run_ars_worker, spawn_local_nodes, parse_address, get_authkey
 
 from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwAsAction
 from policies.opt_l.models import MechPolicyModel_OptL_HwAsAction
 from policies.opt_l.policies import CompMechPolicy_OptL_HwAsAction
 
 # from launchers.utils.zip_project import zip_project
+from launchers.utils.run_catalog import record_run
 
 from shared_params import params_opt_l as params
 
@@ -63,7 +65,9 @@ class DowelManager:
         logger.pop_prefix()
 
 
-def run_ars(exp_prefix, seed):
+def run_ars(exp_prefix, seed, resume=None, address=None, n_local_nodes=0, worker=False, ars_kwargs=None):
+    # ars_kwargs override params.ars_kwargs (the launcher flags), the workers of a coordinator get them with the tasks
+    ars_kwargs = dict(params.ars_kwargs, **(ars_kwargs or {}))
     env = TfEnv(MassSpringEnv_OptL_HwAsAction(params))
 
     with tf.compat.v1.Session() as sess:
@@ -76,17 +80,50 @@ def run_ars(exp_prefix, seed):
         policy = CompMechPolicy_OptL_HwAsAction(name='comp_mech_policy', 
                 env_spec=env.spec, 
                 comp_policy_model=comp_policy_model, 
-                mech_policy_model=mech_policy_model)
-
-        ars = ARS(env_name=None,
-                env=env,
-                policy_params=None,
-                policy=policy,
-                seed = seed,
-                **params.ars_kwargs)
+                mech_policy_model=mech_policy_model,
+                hw_sampling=params.hw_sampling)
+
+        if worker: # rollouts for a coordinator, see my_garage/algos/ars_distributed.py
+            run_ars_worker(parse_address(address), get_authkey(), env, policy)
+            return
+
+        nodes = []
+        if address is None:
+            ars = ARS(env_name=None,
+                    env=env,
+                    policy_params=None,
+                    policy=policy,
+                    seed = seed,
+                    **ars_kwargs)
+        else:
+            authkey = get_authkey(generate=n_local_nodes > 0)
+            ars = DistributedARS(address=parse_address(address), 
+                    authkey=authkey, 
+                    task_timeout=params.ars_task_timeout, 
+                    min_nodes=max(1, n_local_nodes), 
+                    env_name=None,
+                    env=env,
+                    policy_params=None,
+                    policy=policy,
+                    seed = seed,
+                    **ars_kwargs)
+            nodes = spawn_local_nodes(os.path.abspath(__file__), n_local_nodes, parse_address(address), authkey)
+        if resume is not None:
+            ars.load_checkpoint(resume)
         
-        with DowelManager(exp_prefix=exp_prefix) as manager:    
-            ars.train(params.ars_n_iter, dump=True)
+        try:
+            with DowelManager(exp_prefix=exp_prefix) as manager:    
+                ars.train(params.ars_n_iter, dump=True, 
+                    checkpoint_path=os.path.join(manager.model_path, 'ars_checkpoint.pkl'), 
+                    checkpoint_interval=params.ars_checkpoint_interval)
+        finally:
+            if address is not None:
+                ars.close()
+            for node in nodes:
+                node.wait(timeout=60)
+
+        record_run(manager.log_dir, launcher='ars_opt_l_hw_as_action', params=params, seed=seed, 
+            extra=dict(ars_kwargs=ars_kwargs, **({} if resume is None else dict(resumed_from=resume))))
 
 
 if __name__ == '__main__':
@@ -96,7 +133,16 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--seed', default=int(now.timestamp()), type=int, help='seed')
     parser.add_argument('--exp_id', default=now.strftime("%Y_%m_%d_%H_%M_%S"), help='experiment id (suffix to data directory name)')
+    parser.add_argument('--resume', default=None, help='ars_checkpoint.pkl (in models/ of an earlier run) to continue training from')
+    parser.add_argument('--ars_address', default=None, help='host:port of the multi-node ARS coordinator (listen address, or where --ars_worker connects to)')
+    parser.add_argument('--ars_nodes', default=0, type=int, help='number of local worker processes the coordinator starts as stand-in nodes')
+    parser.add_argument('--ars_worker', action='store_true', help='run as a rollout worker of the coordinator at --ars_address, secret in HWASP_ARS_AUTHKEY')
+    parser.add_argument('--ars_filter', default=params.ars_kwargs['observation_filter'], choices=['NoFilter', 'MeanStdFilter'], help='observation filter (MeanStdFilter for ARS V2)')
+    parser.add_argument('--ars_perturbed_params', default=params.ars_kwargs['perturbed_params'], nargs='+', help='regexes of the perturbed policy variables, e.g. kernel bias l_pre (default: all)')
+    parser.add_argument('--ars_deterministic', action='store_true', default=params.ars_kwargs['deterministic'], help='rollouts with the mean action instead of sampling')
 
     args = parser.parse_args()
 
-    run_ars(exp_prefix='ars_opt_l_hw_as_action_{}_'.format(args.exp_id) + str(params.n_segments)+'_params', seed = args.seed)
+    run_ars(exp_prefix='ars_opt_l_hw_as_action_{}_'.format(args.exp_id) + str(params.n_segments)+'_params', seed = args.seed, resume = args.resume, 
+        address = args.ars_address, n_local_nodes = args.ars_nodes, worker = args.ars_worker, 
+        ars_kwargs = dict(observation_filter=args.ars_filter, perturbed_params=args.ars_perturbed_params, deterministic=args.ars_deterministic))
@@ -7,7 +7,8 @@ import numpy as np
 
 from garage.envs import normalize
 from garage.experiment import run_experiment
-from garage.np.algos import CMAES
+from garage.experiment import deterministic
+from my_garage.algos.cmaes import CMAES, CMAES_VARIANTS
 from garage.tf.baselines import GaussianMLPBaseline
 from garage.np.baselines import LinearFeatureBaseline
 from garage.sampler import OnPolicyVectorizedSampler
@@ -23,14 +24,17 @@ from policies.opt_l.policies import CompMechPolicy_OptL_HwAsAction
 from shared_params import params_opt_l as params
 
 from launchers.utils.zip_project import zip_project
+from launchers.utils.run_catalog import record_run
 from launchers.utils.normalized_env import normalize
 
 from datetime import datetime
 import sys
 import argparse
 
-def run_task(snapshot_config, *_):
+def run_task(snapshot_config, variant_data, *_):
     """Run task."""
+    # the flags reach the run_experiment subprocess through variant_data, not params of the parent
+    cmaes_algo_kwargs = dict(params.cmaes_algo_kwargs, variant=variant_data['cmaes_variant'])
     with LocalTFRunner(snapshot_config=snapshot_config) as runner:
         # env = TfEnv(normalize(MassSpringEnv_OptL_HwAsAction(params), normalize_action=False, normalize_obs=False, normalize_reward=True, reward_alpha=0.1))
         env = TfEnv(MassSpringEnv_OptL_HwAsAction(params))
@@ -61,12 +65,14 @@ def run_task(snapshot_config, *_):
         
         baseline = LinearFeatureBaseline(env_spec=env.spec)
 
-        algo = CMAES(env_spec=env.spec, policy=policy, baseline=baseline, **params.cmaes_algo_kwargs)
+        algo = CMAES(env_spec=env.spec, policy=policy, baseline=baseline, **cmaes_algo_kwargs)
 
         runner.setup(algo, env)
 
         runner.train(**params.cmaes_train_kwargs)
 
+        record_run(runner._snapshotter._snapshot_dir, launcher='cmaes_opt_l_hw_as_action', params=params, seed=deterministic.get_seed(), extra=variant_data)
+
     
 if __name__=='__main__':
 
@@ -76,6 +82,7 @@ if __name__=='__main__':
     parser.add_argument('--seed', default=int(now.timestamp()), type=int, help='seed')
     parser.add_argument('--exp_id', default=now.strftime("%Y_%m_%d_%H_%M_%S"), help='experiment id (suffix to data directory name)')
 
+    parser.add_argument('--cmaes_variant', default=params.cmaes_algo_kwargs['variant'], choices=CMAES_VARIANTS, help='full or separable (diagonal, O(n)) CMA-ES, see my_garage/algos/cmaes.py')
     args = parser.parse_args()
 
-    run_experiment(run_task, exp_prefix='cmaes_opt_l_hw_as_action_{}_'.format(args.exp_id) + str(params.n_segments)+'_params', snapshot_mode='last', seed=args.seed, force_cpu=True)
\ No newline at end of file
+    run_experiment(run_task, exp_prefix='cmaes_opt_l_hw_as_action_{}_'.format(args.exp_id) + str(params.n_segments)+'_params', snapshot_mode='last', seed=args.seed, force_cpu=True, variant=dict(cmaes_variant=args.cmaes_variant))
\ No newline at end of file
@@ -4,11 +4,10 @@ import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1' # only show warning and errors in TF
 import tensorflow as tf
 import numpy as np
-import pandas as pd
 
 from garage.envs import normalize
 from garage.experiment import run_experiment
-from garage.tf.algos.ppo import PPO
+from garage.experiment import deterministic
 from garage.tf.baselines import GaussianMLPBaseline
 from garage.np.baselines import LinearFeatureBaseline
 
@@ -16,7 +15,10 @@ from garage.tf.envs import TfEnv
 from garage.tf.experiment import LocalTFRunner
 from garage.tf.models.mlp_model import MLPModel
 
-import cma
+from my_garage.algos.cmaes import make_cma_es, CMAES_VARIANTS
+from my_garage.algos.bayes_opt import BayesOpt
+from my_garage.experiment.persistent_trainer import PersistentInnerTrainer
+from policies.lqr import LQRFitness
 
 from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwAsAction
 from policies.opt_l.models import MechPolicyModel_OptL_FixedHW
@@ -24,79 +26,106 @@ from policies.opt_l.policies import CompMechPolicy_OptL_HwAsAction
 
 from shared_params import params_opt_l as params
 
+from my_garage.algos.broadcast_ppo import BroadcastInfosPPO
+from my_garage.samplers.broadcast_infos_sampler import BroadcastInfosSampler
+
 from launchers.utils.zip_project import zip_project
+from launchers.utils.run_catalog import record_run, RunCatalog, summarize_progress
 from launchers.utils.normalized_env import normalize
 
 from datetime import datetime
 import sys
 import argparse
+import itertools
 
-global l_pre_init
+def build_inner_task(runner):
+    """Build the env, policy, baseline and PPO of an inner training and set up runner."""
+    # env = TfEnv(normalize(MassSpringEnv_OptL_HwAsAction(params), normalize_action=False, normalize_obs=False, normalize_reward=True, reward_alpha=0.1))
+    env = TfEnv(MassSpringEnv_OptL_HwAsAction(params))
 
-def run_task(snapshot_config, *_):
-    """Run task."""
-    global l_pre_init
-    params.l_pre_init = l_pre_init
+    # zip_project(log_dir=runner._snapshotter._snapshot_dir)
 
-    with LocalTFRunner(snapshot_config=snapshot_config) as runner:
-        # env = TfEnv(normalize(MassSpringEnv_OptL_HwAsAction(params), normalize_action=False, normalize_obs=False, normalize_reward=True, reward_alpha=0.1))
-        env = TfEnv(MassSpringEnv_OptL_HwAsAction(params))
-
-        # zip_project(log_dir=runner._snapshotter._snapshot_dir)
-
-        comp_policy_model = MLPModel(output_dim=1, 
-            hidden_sizes=params.comp_policy_network_size, 
-            hidden_nonlinearity=tf.nn.tanh,
-            output_nonlinearity=tf.nn.tanh,
-            )
-        
-        mech_policy_model = MechPolicyModel_OptL_FixedHW(params)
-
-        policy = CompMechPolicy_OptL_HwAsAction( # reused policy of HWasAction
-            name='comp_mech_policy', 
-            env_spec=env.spec, 
-            comp_policy_model=comp_policy_model, 
-            mech_policy_model=mech_policy_model)
-
-        # baseline = GaussianMLPBaseline(
-        #     env_spec=env.spec,
-        #     regressor_args=dict(
-        #         hidden_sizes=params.baseline_network_size,
-        #         hidden_nonlinearity=tf.nn.tanh,
-        #         use_trust_region=True,
-        #     ),
-        # )
-        
-        baseline = LinearFeatureBaseline(env_spec=env.spec)
-        
-        algo = PPO(
-            env_spec=env.spec,
-            policy=policy,
-            baseline=baseline,
-            **params.ppo_algo_kwargs
+    comp_policy_model = MLPModel(output_dim=1, 
+        hidden_sizes=params.comp_policy_network_size, 
+        hidden_nonlinearity=tf.nn.tanh,
+        output_nonlinearity=tf.nn.tanh,
         )
+    
+    mech_policy_model = MechPolicyModel_OptL_FixedHW(params)
+
+    policy = CompMechPolicy_OptL_HwAsAction( # reused policy of HWasAction
+        name='comp_mech_policy', 
+        env_spec=env.spec, 
+        comp_policy_model=comp_policy_model, 
+        mech_policy_model=mech_policy_model)
+
+    # baseline = GaussianMLPBaseline(
+    #     env_spec=env.spec,
+    #     regressor_args=dict(
+    #         hidden_sizes=params.baseline_network_size,
+    #         hidden_nonlinearity=tf.nn.tanh,
+    #         use_trust_region=True,
+    #     ),
+    # )
+    
+    baseline = LinearFeatureBaseline(env_spec=env.spec)
+    
+    algo = BroadcastInfosPPO(
+        env_spec=env.spec,
+        policy=policy,
+        baseline=baseline,
+        **params.ppo_algo_kwargs
+    )
+
+    runner.setup(algo, env, sampler_cls=BroadcastInfosSampler)
+
+
+def run_task(snapshot_config, variant_data, *_):
+    """Run task."""
+
+    params.l_pre_init = np.asarray(variant_data['l_pre_init']) # passed per run, the inner runs of a BO batch are launched concurrently
 
-        runner.setup(algo, env)
+    with LocalTFRunner(snapshot_config=snapshot_config) as runner:
+        build_inner_task(runner)
 
         runner.train(**params.ppo_inner_train_kwargs)
 
+        record_inner_run(runner._snapshotter._snapshot_dir, deterministic.get_seed(), variant_data)
+
     tf.compat.v1.reset_default_graph()
 
 
+def record_inner_run(log_dir, seed, variant_data):
+    record_run(log_dir, launcher='cmaes_ppo_opt_l', params=params, seed=seed,
+        window_size=params.ppo_inner_final_average_discounted_return_window_size,
+        extra=variant_data)
+
+
 
-def cmaes_obj_fcn(l_init, exp_prefix):
-    global l_pre_init
-    l_pre_init = params.inv_sigmoid(l_init, params.l_lb, params.l_ub)
+def cmaes_obj_fcn(l_init, exp_prefix, candidate_id=None):
+    l_pre_init = params.inv_sigmoid(np.asarray(l_init), params.l_hw.lower, params.l_hw.upper) # l_init is in the search space of params.l_hw
 
     now = datetime.now()
     exp_name = now.strftime("%Y_%m_%d_%H_%M_%S")
+    if candidate_id is not None: # candidates of a batch start within the same second
+        exp_name += '_{}'.format(candidate_id)
 
-    run_experiment(run_task, exp_prefix=exp_prefix, exp_name=exp_name, snapshot_mode='last', seed=args.seed, force_cpu=True)
+    log_dir = os.path.join(os.environ['PROJECTDIR'], 'data/local', exp_prefix.replace('_', '-'), exp_name)
+    variant = dict(l_pre_init=l_pre_init.tolist(), outer_optimizer=args.outer_optimizer, inner_trainer=args.inner_trainer)
+    if inner_trainer is None:
+        run_experiment(run_task, exp_prefix=exp_prefix, exp_name=exp_name, snapshot_mode='last', seed=args.seed, force_cpu=True, variant=variant)
+    else: # in this process, in the graph of the first candidate
+        params.l_pre_init = l_pre_init
+        inner_trainer.train(log_dir, l_pre_init, **params.ppo_inner_train_kwargs)
+        record_inner_run(log_dir, args.seed, variant)
 
-    csv_path = os.path.join(os.environ['PROJECTDIR'], 'data/local', exp_prefix.replace('_', '-'), exp_name, 'progress.csv')
-    csv_df = pd.read_csv(csv_path)
-    final_avg_discounted_return = np.mean(csv_df['AverageDiscountedReturn'][-params.ppo_inner_final_average_discounted_return_window_size:])
-    return -final_avg_discounted_return
+    with RunCatalog() as catalog: # the inner run records its final return (averaged over the last iterations) when it finishes
+        run = catalog.get(log_dir)
+    if run is None: # not recorded (e.g. the subprocess failed before record_run), read the progress.csv
+        run = summarize_progress(os.path.join(log_dir, 'progress.csv'))
+    if run['final_avg_discounted_return'] is None:
+        raise RuntimeError('the inner run in {} recorded no return, see its debug.log'.format(log_dir))
+    return -run['final_avg_discounted_return']
 
 
 
@@ -108,20 +137,50 @@ if __name__=='__main__':
     parser.add_argument('--seed', default=int(now.timestamp()), type=int, help='seed')
     parser.add_argument('--exp_id', default=now.strftime("%Y_%m_%d_%H_%M_%S"), help='experiment id (suffix to data directory name)')
 
+    parser.add_argument('--cmaes_variant', default=params.cmaes_variant, choices=CMAES_VARIANTS, help='full or separable (diagonal, O(n)) CMA-ES for the hardware, see my_garage/algos/cmaes.py')
+    parser.add_argument('--outer_optimizer', default=params.outer_optimizer, choices=['cmaes', 'bo'], help='CMA-ES or Bayesian optimization (my_garage/algos/bayes_opt.py) for the hardware')
+    parser.add_argument('--bo_batch_size', default=params.bo_options['batch_size'], type=int, help='candidates per BO batch, their inner trainings run in parallel')
+    parser.add_argument('--inner_trainer', default=params.inner_trainer, choices=['persistent', 'subprocess'], help='one TF graph for all inner trainings (my_garage/experiment/persistent_trainer.py) or a run_experiment subprocess per candidate')
+    parser.add_argument('--cmaes_x0', default='center', choices=['center', 'lqr'], help='CMA-ES starts at the center of the search space or at the best hardware of the LQR fitness (policies/lqr.py)')
     args = parser.parse_args()
 
     exp_prefix='cmaes_ppo_opt_l_{0}_{1}_params/seed_{2}'.format(args.exp_id, params.n_segments, args.seed)
 
-    # CMA-ES global optimization
-    options = params.cmaes_options
-    options['seed'] = args.seed
-    options['verb_filenameprefix'] = os.path.join(os.environ['PROJECTDIR'], 'data/local', exp_prefix.replace('_', '-'), '-')
-    x0 = params.cmaes_x0
-    sigma0 = params.cmaes_sigma0
-
-    es = cma.CMAEvolutionStrategy(x0, sigma0, options)
-    es.optimize(cmaes_obj_fcn, args=[exp_prefix])
-    es.result_pretty()
-
-    zip_project(log_dir=os.path.join(os.environ['PROJECTDIR'], 'data/local', exp_prefix.replace('_', '-')))
+    inner_trainer = None
+    if args.inner_trainer == 'persistent':
+        os.environ['CUDA_VISIBLE_DEVICES'] = '-1' # as run_experiment(force_cpu=True)
+        inner_trainer = PersistentInnerTrainer(build_inner_task, hw_var_name='l_pre', seed=args.seed)
+
+    log_root = os.path.join(os.environ['PROJECTDIR'], 'data/local', exp_prefix.replace('_', '-'))
+
+    if args.outer_optimizer == 'bo':
+        # Bayesian optimization, batches of bo_batch_size inner trainings in parallel subprocesses
+        bo = BayesOpt(params.l_hw.lower, params.l_hw.upper, batch_size=args.bo_batch_size, n_init=params.bo_options['n_init'], seed=args.seed)
+        candidate_ids = itertools.count()
+        bo.optimize(lambda x: cmaes_obj_fcn(x, exp_prefix, next(candidate_ids)), max_evals=params.bo_options['max_evals'],
+            n_workers=1 if inner_trainer is not None else None, # the persistent trainer runs the batch one by one
+            callback=lambda bo: bo.save(os.path.join(log_root, 'bo.json')))
+        print('BO best hardware {} (search space of params.l_hw), fitness {} after {} inner trainings'.format(bo.best_x.tolist(), bo.best_f, bo.n_evals))
+    else:
+        # CMA-ES global optimization
+        options = params.cmaes_options
+        options['seed'] = args.seed
+        options['verb_filenameprefix'] = os.path.join(log_root, '-')
+        x0 = params.cmaes_x0
+        sigma0 = params.cmaes_sigma0
+        if args.cmaes_x0 == 'lqr':
+            # model-based warm start, a few seconds for the whole grid
+            lqr_hw, lqr_fitness = LQRFitness(params, n_episodes=params.lqr_options['n_episodes'], seed=args.seed,
+                discount=params.ppo_algo_kwargs['discount']).search(params.lqr_options['n_candidates'])
+            print('LQR best hardware {} (search space of params.l_hw), fitness {}'.format(lqr_hw.tolist(), lqr_fitness))
+            x0 = lqr_hw.tolist()
+
+        es = make_cma_es(x0, sigma0, options, variant=args.cmaes_variant)
+        es.optimize(cmaes_obj_fcn, args=[exp_prefix])
+        es.result_pretty()
+
+    if inner_trainer is not None:
+        inner_trainer.close()
+
+    zip_project(log_dir=log_root)
 
@@ -7,7 +7,7 @@ import numpy as np
 
 from garage.envs import normalize
 from garage.experiment import run_experiment
-from garage.tf.algos.ppo import PPO
+from garage.experiment import deterministic
 from garage.tf.baselines import GaussianMLPBaseline
 from garage.np.baselines import LinearFeatureBaseline
 
@@ -21,56 +21,73 @@ from policies.opt_l.policies import CompMechPolicy_OptL_HwAsAction
 
 from shared_params import params_opt_l as params
 
+from my_garage.algos.broadcast_ppo import BroadcastInfosPPO
+from my_garage.samplers.broadcast_infos_sampler import BroadcastInfosSampler
+
 from launchers.utils.zip_project import zip_project
+from launchers.utils.run_catalog import record_run
 from launchers.utils.normalized_env import normalize
 
 from datetime import datetime
 import sys
 import argparse
 
+def build_task(runner, algo_kwargs=None):
+    """Build the env, policy, baseline and PPO (algo_kwargs, params.ppo_algo_kwargs by default) and set up runner."""
+    # env = TfEnv(normalize(MassSpringEnv_OptL_HwAsAction(params), normalize_action=False, normalize_obs=False, normalize_reward=True, reward_alpha=0.1))
+    env = TfEnv(MassSpringEnv_OptL_HwAsAction(params))
+
+    comp_policy_model = MLPModel(output_dim=1, 
+        hidden_sizes=params.comp_policy_network_size, 
+        hidden_nonlinearity=tf.nn.tanh,
+        output_nonlinearity=tf.nn.tanh,
+        )
+
+    mech_policy_model = MechPolicyModel_OptL_HwAsAction(params)
+
+    policy = CompMechPolicy_OptL_HwAsAction(name='comp_mech_policy', 
+            env_spec=env.spec, 
+            comp_policy_model=comp_policy_model, 
+            mech_policy_model=mech_policy_model,
+            hw_sampling=params.hw_sampling)
+
+    # baseline = GaussianMLPBaseline(
+    #     env_spec=env.spec,
+    #     regressor_args=dict(
+    #         hidden_sizes=params.baseline_network_size,
+    #         hidden_nonlinearity=tf.nn.tanh,
+    #         use_trust_region=True,
+    #     ),
+    # )
+
+    baseline = LinearFeatureBaseline(env_spec=env.spec)
+
+    algo_kwargs = dict(algo_kwargs or params.ppo_algo_kwargs)
+    if params.hw_sampling == 'per_episode':
+        algo_kwargs['gae_lambda'] = 1.0 # the hardware is weighted by the advantage of the first step, for the force too (more variance), see policies/episode_hardware.py
+
+    algo = BroadcastInfosPPO(
+        env_spec=env.spec,
+        policy=policy,
+        baseline=baseline,
+        **algo_kwargs
+    )
+
+    runner.setup(algo, env, sampler_cls=BroadcastInfosSampler)
+
+
 def run_task(snapshot_config, *_):
     """Run task."""
     with LocalTFRunner(snapshot_config=snapshot_config) as runner:
-        # env = TfEnv(normalize(MassSpringEnv_OptL_HwAsAction(params), normalize_action=False, normalize_obs=False, normalize_reward=True, reward_alpha=0.1))
-        env = TfEnv(MassSpringEnv_OptL_HwAsAction(params))
 
         zip_project(log_dir=runner._snapshotter._snapshot_dir)
 
-        comp_policy_model = MLPModel(output_dim=1, 
-            hidden_sizes=params.comp_policy_network_size, 
-            hidden_nonlinearity=tf.nn.tanh,
-            output_nonlinearity=tf.nn.tanh,
-            )
-
-        mech_policy_model = MechPolicyModel_OptL_HwAsAction(params)
-
-        policy = CompMechPolicy_OptL_HwAsAction(name='comp_mech_policy', 
-                env_spec=env.spec, 
-                comp_policy_model=comp_policy_model, 
-                mech_policy_model=mech_policy_model)
-
-        # baseline = GaussianMLPBaseline(
-        #     env_spec=env.spec,
-        #     regressor_args=dict(
-        #         hidden_sizes=params.baseline_network_size,
-        #         hidden_nonlinearity=tf.nn.tanh,
-        #         use_trust_region=True,
-        #     ),
-        # )
-        
-        baseline = LinearFeatureBaseline(env_spec=env.spec)
-
-        algo = PPO(
-            env_spec=env.spec,
-            policy=policy,
-            baseline=baseline,
-            **params.ppo_algo_kwargs
-        )
-
-        runner.setup(algo, env)
+        build_task(runner)
 
         runner.train(**params.ppo_train_kwargs)
 
+        record_run(runner._snapshotter._snapshot_dir, launcher='ppo_opt_l_hw_as_action', params=params, seed=deterministic.get_seed())
+
     
 if __name__=='__main__':
 
@@ -0,0 +1,76 @@
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1' # only show warning and errors in TF
+
+from garage.experiment import run_experiment
+from garage.experiment import deterministic
+
+from garage.tf.envs import TfEnv
+from garage.tf.experiment import LocalTFRunner
+
+from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwAsAction_Population
+from policies.opt_l.models import CompMechPolicyModel_OptL_HwAsAction_Population
+from policies.opt_l.policies import CompMechPolicy_OptL_HwAsAction_Population
+
+from shared_params import params_opt_l as params
+
+from my_garage.algos.population_ppo import PopulationPPO, PopulationBaseline
+from my_garage.samplers.batched_vectorized_sampler import BatchedOnPolicyVectorizedSampler
+
+from launchers.utils.zip_project import zip_project
+from launchers.utils.run_catalog import record_run
+
+from datetime import datetime
+import argparse
+
+
+def run_task(snapshot_config, variant_data, *_):
+    """Run task."""
+    n_members = variant_data['n_members']
+    n_envs_per_member = variant_data['n_envs_per_member']
+
+    with LocalTFRunner(snapshot_config=snapshot_config) as runner:
+
+        zip_project(log_dir=runner._snapshotter._snapshot_dir)
+
+        env = TfEnv(MassSpringEnv_OptL_HwAsAction_Population(params, n_members, n_envs_per_member))
+
+        comp_mech_policy_model = CompMechPolicyModel_OptL_HwAsAction_Population(params, n_members)
+
+        policy = CompMechPolicy_OptL_HwAsAction_Population(name='comp_mech_policy',
+                env_spec=env.spec,
+                comp_mech_policy_model=comp_mech_policy_model)
+
+        baseline = PopulationBaseline(env_spec=env.spec, n_members=n_members)
+
+        algo = PopulationPPO(
+            env_spec=env.spec,
+            policy=policy,
+            baseline=baseline,
+            hw_info_key='l',
+            **params.ppo_algo_kwargs
+        )
+
+        # one batched env for the rollouts of all members, n_envs_per_member systems each
+        runner.setup(algo, env, sampler_cls=BatchedOnPolicyVectorizedSampler,
+            sampler_args=dict(batched_env=MassSpringEnv_OptL_HwAsAction_Population(params, n_members, n_envs_per_member)))
+
+        # the batch of every member as in ppo_opt_l_hw_as_action
+        train_kwargs = dict(params.ppo_train_kwargs, batch_size=n_members * params.ppo_train_kwargs['batch_size'])
+        runner.train(**train_kwargs)
+
+        record_run(runner._snapshotter._snapshot_dir, launcher='ppo_opt_l_hw_as_action_population', params=params, seed=deterministic.get_seed(),
+            extra=dict(variant_data, member_average_returns=algo.member_average_returns.tolist()))
+
+
+if __name__=='__main__':
+    now = datetime.now()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', default=int(now.timestamp()), type=int, help='seed')
+    parser.add_argument('--exp_id', default=now.strftime("%Y_%m_%d_%H_%M_%S"), help='experiment id (suffix to data directory name)')
+    parser.add_argument('--n_members', default=params.ppo_population_kwargs['n_members'], type=int, help='independent policies and hardware trained in lockstep')
+    parser.add_argument('--n_envs_per_member', default=params.ppo_population_kwargs['n_envs_per_member'], type=int, help='parallel rollouts per member')
+
+    args = parser.parse_args()
+    variant = dict(n_members=args.n_members, n_envs_per_member=args.n_envs_per_member)
+
+    run_experiment(run_task, exp_prefix='ppo_opt_l_hw_as_action_population_{}_{}_params'.format(args.exp_id, params.n_segments), snapshot_mode='last', seed=args.seed, force_cpu=True, variant=variant)
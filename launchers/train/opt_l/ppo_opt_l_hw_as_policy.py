@@ -7,6 +7,7 @@ import numpy as np
 
 from garage.envs import normalize
 from garage.experiment import run_experiment
+from garage.experiment import deterministic
 from garage.tf.algos.ppo import PPO
 from garage.tf.baselines import GaussianMLPBaseline
 from garage.np.baselines import LinearFeatureBaseline
@@ -16,66 +17,99 @@ from garage.tf.experiment import LocalTFRunner
 from garage.tf.models.mlp_model import MLPModel
 
 from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwAsPolicy
+from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwAsPolicy_Batched
+from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwAsPolicy_SubstepCoupling
+from my_garage.samplers.batched_vectorized_sampler import BatchedOnPolicyVectorizedSampler
 from policies.opt_l.models import MechPolicyModel_OptL_HwAsPolicy
+from policies.opt_l.models import MechPolicyModel_OptL_HwAsPolicy_SubstepCoupling
 from policies.opt_l.policies import CompMechPolicy_OptL_HwAsPolicy
 
 from shared_params import params_opt_l as params
 
 from launchers.utils.zip_project import zip_project
+from launchers.utils.run_catalog import record_run
 
 from datetime import datetime
 import sys
 import argparse
 
+n_batched_envs = 0 # set from the command line, the defaults for build_task when imported (e.g. by pbt_ppo_opt_l.py)
+substep_coupling = False
 
-def run_task(snapshot_config, *_):
-    """Run task."""
-    with LocalTFRunner(snapshot_config=snapshot_config) as runner:
-
-        zip_project(log_dir=runner._snapshotter._snapshot_dir)
 
+def build_task(runner, algo_kwargs=None):
+    """Build the env, policy, baseline and PPO (algo_kwargs, params.ppo_algo_kwargs by default) and set up runner."""
+    if substep_coupling:
+        env = TfEnv(MassSpringEnv_OptL_HwAsPolicy_SubstepCoupling(params))
+    else:
         env = TfEnv(MassSpringEnv_OptL_HwAsPolicy(params))
 
-        comp_policy_model = MLPModel(output_dim=1, 
-            hidden_sizes=params.comp_policy_network_size, 
-            hidden_nonlinearity=tf.nn.tanh,
-            output_nonlinearity=tf.nn.tanh)
+    comp_policy_model = MLPModel(output_dim=1, 
+        hidden_sizes=params.comp_policy_network_size, 
+        hidden_nonlinearity=tf.nn.tanh,
+        output_nonlinearity=tf.nn.tanh)
 
+    if substep_coupling:
+        mech_policy_model = MechPolicyModel_OptL_HwAsPolicy_SubstepCoupling(params)
+    else:
         mech_policy_model = MechPolicyModel_OptL_HwAsPolicy(params)
 
-        policy = CompMechPolicy_OptL_HwAsPolicy(name='comp_mech_policy', 
-                env_spec=env.spec, 
-                comp_policy_model=comp_policy_model, 
-                mech_policy_model=mech_policy_model)
-
-        # baseline = GaussianMLPBaseline(
-        #     env_spec=env.spec,
-        #     regressor_args=dict(
-        #         hidden_sizes=params.baseline_network_size,
-        #         hidden_nonlinearity=tf.nn.tanh,
-        #         use_trust_region=True,
-        #     ),
-        # )
-        baseline = LinearFeatureBaseline(env_spec=env.spec)
-
-        algo = PPO(
-            env_spec=env.spec,
-            policy=policy,
-            baseline=baseline,
-            **params.ppo_algo_kwargs
-        )
-
+    policy = CompMechPolicy_OptL_HwAsPolicy(name='comp_mech_policy', 
+            env_spec=env.spec, 
+            comp_policy_model=comp_policy_model, 
+            mech_policy_model=mech_policy_model)
+
+    # baseline = GaussianMLPBaseline(
+    #     env_spec=env.spec,
+    #     regressor_args=dict(
+    #         hidden_sizes=params.baseline_network_size,
+    #         hidden_nonlinearity=tf.nn.tanh,
+    #         use_trust_region=True,
+    #     ),
+    # )
+    baseline = LinearFeatureBaseline(env_spec=env.spec)
+
+    algo = PPO(
+        env_spec=env.spec,
+        policy=policy,
+        baseline=baseline,
+        **(algo_kwargs or params.ppo_algo_kwargs)
+    )
+
+    if n_batched_envs > 0:
+        # one batched env for all parallel rollouts instead of n_envs env copies
+        runner.setup(algo, env, sampler_cls=BatchedOnPolicyVectorizedSampler, 
+            sampler_args=dict(batched_env=MassSpringEnv_OptL_HwAsPolicy_Batched(params, n_batched_envs)))
+    else:
         runner.setup(algo, env)
 
+
+def run_task(snapshot_config, *_):
+    """Run task."""
+    with LocalTFRunner(snapshot_config=snapshot_config) as runner:
+
+        zip_project(log_dir=runner._snapshotter._snapshot_dir)
+
+        build_task(runner)
+
         runner.train(**params.ppo_train_kwargs)
 
+        record_run(runner._snapshotter._snapshot_dir, launcher='ppo_opt_l_hw_as_policy', params=params, seed=deterministic.get_seed(),
+            extra=dict(substep_coupling=substep_coupling, interface_integrator=params.interface_integrator) if substep_coupling else None)
+
     
 if __name__=='__main__':
     now = datetime.now()
     parser = argparse.ArgumentParser()
     parser.add_argument('--seed', default=int(now.timestamp()), type=int, help='seed')
     parser.add_argument('--exp_id', default=now.strftime("%Y_%m_%d_%H_%M_%S"), help='experiment id (suffix to data directory name)')
+    parser.add_argument('--n_batched_envs', default=0, type=int, help='sample with one batched env of this many systems (0: garage default sampler)')
+    parser.add_argument('--substep_coupling', action='store_true', help='the policy emits l and the env evaluates the interface force every substep')
 
     args = parser.parse_args()
+    n_batched_envs = args.n_batched_envs
+    substep_coupling = args.substep_coupling
+    assert not (substep_coupling and n_batched_envs > 0), 'the batched env does not support the substep coupling'
+    mode = 'hw_as_policy_substep_coupling' if substep_coupling else 'hw_as_policy'
 
-    run_experiment(run_task, exp_prefix='ppo_opt_l_hw_as_policy_{}_{}_params'.format(args.exp_id, params.n_segments), snapshot_mode='last', seed=args.seed, force_cpu=True)
\ No newline at end of file
+    run_experiment(run_task, exp_prefix='ppo_opt_l_{}_{}_{}_params'.format(mode, args.exp_id, params.n_segments), snapshot_mode='last', seed=args.seed, force_cpu=True)
\ No newline at end of file
@@ -0,0 +1,67 @@
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1' # only show warning and errors in TF
+
+from garage.experiment import run_experiment
+from garage.experiment import deterministic
+from garage.tf.algos.ppo import PPO
+from garage.np.baselines import LinearFeatureBaseline
+
+from garage.tf.envs import TfEnv
+from garage.tf.experiment import LocalTFRunner
+
+from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwConditioned
+from policies.opt_l.models import CompPolicyModel_OptL_HwConditioned
+from policies.opt_l.policies import CompPolicy_OptL_HwConditioned
+
+from shared_params import params_opt_l as params
+
+from launchers.utils.zip_project import zip_project
+from launchers.utils.run_catalog import record_run
+
+from datetime import datetime
+import argparse
+
+
+# One controller for all hardware in the search space of params.l_hw, the hardware is drawn at every
+# reset and observed by the controller. Score hardware candidates with it, without retraining:
+#     python launchers/play/evaluate_hw_conditioned.py data/local/.../params.pkl --optimizer cmaes
+
+def run_task(snapshot_config, *_):
+    """Run task."""
+    with LocalTFRunner(snapshot_config=snapshot_config) as runner:
+
+        zip_project(log_dir=runner._snapshotter._snapshot_dir)
+
+        env = TfEnv(MassSpringEnv_OptL_HwConditioned(params))
+
+        comp_policy_model = CompPolicyModel_OptL_HwConditioned(params)
+
+        policy = CompPolicy_OptL_HwConditioned(name='comp_policy',
+                env_spec=env.spec,
+                comp_policy_model=comp_policy_model)
+
+        baseline = LinearFeatureBaseline(env_spec=env.spec)
+
+        algo = PPO(
+            env_spec=env.spec,
+            policy=policy,
+            baseline=baseline,
+            **params.ppo_algo_kwargs
+        )
+
+        runner.setup(algo, env)
+
+        runner.train(**params.ppo_hw_conditioned_train_kwargs)
+
+        record_run(runner._snapshotter._snapshot_dir, launcher='ppo_opt_l_hw_conditioned', params=params, seed=deterministic.get_seed())
+
+
+if __name__=='__main__':
+    now = datetime.now()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', default=int(now.timestamp()), type=int, help='seed')
+    parser.add_argument('--exp_id', default=now.strftime("%Y_%m_%d_%H_%M_%S"), help='experiment id (suffix to data directory name)')
+
+    args = parser.parse_args()
+
+    run_experiment(run_task, exp_prefix='ppo_opt_l_hw_conditioned_{}_{}_params'.format(args.exp_id, params.n_segments), snapshot_mode='last', seed=args.seed, force_cpu=True)
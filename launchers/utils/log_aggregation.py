@@ -0,0 +1,152 @@
+'''
+Aggregation of garage/dowel training logs (progress.csv) across seeds.
+
+The run directories under the search root are indexed once, only the requested
+column is parsed from each csv (in parallel), and the per-seed curves are
+stacked into a (n_runs, n_iters) array so that the mean/std/quantile bands are
+plain vectorized numpy reductions. The aggregated result is cached on disk,
+keyed by the paths, sizes and mtimes of the csv files, so replotting the same
+logs does not touch the csv files again.
+'''
+
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_COLUMN = 'AverageDiscountedReturn'
+DEFAULT_QUANTILES = (0.25, 0.75)
+CACHE_DIR_NAME = '.log_aggregation_cache'
+
+
+def index_csv_paths(root='.', csv_name='progress.csv'):
+    '''
+    Walk root once and return the sorted list of all log csv files below it.
+    '''
+    csv_paths = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = [d for d in dir_names if d != CACHE_DIR_NAME and d != '__pycache__']
+        if csv_name in file_names:
+            csv_paths.append(os.path.join(dir_path, csv_name))
+    csv_paths.sort()
+    return csv_paths
+
+
+def select_csv_paths(csv_index, log_path):
+    '''
+    Pick the csv files that live (at any depth) under a directory named log_path,
+    the same selection as glob.glob('**/'+log_path+'/**/*.csv', recursive=True)
+    '''
+    log_parts = tuple(p for p in os.path.normpath(log_path).split(os.sep) if p not in ('', '.'))
+    n = len(log_parts)
+    selected = []
+    for csv_path in csv_index:
+        dir_parts = os.path.normpath(os.path.dirname(csv_path)).split(os.sep)
+        if any(tuple(dir_parts[i:i + n]) == log_parts for i in range(len(dir_parts) - n + 1)):
+            selected.append(csv_path)
+    return selected
+
+
+def read_column(csv_path, column=DEFAULT_COLUMN):
+    '''
+    Read a single column of a csv log as a float64 array.
+    '''
+    csv_df = pd.read_csv(csv_path, usecols=[column], dtype={column: np.float64}, engine='c')
+    return csv_df[column].to_numpy()
+
+
+def stack_curves(curves):
+    '''
+    Stack 1D curves of possibly different lengths into a (n_runs, max_len) array, padded with nan.
+    '''
+    max_len = max((len(c) for c in curves), default=0)
+    stacked = np.full((len(curves), max_len), np.nan)
+    for i, c in enumerate(curves):
+        stacked[i, :len(c)] = c
+    return stacked
+
+
+def compute_bands(curves, quantiles=DEFAULT_QUANTILES):
+    '''
+    Mean, std and quantiles over runs (axis 0), ignoring the nan padding.
+    '''
+    quantiles = np.asarray(quantiles, dtype=np.float64)
+    if curves.size == 0:
+        empty = np.zeros(curves.shape[1:])
+        return dict(mean=empty, std=empty, quantiles=np.zeros((quantiles.size,) + curves.shape[1:]), quantile_levels=quantiles)
+    return dict(mean=np.nanmean(curves, axis=0),
+                std=np.nanstd(curves, axis=0),
+                quantiles=np.nanquantile(curves, quantiles, axis=0),
+                quantile_levels=quantiles)
+
+
+def _cache_key(csv_paths, column, quantiles):
+    digest = hashlib.sha1()
+    digest.update(column.encode('utf-8'))
+    digest.update(np.asarray(quantiles, dtype=np.float64).tobytes())
+    for csv_path in csv_paths:
+        stat = os.stat(csv_path)
+        digest.update('{}|{}|{}\n'.format(os.path.abspath(csv_path), stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class LogAggregator:
+    '''
+    Index the logs under root once and aggregate one column per log dir.
+
+    Args:
+        root (str): directory to search for log csv files (the plot scripts use the current dir)
+        cache_dir (str): where the aggregated results are cached, None to disable caching
+        max_workers (int): number of threads used to parse csv files
+    '''
+    def __init__(self, root='.', cache_dir='', max_workers=None):
+        self.root = root
+        if cache_dir == '':
+            cache_dir = os.path.join(root, CACHE_DIR_NAME)
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.csv_index = index_csv_paths(root)
+
+
+    def read_curves(self, csv_paths, column=DEFAULT_COLUMN):
+        if len(csv_paths) <= 1:
+            return [read_column(p, column) for p in csv_paths]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(csv_paths))) as executor:
+            return list(executor.map(lambda p: read_column(p, column), csv_paths))
+
+
+    def aggregate(self, log_path, column=DEFAULT_COLUMN, quantiles=DEFAULT_QUANTILES):
+        '''
+        Returns:
+            dict with keys
+            - csv_paths (list[str]): the csv files used, one per run
+            - curves (numpy.ndarray): (n_runs, n_iters), nan-padded
+            - mean, std (numpy.ndarray): (n_iters,)
+            - quantiles (numpy.ndarray): (n_quantiles, n_iters)
+            - quantile_levels (numpy.ndarray): (n_quantiles,)
+        '''
+        csv_paths = select_csv_paths(self.csv_index, log_path)
+
+        cache_path = None
+        if self.cache_dir is not None:
+            cache_path = os.path.join(self.cache_dir, _cache_key(csv_paths, column, quantiles) + '.npz')
+            if os.path.isfile(cache_path):
+                with np.load(cache_path) as cached:
+                    result = {key: cached[key] for key in cached.files}
+                result['csv_paths'] = [str(p) for p in result['csv_paths']]
+                return result
+
+        curves = stack_curves(self.read_curves(csv_paths, column))
+        result = compute_bands(curves, quantiles)
+        result['curves'] = curves
+        result['csv_paths'] = csv_paths
+
+        if cache_path is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = cache_path + '.tmp.npz'
+            np.savez(tmp_path, **{key: (np.asarray(val, dtype=str) if key == 'csv_paths' else val) for key, val in result.items()})
+            os.replace(tmp_path, cache_path)
+        return result
@@ -0,0 +1,324 @@
+'''
+Experiment catalog: a small SQLite index of the training runs under data/local.
+
+Each training launcher records its run when training finishes (launcher, case,
+mode, algo, seed, hash of the params module, log dir and final metrics), so
+plotting, comparison and the CMA-ES fitness lookup can query the catalog
+instead of globbing the file system. Runs created before the catalog existed
+can be back-filled from the log directory names with the "index" command.
+
+Usage:
+    python launchers/utils/run_catalog.py index [--root data/local]
+    python launchers/utils/run_catalog.py query --case opt_k --algo ppo --order_by final_avg_discounted_return
+    python launchers/utils/run_catalog.py best --case opt_l --mode hw_as_policy
+'''
+
+import os
+import re
+import json
+import time
+import types
+import hashlib
+import sqlite3
+import argparse
+
+import numpy as np
+
+from launchers.utils.log_aggregation import index_csv_paths, read_column
+
+
+if 'PROJECTDIR' in os.environ:
+    PROJECTDIR = os.environ['PROJECTDIR']
+else:
+    PROJECTDIR = os.getcwd()
+
+DEFAULT_LOG_ROOT = os.path.join(PROJECTDIR, 'data', 'local')
+DEFAULT_CATALOG_PATH = os.path.join(DEFAULT_LOG_ROOT, 'run_catalog.sqlite')
+
+COLUMNS = [
+    ('path', 'TEXT PRIMARY KEY'),
+    ('launcher', 'TEXT'),
+    ('algo', 'TEXT'),
+    ('case_name', 'TEXT'),
+    ('mode', 'TEXT'),
+    ('exp_id', 'TEXT'),
+    ('seed', 'INTEGER'),
+    ('n_hw', 'INTEGER'),
+    ('params_hash', 'TEXT'),
+    ('n_iters', 'INTEGER'),
+    ('final_avg_discounted_return', 'REAL'),
+    ('last_avg_discounted_return', 'REAL'),
+    ('max_avg_discounted_return', 'REAL'),
+    ('final_avg_return', 'REAL'),
+    ('extra', 'TEXT'),
+    ('progress_mtime', 'REAL'),
+    ('finished_at', 'REAL'),
+]
+COLUMN_NAMES = [name for name, _ in COLUMNS]
+
+# {algo}_{case}[_{mode}]_{exp_id}[_{n_hw}_params], with "_" or "-" as separator (garage replaces "_" by "-" in dir names)
+_SEP = '[_-]'
+_LAUNCHER_PATTERN = re.compile(
+    r'(?P<algo>cmaes{0}ppo|pbt{0}ppo|cmaes|ppo|ars|grad){0}opt{0}(?P<case>[kl])'
+    r'(?:{0}(?P<mode>hw{0}as{0}action{0}population|hw{0}as{0}action|hw{0}as{0}policy|hw{0}in{0}policy{0}and{0}action|hw{0}conditioned))?'.format(_SEP))
+_EXP_ID_PATTERN = re.compile(r'(?P<exp_id>\d{{4}}(?:{0}\d{{2}}){{5}})(?:{0}(?P<n_hw>\d+){0}params)?'.format(_SEP))
+_SEED_PATTERN = re.compile(r'seed{0}(?P<seed>\d+)'.format(_SEP))
+
+
+def parse_run_name(name):
+    '''
+    Parse launcher, algo, case, mode, exp_id, n_hw and seed (whatever is available) from a launcher
+    name or a log path that follows the exp_prefix naming convention of the launchers, e.g.
+    data/local/ppo-opt-k-hw-as-policy-2020-01-01-00-00-00-50-params/...
+    '''
+    info = dict(launcher=None, algo=None, case_name=None, mode=None, exp_id=None, n_hw=None, seed=None)
+    match = _LAUNCHER_PATTERN.search(name)
+    if match is None:
+        return info
+    info['algo'] = match.group('algo').replace('-', '_')
+    info['case_name'] = 'opt_' + match.group('case')
+    if match.group('mode') is not None:
+        info['mode'] = match.group('mode').replace('-', '_')
+    info['launcher'] = '_'.join(p for p in [info['algo'], info['case_name'], info['mode']] if p is not None)
+
+    rest = name[match.end():]
+    match = _EXP_ID_PATTERN.search(rest)
+    if match is not None:
+        info['exp_id'] = match.group('exp_id').replace('-', '_')
+        if match.group('n_hw') is not None:
+            info['n_hw'] = int(match.group('n_hw'))
+    match = _SEED_PATTERN.search(rest)
+    if match is not None:
+        info['seed'] = int(match.group('seed'))
+    return info
+
+
+def params_hash(params):
+    '''
+    Stable hash of the public, plain-data attributes of a shared_params module.
+    '''
+    items = {}
+    for key in sorted(vars(params)):
+        val = getattr(params, key)
+        if key.startswith('_') or isinstance(val, (types.ModuleType, types.FunctionType, type)):
+            continue
+        if isinstance(val, np.ndarray):
+            val = val.tolist()
+        items[key] = val
+    blob = json.dumps(items, sort_keys=True, default=repr)
+    return hashlib.sha1(blob.encode('utf-8')).hexdigest()[:16]
+
+
+def summarize_progress(csv_path, window_size=10):
+    '''
+    Final metrics of one run from its progress.csv.
+    '''
+    summary = dict(n_iters=0, final_avg_discounted_return=None, last_avg_discounted_return=None,
+                   max_avg_discounted_return=None, final_avg_return=None, progress_mtime=None)
+    if not os.path.isfile(csv_path):
+        return summary
+    summary['progress_mtime'] = os.path.getmtime(csv_path)
+    try:
+        returns = read_column(csv_path, 'AverageDiscountedReturn')
+    except (ValueError, KeyError):
+        return summary
+    returns = returns[~np.isnan(returns)]
+    summary['n_iters'] = int(returns.size)
+    if returns.size > 0:
+        summary['final_avg_discounted_return'] = float(np.mean(returns[-window_size:]))
+        summary['last_avg_discounted_return'] = float(returns[-1])
+        summary['max_avg_discounted_return'] = float(np.max(returns))
+    try:
+        avg_returns = read_column(csv_path, 'AverageReturn')
+        avg_returns = avg_returns[~np.isnan(avg_returns)]
+        if avg_returns.size > 0:
+            summary['final_avg_return'] = float(np.mean(avg_returns[-window_size:]))
+    except (ValueError, KeyError):
+        pass
+    return summary
+
+
+class RunCatalog:
+    '''
+    SQLite-backed catalog of training runs.
+
+    Args:
+        catalog_path (str): the sqlite file, created on first use
+    '''
+    def __init__(self, catalog_path=DEFAULT_CATALOG_PATH):
+        self.catalog_path = catalog_path
+        catalog_dir = os.path.dirname(os.path.abspath(catalog_path))
+        os.makedirs(catalog_dir, exist_ok=True)
+        self._conn = sqlite3.connect(catalog_path, timeout=60.0) # several launchers may write concurrently
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS runs ({})'.format(', '.join('{} {}'.format(n, t) for n, t in COLUMNS)))
+            self._conn.execute('CREATE INDEX IF NOT EXISTS runs_by_kind ON runs (case_name, mode, algo)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS runs_by_exp ON runs (exp_id, seed)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS runs_by_params ON runs (params_hash)')
+
+
+    def close(self):
+        self._conn.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+    def upsert(self, row):
+        row = {name: row.get(name) for name in COLUMN_NAMES}
+        row['path'] = os.path.abspath(row['path'])
+        if isinstance(row['extra'], dict):
+            row['extra'] = json.dumps(row['extra'], sort_keys=True, default=repr)
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO runs ({}) VALUES ({})'.format(', '.join(COLUMN_NAMES), ', '.join('?' * len(COLUMN_NAMES))),
+                [row[name] for name in COLUMN_NAMES])
+
+
+    def get(self, path):
+        cursor = self._conn.execute('SELECT * FROM runs WHERE path = ?', [os.path.abspath(path)])
+        row = cursor.fetchone()
+        return None if row is None else dict(row)
+
+
+    def query(self, order_by=None, descending=True, limit=None, path_like=None, **filters):
+        '''
+        Select runs matching the given column filters, e.g. query(case_name='opt_k', algo='ppo').
+        A filter value of a list/tuple matches any of its elements.
+        '''
+        clauses, values = [], []
+        for key, val in filters.items():
+            if key not in COLUMN_NAMES:
+                raise ValueError('unknown catalog column: {}'.format(key))
+            if val is None:
+                continue
+            if isinstance(val, (list, tuple)):
+                clauses.append('{} IN ({})'.format(key, ', '.join('?' * len(val))))
+                values.extend(val)
+            else:
+                clauses.append('{} = ?'.format(key))
+                values.append(val)
+        if path_like is not None:
+            clauses.append('path LIKE ?')
+            values.append(path_like)
+        sql = 'SELECT * FROM runs'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        if order_by is not None:
+            if order_by not in COLUMN_NAMES:
+                raise ValueError('unknown catalog column: {}'.format(order_by))
+            sql += ' ORDER BY {} IS NULL, {} {}'.format(order_by, order_by, 'DESC' if descending else 'ASC')
+        if limit is not None:
+            sql += ' LIMIT {:d}'.format(limit)
+        return [dict(row) for row in self._conn.execute(sql, values)]
+
+
+    def best(self, metric='final_avg_discounted_return', **filters):
+        rows = self.query(order_by=metric, descending=True, limit=1, **filters)
+        return rows[0] if rows else None
+
+
+    def record_run(self, log_dir, launcher, params=None, seed=None, window_size=10, extra=None):
+        '''
+        Record a finished run. Called by the launchers at the end of training.
+        '''
+        row = parse_run_name(launcher)
+        row.update({k: v for k, v in parse_run_name(log_dir).items() if v is not None and k in ('exp_id', 'n_hw', 'seed')})
+        row['launcher'] = launcher
+        row['path'] = log_dir
+        if seed is not None:
+            row['seed'] = int(seed)
+        if params is not None:
+            row['params_hash'] = params_hash(params)
+            n_hw = getattr(params, 'n_springs', getattr(params, 'n_segments', None))
+            if n_hw is not None:
+                row['n_hw'] = int(n_hw)
+        row.update(summarize_progress(os.path.join(log_dir, 'progress.csv'), window_size=window_size))
+        row['extra'] = extra
+        row['finished_at'] = time.time()
+        self.upsert(row)
+        return self.get(log_dir)
+
+
+    def index_runs(self, root=DEFAULT_LOG_ROOT, window_size=10):
+        '''
+        Back-fill the catalog from the log dirs under root. Runs whose progress.csv did not change
+        since they were recorded are skipped. Returns the number of (re-)indexed runs.
+        '''
+        known = {row['path']: row for row in self.query()}
+        n_indexed = 0
+        for csv_path in index_csv_paths(root):
+            log_dir = os.path.abspath(os.path.dirname(csv_path))
+            old = known.get(log_dir)
+            if old is not None and old['progress_mtime'] == os.path.getmtime(csv_path):
+                continue
+            row = parse_run_name(os.path.relpath(log_dir, root))
+            if old is not None: # keep what the launcher recorded, refresh the metrics
+                row.update({k: v for k, v in old.items() if v is not None})
+            row['path'] = log_dir
+            row.update(summarize_progress(csv_path, window_size=window_size))
+            self.upsert(row)
+            n_indexed += 1
+        return n_indexed
+
+
+def record_run(log_dir, launcher, params=None, seed=None, window_size=10, extra=None, catalog_path=DEFAULT_CATALOG_PATH):
+    '''
+    Convenience wrapper for the launchers: record one finished run in the default catalog.
+    '''
+    with RunCatalog(catalog_path) as catalog:
+        return catalog.record_run(log_dir, launcher, params=params, seed=seed, window_size=window_size, extra=extra)
+
+
+def _print_rows(rows, columns):
+    print('\t'.join(columns))
+    for row in rows:
+        print('\t'.join('' if row[c] is None else str(row[c]) for c in columns))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--catalog', default=DEFAULT_CATALOG_PATH, help='path to the sqlite catalog')
+    subparsers = parser.add_subparsers(dest='command')
+
+    index_parser = subparsers.add_parser('index', help='index (or refresh) the runs under a log root')
+    index_parser.add_argument('--root', default=DEFAULT_LOG_ROOT, help='log root dir')
+    index_parser.add_argument('--window_size', default=10, type=int, help='number of final iterations averaged for the final return')
+
+    for command in ['query', 'best']:
+        query_parser = subparsers.add_parser(command)
+        query_parser.add_argument('--case', dest='case_name', choices=['opt_k', 'opt_l'])
+        query_parser.add_argument('--mode', choices=['hw_as_action', 'hw_as_policy', 'hw_in_policy_and_action'])
+        query_parser.add_argument('--algo', choices=['ppo', 'cmaes', 'cmaes_ppo', 'pbt_ppo', 'ars'])
+        query_parser.add_argument('--launcher')
+        query_parser.add_argument('--exp_id')
+        query_parser.add_argument('--seed', type=int)
+        query_parser.add_argument('--params_hash')
+        query_parser.add_argument('--path_like', help='SQL LIKE pattern on the log path, e.g. %%2020_06%%')
+        query_parser.add_argument('--order_by', default='final_avg_discounted_return')
+        query_parser.add_argument('--ascending', action='store_true')
+        query_parser.add_argument('--limit', type=int)
+        query_parser.add_argument('--json', action='store_true', help='print the rows as json')
+
+    args = parser.parse_args()
+
+    with RunCatalog(args.catalog) as catalog:
+        if args.command == 'index':
+            n_indexed = catalog.index_runs(args.root, window_size=args.window_size)
+            print('Indexed {} runs into {}'.format(n_indexed, args.catalog))
+        elif args.command in ('query', 'best'):
+            filters = dict(case_name=args.case_name, mode=args.mode, algo=args.algo, launcher=args.launcher,
+                           exp_id=args.exp_id, seed=args.seed, params_hash=args.params_hash)
+            limit = 1 if args.command == 'best' else args.limit
+            rows = catalog.query(order_by=args.order_by, descending=not args.ascending, limit=limit, path_like=args.path_like, **filters)
+            if args.json:
+                print(json.dumps(rows, indent=2))
+            else:
+                _print_rows(rows, ['launcher', 'exp_id', 'seed', 'n_hw', 'n_iters', 'final_avg_discounted_return', 'params_hash', 'path'])
+        else:
+            parser.print_help()
@@ -0,0 +1,112 @@
+'''
+Integrators for the linear spring-mass dynamics over one action window
+
+    dx/dt = A x + B u,  u held constant over the action,
+
+with the state x ordered as positions and velocities interleaved (y_0, v_0, y_1, v_1, ...).
+
+    'midpoint_substep'  : the envs' mid-point Euler scheme, forces re-evaluated at every substep
+    'implicit_midpoint' : implicit midpoint rule (A-stable), composed over the substeps into a single update
+    'expm'              : exact solution through the matrix exponential, a single update per action
+
+The last two precompute x_next = Phi x + Gamma u for the whole window, so one action costs one small
+matrix-vector product whatever n_steps_per_action and dt are.
+'''
+
+import numpy as np
+
+
+INTEGRATORS = ['midpoint_substep', 'implicit_midpoint', 'expm']
+
+
+def expm(mat):
+    '''
+    Matrix exponential by scaling and squaring with a truncated Taylor series, accurate to machine
+    precision for the small matrices here (numpy only, the envs do not depend on scipy).
+    '''
+    mat = np.asarray(mat, dtype=np.float64)
+    norm = np.linalg.norm(mat, ord=np.inf)
+    n_squarings = max(0, int(np.ceil(np.log2(norm))) + 1) if norm > 0 else 0
+    scaled = mat / 2**n_squarings
+    result = np.eye(mat.shape[0])
+    term = np.eye(mat.shape[0])
+    for i in range(1, 20):
+        term = term.dot(scaled) / i
+        result = result + term
+    for _ in range(n_squarings):
+        result = result.dot(result)
+    return result
+
+
+def propagator(A, B, dt, n_steps, method):
+    '''
+    (Phi, Gamma) with x(n_steps * dt) = Phi x(0) + Gamma u for the 'implicit_midpoint' or 'expm' method.
+    '''
+    A = np.asarray(A, dtype=np.float64)
+    B = np.asarray(B, dtype=np.float64)
+    n, m = B.shape
+    if method == 'expm':
+        # exp([[A, B], [0, 0]] * T) = [[Phi, Gamma], [0, I]]
+        augmented = np.zeros((n + m, n + m))
+        augmented[:n, :n] = A
+        augmented[:n, n:] = B
+        exp_augmented = expm(augmented * dt * n_steps)
+        return exp_augmented[:n, :n], exp_augmented[:n, n:]
+    elif method == 'implicit_midpoint':
+        # (I - dt/2 A) x_next = (I + dt/2 A) x + dt B u
+        lhs = np.eye(n) - 0.5 * dt * A
+        step_state = np.linalg.solve(lhs, np.eye(n) + 0.5 * dt * A)
+        step_input = np.linalg.solve(lhs, dt * B)
+        phi, gamma = np.eye(n), np.zeros((n, m))
+        for _ in range(n_steps):
+            phi, gamma = step_state.dot(phi), step_state.dot(gamma) + step_input
+        return phi, gamma
+    raise ValueError('no propagator for the integrator {}'.format(method))
+
+
+def midpoint_substeps(A, B, x, u, dt, n_steps):
+    '''
+    The envs' mid-point Euler scheme (y += v*dt + 0.5*a*dt**2, v += a*dt) with the accelerations
+    re-evaluated from the state at every substep.
+    '''
+    x = np.array(x, dtype=np.float64)
+    bu = np.asarray(B).dot(u)
+    for _ in range(n_steps):
+        acc = (np.asarray(A).dot(x) + bu)[1::2]
+        x[0::2] = x[0::2] + x[1::2] * dt + 0.5 * acc * dt**2
+        x[1::2] = x[1::2] + acc * dt
+    return x
+
+
+class LinearIntegrator:
+    '''
+    Integrates dx/dt = A x + B u over n_steps substeps of dt with one of INTEGRATORS.
+    The propagator of the last (A, B) is cached, so a constant A (e.g. a fixed stiffness) costs one
+    matrix-vector product per action.
+    '''
+    def __init__(self, method, dt, n_steps):
+        assert method in INTEGRATORS, 'unknown integrator {}, choose from {}'.format(method, INTEGRATORS)
+        self.method = method
+        self.dt = dt
+        self.n_steps = n_steps
+        self._cache_key = None
+        self._cache = None
+
+    def __call__(self, A, B, x, u):
+        if self.method == 'midpoint_substep':
+            return midpoint_substeps(A, B, x, u, self.dt, self.n_steps)
+        A = np.asarray(A, dtype=np.float64)
+        B = np.asarray(B, dtype=np.float64)
+        key = (A.tobytes(), B.tobytes())
+        if key != self._cache_key:
+            self._cache = propagator(A, B, self.dt, self.n_steps, self.method)
+            self._cache_key = key
+        phi, gamma = self._cache
+        return phi.dot(x) + gamma.dot(u)
+
+
+def spring_mass_matrices(k, m):
+    '''
+    A, B of m y'' = u - k y with x = (y, v)
+    '''
+    return np.array([[0.0, 1.0], [-k / m, 0.0]]), np.array([[0.0], [1.0 / m]])
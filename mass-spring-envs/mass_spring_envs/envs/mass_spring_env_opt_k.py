@@ -32,6 +32,8 @@ import gym
 import numpy as np
 from dowel import tabular
 
+from mass_spring_envs.envs.linear_integrators import LinearIntegrator, spring_mass_matrices
+
 
 def sigmoid(x):
     return 1/(1 + np.exp(-x))
@@ -52,6 +54,17 @@ def get_soft_conditioned_val(value1, value2, test_value, criterion, sigmoid_coef
         return sigmoid(sigmoid_coeff * (-test_value + criterion)) * (value1 - value2) + value2
 
 
+def get_soft_conditioned_val_batched(value1, value2, test_value, criterion, sigmoid_coeff=1.0):
+    '''
+    elementwise get_soft_conditioned_val on arrays, same floating-point operations as the scalar version
+    '''
+    value1, value2, test_value = np.broadcast_arrays(value1, value2, test_value)
+    with np.errstate(over='ignore'): # exp overflows to inf exactly like the scalar version, sigmoid is then 0
+        val_inc = sigmoid(sigmoid_coeff * (test_value - criterion)) * (value2 - value1) + value1
+        val_dec = sigmoid(sigmoid_coeff * (-test_value + criterion)) * (value1 - value2) + value2
+    return np.where(value1 < value2, val_inc, val_dec)
+
+
 #################################### Base Class ####################################
 
 class MassSpringEnv_OptK(gym.Env):
@@ -80,6 +93,9 @@ class MassSpringEnv_OptK(gym.Env):
         self.reward_beta = params.reward_beta
         self.reward_gamma = params.reward_gamma
         self.reward_switch_pos_vel_thresh = params.reward_switch_pos_vel_thresh
+        self.integrator = params.integrator
+        if self.integrator != 'midpoint':
+            self.linear_integrator = LinearIntegrator(self.integrator, self.dt, self.n_steps_per_action)
 
         # states
         self.v1 = np.random.uniform(-self.half_vel_range, self.half_vel_range) # vel of both masses
@@ -124,6 +140,17 @@ class MassSpringEnv_OptK(gym.Env):
         self.v1 = np.clip(self.v1, -self.half_vel_range, self.half_vel_range)
 
 
+    def simulate_w_linear_integrator(self, k_sum, f_ext):
+        '''
+        (m1+m2) y1'' = f_ext - k_sum*y1 over the action with the spring force following y1 (instead of being
+        held at its value at the start of the action), with the integrator selected by params.integrator
+        '''
+        A, B = spring_mass_matrices(k_sum, self.m1 + self.m2)
+        self.y1, self.v1 = self.linear_integrator(A, B, [self.y1, self.v1], [f_ext])
+        self.y1 = np.clip(self.y1, 0.0, self.pos_range)
+        self.v1 = np.clip(self.v1, -self.half_vel_range, self.half_vel_range)
+
+
     def calc_reward(self, y2, f, v2):
         pos_penalty = self.reward_alpha * np.abs(y2 - self.h)
         vel_penalty = self.reward_beta * np.abs(v2)
@@ -162,6 +189,9 @@ class MassSpringEnv_OptK_HwAsAction(MassSpringEnv_OptK):
     def __init__(self, params):
         super().__init__(params)
         self.n_springs = params.n_springs
+        # 'per_episode': the k's of the first action after reset are held for the whole episode
+        self.hw_sampling = params.hw_sampling
+        self.k_held = None
         # action space, different for different subclasses
         k_lb_list = [self.k_lb,] * self.n_springs
         k_ub_list = [self.k_ub,] * self.n_springs
@@ -193,10 +223,17 @@ class MassSpringEnv_OptK_HwAsAction(MassSpringEnv_OptK):
         i = action[0] # input force
         f = self.trq_const * i / self.r_shaft
         k = action[1:] # spring stiffness
+        if self.hw_sampling == 'per_episode':
+            if self.k_held is None:
+                self.k_held = k
+            k = self.k_held
         k_sum = np.sum(k)
-        f_total = f + (self.m1 + self.m2) * self.g - k_sum*self.y1
-        a = f_total / (self.m1 + self.m2)
-        self.simulate_w_mid_point_euler(a)
+        if self.integrator == 'midpoint':
+            f_total = f + (self.m1 + self.m2) * self.g - k_sum*self.y1
+            a = f_total / (self.m1 + self.m2)
+            self.simulate_w_mid_point_euler(a)
+        else:
+            self.simulate_w_linear_integrator(k_sum, f + (self.m1 + self.m2) * self.g)
         y2 = self.y1 + self.l
         obs = np.array([self.y1, self.v1])
         reward = self.calc_reward(y2, f, self.v1)
@@ -214,6 +251,96 @@ class MassSpringEnv_OptK_HwAsAction(MassSpringEnv_OptK):
         return obs, reward, done, info
 
 
+    def reset(self):
+        self.k_held = None
+        return super().reset()
+
+
+
+#################################### Hardware as Action, Population ####################################
+
+
+class MassSpringEnv_OptK_HwAsAction_Population(MassSpringEnv_OptK_HwAsAction):
+    '''
+    n_members * n_envs_per_member copies of MassSpringEnv_OptK_HwAsAction advanced together, for the
+    population training of my_garage.algos.population_ppo.PopulationPPO. Env i belongs to member
+    i // n_envs_per_member, whose index is the last observation column.
+
+    Action: (n_envs, 1+n_springs) array of f, k1, k2, ... (the k's sampled with every action)
+    observation: (n_envs, 3) array of y1, v1, member
+    Rewards and dones are (n_envs,) arrays, the episodes are ended by the sampler (max_path_length).
+    observation_space and action_space are the ones of a single env.
+    '''
+
+    def __init__(self, params, n_members, n_envs_per_member=1):
+        super().__init__(params)
+        assert self.hw_sampling == 'per_step', 'the population env samples the k\'s with every action'
+        self.n_members = n_members
+        self.n_envs_per_member = n_envs_per_member
+        self.n_envs = n_members * n_envs_per_member
+        self.members = np.repeat(np.arange(n_members), n_envs_per_member).astype(np.float64)
+        self.y1 = np.zeros(self.n_envs)
+        self.v1 = np.zeros(self.n_envs)
+
+        self.observation_space = gym.spaces.Box(
+            low=np.array([0.0, -self.half_vel_range, 0.0]),
+            high=np.array([self.pos_range, self.half_vel_range, n_members - 1]),
+            dtype=np.float32) # obs y1, v1 and the member
+
+
+    def get_obs(self):
+        return np.stack([self.y1, self.v1, self.members], axis=1)
+
+
+    def step(self, actions):
+        self.step_cnt += 1
+        actions = np.clip(np.array(actions, dtype=np.float64).reshape(self.n_envs, -1), self.action_space.low, self.action_space.high)
+        i = actions[:, 0] # input force
+        f = self.trq_const * i / self.r_shaft
+        k_sum = np.sum(actions[:, 1:], axis=1) # spring stiffness
+        if self.integrator == 'midpoint':
+            f_total = f + (self.m1 + self.m2) * self.g - k_sum*self.y1
+            a = f_total / (self.m1 + self.m2)
+            self.simulate_w_mid_point_euler(a)
+        else:
+            # one (A, B) per env, the propagators cannot be shared
+            f_ext = f + (self.m1 + self.m2) * self.g
+            for idx in range(self.n_envs):
+                A, B = spring_mass_matrices(k_sum[idx], self.m1 + self.m2)
+                self.y1[idx], self.v1[idx] = self.linear_integrator(A, B, [self.y1[idx], self.v1[idx]], [f_ext[idx]])
+            self.y1 = np.clip(self.y1, 0.0, self.pos_range)
+            self.v1 = np.clip(self.v1, -self.half_vel_range, self.half_vel_range)
+        y2 = self.y1 + self.l
+        rewards = self.calc_reward(y2, f, self.v1)
+        dones = np.zeros(self.n_envs, dtype=bool)
+        return self.get_obs(), rewards, dones, {}
+
+
+    def calc_reward(self, y2, f, v2):
+        pos_penalty = self.reward_alpha * np.abs(y2 - self.h)
+        vel_penalty = self.reward_beta * np.abs(v2)
+
+        force_penalty = get_soft_conditioned_val_batched(self.reward_gamma * np.abs(f), self.reward_gamma * np.abs(self.half_force_range), pos_penalty + vel_penalty, self.reward_switch_pos_vel_thresh, 10.0)
+
+        reward = -pos_penalty - vel_penalty - force_penalty
+        return reward
+
+
+    def reset(self):
+        self.step_cnt = 0
+        return self.reset_idx(np.ones(self.n_envs, dtype=bool))
+
+
+    def reset_idx(self, mask):
+        '''
+        Reset the envs selected by the boolean mask (or indices), returns their (?, 3) observations.
+        '''
+        n = np.arange(self.n_envs)[mask].size
+        self.v1[mask] = np.random.uniform(-self.half_vel_range, self.half_vel_range, size=n) # vel of both masses
+        self.y1[mask] = np.random.uniform(0, self.pos_range, size=n)
+        return self.get_obs()[mask]
+
+
 
 #################################### Hardware as Policy ####################################
 
@@ -265,4 +392,78 @@ class MassSpringEnv_OptK_HwAsPolicy(MassSpringEnv_OptK):
             print('v2: ', self.v1)
             print('acc reward: ', self.acc_reward)
             done = True
-        return obs, reward, done, info
\ No newline at end of file
+        return obs, reward, done, info
+
+
+#################################### Hardware-Conditioned Controller ####################################
+
+
+class MassSpringEnv_OptK_HwConditioned(MassSpringEnv_OptK):
+    '''
+    Action: f
+    observation: y1, v1, hardware (the k's in the search space of params.k_hw, normalized to [0, 1])
+    For a controller that works for any hardware: the hardware is drawn uniformly from the search space
+    of params.k_hw at every reset, or fixed with set_hardware (evaluation of a hardware candidate).
+    '''
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.k_hw = params.k_hw
+        self.hw_fixed = None
+        self.hw = self.k_hw.center
+        self.k = self.k_hw.to_elements(self.hw)
+
+        self.observation_space = gym.spaces.Box(
+            low=np.array([0.0, -self.half_vel_range] + [0.0] * self.k_hw.dim),
+            high=np.array([self.pos_range, self.half_vel_range] + [1.0] * self.k_hw.dim),
+            dtype=np.float32) # obs y1, v1 and the normalized hardware
+
+        self.action_space = gym.spaces.Box(
+            low=np.array([-self.half_force_range]),
+            high=np.array([self.half_force_range]),
+            dtype=np.float32)
+
+
+    def set_hardware(self, hw):
+        '''
+        hw (array-like, k_hw.dim): hardware in the search space of params.k_hw, held from the next reset on;
+        None to draw it at every reset again
+        '''
+        self.hw_fixed = None if hw is None else np.clip(np.asarray(hw, dtype=np.float64).reshape(self.k_hw.dim), self.k_hw.lower, self.k_hw.upper)
+
+
+    def get_obs(self):
+        hw_normalized = (self.hw - self.k_hw.lower) / (self.k_hw.upper - self.k_hw.lower)
+        return np.concatenate([[self.y1, self.v1], hw_normalized])
+
+
+    def step(self, action):
+        self.step_cnt += 1
+        action = np.clip(np.asarray(action, dtype=np.float64).reshape(-1), self.action_space.low, self.action_space.high)
+        i = action[0] # input force
+        f = self.trq_const * i / self.r_shaft
+        k_sum = np.sum(self.k)
+        if self.integrator == 'midpoint':
+            f_total = f + (self.m1 + self.m2) * self.g - k_sum*self.y1
+            a = f_total / (self.m1 + self.m2)
+            self.simulate_w_mid_point_euler(a)
+        else:
+            self.simulate_w_linear_integrator(k_sum, f + (self.m1 + self.m2) * self.g)
+        y2 = self.y1 + self.l
+        reward = self.calc_reward(y2, f, self.v1)
+        done = False
+        self.acc_reward = self.acc_reward + reward
+        if self.step_cnt == self.n_steps_per_episode:
+            done = True
+            tabular.record('Env/k', k_sum)
+        return self.get_obs(), reward, done, {}
+
+
+    def reset(self):
+        if self.hw_fixed is None:
+            self.hw = np.random.uniform(self.k_hw.lower, self.k_hw.upper)
+        else:
+            self.hw = self.hw_fixed
+        self.k = self.k_hw.to_elements(self.hw)
+        super().reset()
+        return self.get_obs()
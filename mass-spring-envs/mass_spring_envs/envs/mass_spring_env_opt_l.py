@@ -32,6 +32,8 @@ import gym
 import numpy as np
 from dowel import tabular
 
+from mass_spring_envs.envs.linear_integrators import LinearIntegrator, spring_mass_matrices
+
 
 def sigmoid(x):
     return 1/(1 + np.exp(-x))
@@ -52,6 +54,17 @@ def get_soft_conditioned_val(value1, value2, test_value, criterion, sigmoid_coef
         return sigmoid(sigmoid_coeff * (-test_value + criterion)) * (value1 - value2) + value2
 
 
+def get_soft_conditioned_val_batched(value1, value2, test_value, criterion, sigmoid_coeff=1.0):
+    '''
+    elementwise get_soft_conditioned_val on arrays, same floating-point operations as the scalar version
+    '''
+    value1, value2, test_value = np.broadcast_arrays(value1, value2, test_value)
+    with np.errstate(over='ignore'): # exp overflows to inf exactly like the scalar version, sigmoid is then 0
+        val_inc = sigmoid(sigmoid_coeff * (test_value - criterion)) * (value2 - value1) + value1
+        val_dec = sigmoid(sigmoid_coeff * (-test_value + criterion)) * (value1 - value2) + value2
+    return np.where(value1 < value2, val_inc, val_dec)
+
+
 #################################### Base Class ####################################
 
 class MassSpringEnv_OptL(gym.Env):
@@ -78,6 +91,9 @@ class MassSpringEnv_OptL(gym.Env):
         self.reward_beta = params.reward_beta
         self.reward_gamma = params.reward_gamma
         self.reward_switch_pos_vel_thresh = params.reward_switch_pos_vel_thresh
+        self.integrator = params.integrator
+        if self.integrator != 'midpoint':
+            self.linear_integrator = LinearIntegrator(self.integrator, self.dt, self.n_steps_per_action)
 
         # states
         # self.v1 = np.random.uniform(-self.half_vel_range, self.half_vel_range) # vel of both masses
@@ -117,6 +133,19 @@ class MassSpringEnv_OptL(gym.Env):
         return y, v
 
 
+    def simulate_w_linear_integrator(self, y, v, m, f_ext):
+        '''
+        m y'' = f_ext - k*y over the action with the spring force following y (instead of being held at its
+        value at the start of the action), with the integrator selected by params.integrator.
+        y, v, f_ext can be arrays (batched envs).
+        '''
+        A, B = spring_mass_matrices(self.k, m)
+        y, v = self.linear_integrator(A, B, np.array([y, v]), np.array([f_ext]))
+        y = np.clip(y, 0.0, self.pos_range)
+        v = np.clip(v, -self.half_vel_range, self.half_vel_range)
+        return y, v
+
+
     def calc_reward(self, y2, f, v2):
         pos_penalty = self.reward_alpha * np.abs(y2 - self.h)
         vel_penalty = self.reward_beta * np.abs(v2)
@@ -148,6 +177,9 @@ class MassSpringEnv_OptL_HwAsAction(MassSpringEnv_OptL):
     def __init__(self, params):
         super().__init__(params)
         self.n_segments = params.n_segments
+        # 'per_episode': the l's of the first action after reset are held for the whole episode
+        self.hw_sampling = params.hw_sampling
+        self.l_held = None
         # action space, different for different subclasses
         l_lb_list = [self.l_lb,] * self.n_segments
         l_ub_list = [self.l_ub,] * self.n_segments
@@ -182,10 +214,17 @@ class MassSpringEnv_OptL_HwAsAction(MassSpringEnv_OptL):
         self.step_cnt += 1
         action = np.clip(action.copy(), self.action_space.low, self.action_space.high)
         f = action[0] # input force
+        if self.hw_sampling == 'per_episode':
+            if self.l_held is None:
+                self.l_held = action[1:].copy()
+            action[1:] = self.l_held
         l = np.sum(action[1:]) # bar length
-        f_total = f + (self.m1 + self.m2) * self.g - self.k * self.y1
-        a = f_total / (self.m1 + self.m2)
-        self.y1, self.v1 = self.simulate_w_mid_point_euler(self.y1, self.v1, a)
+        if self.integrator == 'midpoint':
+            f_total = f + (self.m1 + self.m2) * self.g - self.k * self.y1
+            a = f_total / (self.m1 + self.m2)
+            self.y1, self.v1 = self.simulate_w_mid_point_euler(self.y1, self.v1, a)
+        else:
+            self.y1, self.v1 = self.simulate_w_linear_integrator(self.y1, self.v1, self.m1 + self.m2, f + (self.m1 + self.m2) * self.g)
         y2 = self.y1 + l
         obs = np.array([self.y1, self.v1])
         reward = self.calc_reward(y2, f, self.v1)
@@ -208,10 +247,89 @@ class MassSpringEnv_OptL_HwAsAction(MassSpringEnv_OptL):
         # self.v1 = 0.0
 
         self.step_cnt = 0
+        self.l_held = None
         return np.array([self.y1, self.v1])
 
 
 
+#################################### Hardware as Action, Population ####################################
+
+
+class MassSpringEnv_OptL_HwAsAction_Population(MassSpringEnv_OptL_HwAsAction):
+    '''
+    n_members * n_envs_per_member copies of MassSpringEnv_OptL_HwAsAction advanced together, for the
+    population training of my_garage.algos.population_ppo.PopulationPPO. Env i belongs to member
+    i // n_envs_per_member, whose index is the last observation column.
+
+    Action: (n_envs, 1+n_segments) array of f, l1, l2, ... (the l's sampled with every action)
+    observation: (n_envs, 3) array of y1, v1, member
+    Rewards and dones are (n_envs,) arrays, the episodes are ended by the sampler (max_path_length).
+    observation_space and action_space are the ones of a single env.
+    '''
+
+    def __init__(self, params, n_members, n_envs_per_member=1):
+        super().__init__(params)
+        assert self.hw_sampling == 'per_step', 'the population env samples the l\'s with every action'
+        self.n_members = n_members
+        self.n_envs_per_member = n_envs_per_member
+        self.n_envs = n_members * n_envs_per_member
+        self.members = np.repeat(np.arange(n_members), n_envs_per_member).astype(np.float64)
+        self.y1 = np.zeros(self.n_envs)
+        self.v1 = np.zeros(self.n_envs)
+
+        self.observation_space = gym.spaces.Box(
+            low=np.array([0.0, -self.half_vel_range, 0.0]),
+            high=np.array([self.pos_range, self.half_vel_range, n_members - 1]),
+            dtype=np.float32) # obs y1, v1 and the member
+
+
+    def get_obs(self):
+        return np.stack([self.y1, self.v1, self.members], axis=1)
+
+
+    def step(self, actions):
+        self.step_cnt += 1
+        actions = np.clip(np.array(actions, dtype=np.float64).reshape(self.n_envs, -1), self.action_space.low, self.action_space.high)
+        f = actions[:, 0] # input force
+        l = np.sum(actions[:, 1:], axis=1) # bar length
+        if self.integrator == 'midpoint':
+            f_total = f + (self.m1 + self.m2) * self.g - self.k * self.y1
+            a = f_total / (self.m1 + self.m2)
+            self.y1, self.v1 = self.simulate_w_mid_point_euler(self.y1, self.v1, a)
+        else:
+            self.y1, self.v1 = self.simulate_w_linear_integrator(self.y1, self.v1, self.m1 + self.m2, f + (self.m1 + self.m2) * self.g)
+        y2 = self.y1 + l
+        rewards = self.calc_reward(y2, f, self.v1)
+        dones = np.zeros(self.n_envs, dtype=bool)
+        return self.get_obs(), rewards, dones, {}
+
+
+    def calc_reward(self, y2, f, v2):
+        pos_penalty = self.reward_alpha * np.abs(y2 - self.h)
+        vel_penalty = self.reward_beta * np.abs(v2)
+
+        force_penalty = get_soft_conditioned_val_batched(self.reward_gamma * np.abs(f), self.reward_gamma * np.abs(self.half_force_range), pos_penalty + vel_penalty, self.reward_switch_pos_vel_thresh, 50.0)
+
+        reward = -pos_penalty - vel_penalty - force_penalty
+        return reward
+
+
+    def reset(self):
+        self.step_cnt = 0
+        return self.reset_idx(np.ones(self.n_envs, dtype=bool))
+
+
+    def reset_idx(self, mask):
+        '''
+        Reset the envs selected by the boolean mask (or indices), returns their (?, 3) observations.
+        '''
+        n = np.arange(self.n_envs)[mask].size
+        self.v1[mask] = np.random.uniform(-self.half_vel_range, self.half_vel_range, size=n) # vel of both masses
+        self.y1[mask] = np.random.uniform(0, self.pos_range, size=n)
+        return self.get_obs()[mask]
+
+
+
 #################################### Hardware as Policy ####################################
 
 
@@ -259,8 +377,11 @@ class MassSpringEnv_OptL_HwAsPolicy(MassSpringEnv_OptL):
         f_total_2 = f2 + f + self.m2 * self.g
         a2 = f_total_2 / self.m2
 
-        self.y1, self.v1 = self.simulate_w_mid_point_euler(self.y1, self.v1, a1)
-        self.y2, self.v2 = self.simulate_w_mid_point_euler(self.y2, self.v2, a2)
+        if self.integrator == 'midpoint':
+            self.y1, self.v1 = self.simulate_w_mid_point_euler(self.y1, self.v1, a1)
+        else:
+            self.y1, self.v1 = self.simulate_w_linear_integrator(self.y1, self.v1, self.m1, f1 + self.m1 * self.g)
+        self.y2, self.v2 = self.simulate_w_mid_point_euler(self.y2, self.v2, a2) # constant force on m2, mid-point Euler is exact
 
         obs = np.array([self.y1, self.v1, self.y2, self.v2])
         reward = self.calc_reward(self.y2, f, self.v1)
@@ -284,4 +405,278 @@ class MassSpringEnv_OptL_HwAsPolicy(MassSpringEnv_OptL):
         self.y2 = self.y1 + l_avg # just a guess, will be recalculated
 
         self.step_cnt = 0
-        return np.array([self.y1, self.v1, self.y2, self.v2])
\ No newline at end of file
+        return np.array([self.y1, self.v1, self.y2, self.v2])
+
+
+
+#################################### Hardware as Policy, Substep Coupling ####################################
+
+
+
+class MassSpringEnv_OptL_HwAsPolicy_SubstepCoupling(MassSpringEnv_OptL_HwAsPolicy):
+    '''
+    Hardware as policy with the interface coupling resolved inside the env.
+    Action: l (total bar length, the rest length of the interface spring), f
+    observation: y1, v1, y2, v2
+
+    The interface force 0.5*k_interface*(y2-y1-l) + 0.5*b_interface*(v2-v1), which MechPolicyModel_OptL_HwAsPolicy
+    evaluates once per action, is re-evaluated at every substep here, so the control rate can be much coarser
+    (params.n_steps_per_action_interface). params.interface_integrator is 'midpoint' (explicit substeps) or
+    'implicit_midpoint' / 'expm' (see linear_integrators), which are stable for the stiff interface at any step size.
+    '''
+    def __init__(self, params):
+        super().__init__(params)
+        self.n_segments = params.n_segments
+        self.k_interface = params.k_interface
+        self.b_interface = params.b_interface
+        self.n_steps_per_action = params.n_steps_per_action_interface
+        self.integrator = params.interface_integrator
+        assert self.integrator in ['midpoint', 'implicit_midpoint', 'expm'], 'unknown interface integrator {}'.format(self.integrator)
+
+        self.action_space = gym.spaces.Box(
+            low=np.array([self.l_lb * self.n_segments, -self.half_force_range]), 
+            high=np.array([self.l_ub * self.n_segments, self.half_force_range]), 
+            dtype=np.float32) # 1st: bar length l, 2nd: original action f
+
+        # linear dynamics d/dt [y1, v1, y2, v2] = A [y1, v1, y2, v2] + B [l, f, 1]
+        k_i, b_i = 0.5 * self.k_interface, 0.5 * self.b_interface
+        self.A = np.array([
+            [0.0, 1.0, 0.0, 0.0],
+            [-(k_i + self.k) / self.m1, -b_i / self.m1, k_i / self.m1, b_i / self.m1],
+            [0.0, 0.0, 0.0, 1.0],
+            [k_i / self.m2, b_i / self.m2, -k_i / self.m2, -b_i / self.m2]])
+        self.B = np.array([
+            [0.0, 0.0, 0.0],
+            [-k_i / self.m1, 0.0, self.g],
+            [0.0, 0.0, 0.0],
+            [k_i / self.m2, 1.0 / self.m2, self.g]])
+        if self.integrator != 'midpoint':
+            self.linear_integrator = LinearIntegrator(self.integrator, self.dt, self.n_steps_per_action)
+
+
+    def calc_interface_force(self, y1, v1, y2, v2, l):
+        return 0.5 * self.k_interface * (y2 - y1 - l) + 0.5 * self.b_interface * (v2 - v1) # force on m1, the bar has no mass so m2 gets the opposite
+
+
+    def simulate_coupled_w_mid_point_euler(self, l, f):
+        y1, v1, y2, v2 = self.y1, self.v1, self.y2, self.v2
+        for _ in range(self.n_steps_per_action):
+            f1 = self.calc_interface_force(y1, v1, y2, v2, l)
+            a1 = (f1 + self.m1 * self.g - self.k * y1) / self.m1
+            a2 = (-f1 + f + self.m2 * self.g) / self.m2
+            y1, v1 = y1 + v1 * self.dt + 0.5 * a1 * self.dt**2, v1 + a1 * self.dt # mid-point Euler integration
+            y2, v2 = y2 + v2 * self.dt + 0.5 * a2 * self.dt**2, v2 + a2 * self.dt
+        return y1, v1, y2, v2
+
+
+    def step(self, action):
+        """
+        Run one timestep of the environment's dynamics. When end of episode
+        is reached, reset() should be called to reset the environment's internal state.
+        Input
+        -----
+        action : an action provided by the policy, here the bar length l and the original action f
+        
+        Outputs
+        -------
+        (observation, reward, done, info)
+        observation : agent's observation of the current environment
+        reward [Float] : amount of reward due to the previous action
+        done : a boolean, indicating whether the episode has ended
+        info : a dictionary containing other diagnostic information from the previous action
+        """
+        self.step_cnt += 1
+        action = np.clip(action.copy(), self.action_space.low, self.action_space.high)
+        l = action[0]   # bar length
+        f = action[1]   # original action f
+
+        if self.integrator == 'midpoint':
+            y1, v1, y2, v2 = self.simulate_coupled_w_mid_point_euler(l, f)
+        else:
+            y1, v1, y2, v2 = self.linear_integrator(self.A, self.B, [self.y1, self.v1, self.y2, self.v2], [l, f, 1.0])
+        self.y1, self.y2 = np.clip([y1, y2], 0.0, self.pos_range)
+        self.v1, self.v2 = np.clip([v1, v2], -self.half_vel_range, self.half_vel_range)
+
+        obs = np.array([self.y1, self.v1, self.y2, self.v2])
+        reward = self.calc_reward(self.y2, f, self.v1)
+        done = False
+        info = {}
+        if self.step_cnt == self.n_steps_per_episode:
+            print()
+            print('y2: ', self.y2)
+            print('v2: ', self.v2)
+            print('l: ', l)
+            tabular.record('Env/FinalL', l)
+        return obs, reward, done, info
+
+
+
+#################################### Hardware as Policy, Batched ####################################
+
+
+
+class MassSpringEnv_OptL_HwAsPolicy_Batched(MassSpringEnv_OptL_HwAsPolicy):
+    '''
+    n_envs copies of MassSpringEnv_OptL_HwAsPolicy advanced together.
+
+    The states are a (n_envs, 4) array of (y1, v1, y2, v2), step() takes a (n_envs, 3) array of (f1, f2, f)
+    and returns (n_envs, 4) observations and (n_envs,) rewards and dones. The floating-point operations are
+    the same as in the scalar env, so each row agrees bit for bit with a scalar env started from the same state.
+    observation_space and action_space are the ones of a single env.
+    '''
+    def __init__(self, params, n_envs):
+        super().__init__(params)
+        self.n_envs = n_envs
+        self.l_avg = 1/2 * (self.l_lb + self.l_ub)
+        self.states = np.zeros((n_envs, 4))
+
+
+    def step(self, actions):
+        """
+        Run one timestep of all the environments.
+        Input
+        -----
+        actions : (n_envs, 3) array, each row (f1, f2, f) as in MassSpringEnv_OptL_HwAsPolicy.step
+
+        Outputs
+        -------
+        (observations, rewards, dones, info)
+        observations : (n_envs, 4) array of y1, v1, y2, v2
+        rewards : (n_envs,) array
+        dones : (n_envs,) boolean array
+        info : an empty dictionary
+        """
+        self.step_cnt += 1
+        actions = np.clip(np.array(actions), self.action_space.low, self.action_space.high)
+        f1 = actions[:, 0]  # interface force on m1
+        f2 = actions[:, 1]  # interface force on m2
+        f = actions[:, 2]   # original action f
+        y1 = self.states[:, 0]
+        f_total_1 = f1 + self.m1 * self.g - self.k * y1
+        a1 = f_total_1 / self.m1
+        f_total_2 = f2 + f + self.m2 * self.g
+        a2 = f_total_2 / self.m2
+
+        if self.integrator == 'midpoint':
+            # both bodies in one substep loop: columns (y1, y2) and (v1, v2)
+            y, v = self.simulate_w_mid_point_euler(self.states[:, 0::2], self.states[:, 1::2], np.stack([a1, a2], axis=1))
+            self.states[:, 0::2] = y
+            self.states[:, 1::2] = v
+        else:
+            self.states[:, 0], self.states[:, 1] = self.simulate_w_linear_integrator(self.states[:, 0], self.states[:, 1], self.m1, f1 + self.m1 * self.g)
+            self.states[:, 2], self.states[:, 3] = self.simulate_w_mid_point_euler(self.states[:, 2], self.states[:, 3], a2)
+
+        obs = self.states.copy()
+        rewards = self.calc_reward(self.states[:, 2], f, self.states[:, 1])
+        dones = np.zeros(self.n_envs, dtype=bool)
+        info = {}
+        return obs, rewards, dones, info
+
+
+    def calc_reward(self, y2, f, v2):
+        pos_penalty = self.reward_alpha * np.abs(y2 - self.h)
+        vel_penalty = self.reward_beta * np.abs(v2)
+
+        force_penalty = get_soft_conditioned_val_batched(self.reward_gamma * np.abs(f), self.reward_gamma * np.abs(self.half_force_range), pos_penalty + vel_penalty, self.reward_switch_pos_vel_thresh, 50.0)
+
+        reward = -pos_penalty - vel_penalty - force_penalty
+        return reward
+
+
+    def reset(self):
+        self.step_cnt = 0
+        return self.reset_idx(np.ones(self.n_envs, dtype=bool))
+
+
+    def reset_idx(self, mask):
+        '''
+        Reset the envs selected by the boolean mask (or indices), returns their (?, 4) observations.
+        '''
+        n = np.arange(self.n_envs)[mask].size
+        v1 = np.random.uniform(-self.half_vel_range, self.half_vel_range, size=n) # vel of both masses
+        y1 = np.random.uniform(0, self.pos_range, size=n)
+
+        self.states[mask] = np.stack([y1, v1, y1 + self.l_avg, v1], axis=1) # y2, v2 just a guess, will be recalculated
+        return self.states[mask].copy()
+
+
+    def set_states(self, states):
+        '''
+        Set the (n_envs, 4) states, e.g. to continue from the states of scalar envs.
+        '''
+        self.states = np.array(states, dtype=np.float64).reshape(self.n_envs, 4)
+        return self.states.copy()
+
+
+
+#################################### Hardware-Conditioned Controller ####################################
+
+
+class MassSpringEnv_OptL_HwConditioned(MassSpringEnv_OptL):
+    '''
+    Action: f
+    observation: y1, v1, hardware (the l's in the search space of params.l_hw, normalized to [0, 1])
+    For a controller that works for any hardware: the hardware is drawn uniformly from the search space
+    of params.l_hw at every reset, or fixed with set_hardware (evaluation of a hardware candidate).
+    '''
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.l_hw = params.l_hw
+        self.hw_fixed = None
+        self.hw = self.l_hw.center
+        self.l = np.sum(self.l_hw.to_elements(self.hw))
+
+        self.observation_space = gym.spaces.Box(
+            low=np.array([0.0, -self.half_vel_range] + [0.0] * self.l_hw.dim),
+            high=np.array([self.pos_range, self.half_vel_range] + [1.0] * self.l_hw.dim),
+            dtype=np.float32) # obs y1, v1 and the normalized hardware
+
+        self.action_space = gym.spaces.Box(
+            low=np.array([-self.half_force_range]),
+            high=np.array([self.half_force_range]),
+            dtype=np.float32)
+
+
+    def set_hardware(self, hw):
+        '''
+        hw (array-like, l_hw.dim): hardware in the search space of params.l_hw, held from the next reset on;
+        None to draw it at every reset again
+        '''
+        self.hw_fixed = None if hw is None else np.clip(np.asarray(hw, dtype=np.float64).reshape(self.l_hw.dim), self.l_hw.lower, self.l_hw.upper)
+
+
+    def get_obs(self):
+        hw_normalized = (self.hw - self.l_hw.lower) / (self.l_hw.upper - self.l_hw.lower)
+        return np.concatenate([[self.y1, self.v1], hw_normalized])
+
+
+    def step(self, action):
+        self.step_cnt += 1
+        action = np.clip(np.asarray(action, dtype=np.float64).reshape(-1), self.action_space.low, self.action_space.high)
+        f = action[0] # input force
+        if self.integrator == 'midpoint':
+            f_total = f + (self.m1 + self.m2) * self.g - self.k * self.y1
+            a = f_total / (self.m1 + self.m2)
+            self.y1, self.v1 = self.simulate_w_mid_point_euler(self.y1, self.v1, a)
+        else:
+            self.y1, self.v1 = self.simulate_w_linear_integrator(self.y1, self.v1, self.m1 + self.m2, f + (self.m1 + self.m2) * self.g)
+        y2 = self.y1 + self.l
+        reward = self.calc_reward(y2, f, self.v1)
+        done = False
+        if self.step_cnt == self.n_steps_per_episode:
+            done = True
+            tabular.record('Env/FinalL', self.l)
+        return self.get_obs(), reward, done, {}
+
+
+    def reset(self):
+        if self.hw_fixed is None:
+            self.hw = np.random.uniform(self.l_hw.lower, self.l_hw.upper)
+        else:
+            self.hw = self.hw_fixed
+        self.l = np.sum(self.l_hw.to_elements(self.hw)) # bar length
+        self.v1 = np.random.uniform(-self.half_vel_range, self.half_vel_range) # vel of both masses
+        self.y1 = np.random.uniform(0, self.pos_range)
+        self.step_cnt = 0
+        return self.get_obs()
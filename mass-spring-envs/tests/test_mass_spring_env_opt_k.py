@@ -1,3 +1,4 @@
+import types
 import unittest
 import numpy as np
 
@@ -6,7 +7,7 @@ import matplotlib.pyplot as plt
 from mass_spring_envs.envs.mass_spring_env_opt_k import MassSpringEnv_OptK_HwAsAction
 from mass_spring_envs.envs.mass_spring_env_opt_k import MassSpringEnv_OptK_HwAsPolicy
 
-from shared_params import params
+from shared_params import params_opt_k as params
 
 
 class Test_MassSpringEnv_OptK_HwAsAction(unittest.TestCase):
@@ -84,6 +85,21 @@ class Test_MassSpringEnv_OptK_HwAsAction(unittest.TestCase):
         plt.plot(y2_arr)
         plt.title('hw_as_action:zero_actions')
 
+    def test_per_episode_hardware(self):
+        # per_episode holds the k's of the first action after reset, the same as per_step with them held by hand
+        env_params = types.SimpleNamespace(**{k: v for k, v in vars(params).items() if not k.startswith('__')})
+        env_params.hw_sampling = 'per_episode'
+        env = MassSpringEnv_OptK_HwAsAction(env_params)
+        for _ in range(2):
+            env.reset()
+            self.env.y1, self.env.v1, self.env.step_cnt = env.y1, env.v1, 0
+            actions = [self.env.action_space.sample() for _ in range(50)]
+            for action in actions:
+                obs, reward, _, _ = env.step(action)
+                obs_ref, reward_ref, _, _ = self.env.step(np.concatenate([action[:1], actions[0][1:]]))
+                np.testing.assert_allclose(obs, obs_ref)
+                self.assertAlmostEqual(reward, reward_ref)
+
 
 class Test_MassSpringEnv_OptK_HwAsPolicy(unittest.TestCase):
     @classmethod
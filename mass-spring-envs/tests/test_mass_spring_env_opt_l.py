@@ -1,11 +1,16 @@
+import types
 import unittest
 import numpy as np
 
 import matplotlib.pyplot as plt
 
 from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwAsAction
+from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwAsAction_Population
 from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwAsPolicy
-
+from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwAsPolicy_Batched
+from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwAsPolicy_SubstepCoupling
+from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwConditioned
+from mass_spring_envs.envs.linear_integrators import LinearIntegrator, spring_mass_matrices
 
 from shared_params import params_opt_l as params
 
@@ -86,6 +91,21 @@ class Test_MassSpringEnv_OptL_HwAsAction(unittest.TestCase):
         plt.plot(y1_arr)
         plt.title('hw_as_action:zero_actions')
 
+    def test_per_episode_hardware(self):
+        # per_episode holds the l's of the first action after reset, the same as per_step with them held by hand
+        env_params = types.SimpleNamespace(**{k: v for k, v in vars(params).items() if not k.startswith('__')})
+        env_params.hw_sampling = 'per_episode'
+        env = MassSpringEnv_OptL_HwAsAction(env_params)
+        for _ in range(2):
+            env.reset()
+            self.env.y1, self.env.v1, self.env.step_cnt = env.y1, env.v1, 0
+            actions = [self.env.action_space.sample() for _ in range(50)]
+            for action in actions:
+                obs, reward, _, _ = env.step(action)
+                obs_ref, reward_ref, _, _ = self.env.step(np.concatenate([action[:1], actions[0][1:]]))
+                np.testing.assert_allclose(obs, obs_ref)
+                self.assertAlmostEqual(reward, reward_ref)
+
 
 class Test_MassSpringEnv_OptL_HwAsPolicy(unittest.TestCase):
     @classmethod
@@ -162,5 +182,162 @@ class Test_MassSpringEnv_OptL_HwAsPolicy(unittest.TestCase):
         plt.plot(y1_arr)
         plt.title('hw_as_policy:zero_actions')
 
+
+class Test_MassSpringEnv_OptL_HwAsPolicy_Batched(unittest.TestCase):
+    def setUp(self):
+        self.n_envs = 8
+        self.batched_env = MassSpringEnv_OptL_HwAsPolicy_Batched(params, self.n_envs)
+        self.envs = [MassSpringEnv_OptL_HwAsPolicy(params) for _ in range(self.n_envs)]
+
+    def test_bit_for_bit(self):
+        n_steps = 1000
+        np.random.seed(0)
+        obs = np.array([env.reset() for env in self.envs])
+        self.batched_env.reset()
+        batched_obs = self.batched_env.set_states(obs)
+
+        for i in range(n_steps):
+            # out-of-range actions check the clipping as well
+            actions = np.random.uniform(-2 * params.half_force_range, 2 * params.half_force_range, size=(self.n_envs, 3))
+            results = [env.step(action) for env, action in zip(self.envs, actions)]
+            batched_obs, batched_rewards, batched_dones, _ = self.batched_env.step(actions)
+            np.testing.assert_array_equal(batched_obs, np.array([r[0] for r in results]))
+            np.testing.assert_array_equal(batched_rewards, np.array([r[1] for r in results]))
+            np.testing.assert_array_equal(batched_dones, np.array([r[2] for r in results]))
+
+    def test_reset(self):
+        obs = self.batched_env.reset()
+        self.assertEqual(obs.shape, (self.n_envs, 4))
+        self.assertTrue(np.all((obs[:, 0] >= 0) & (obs[:, 0] <= params.pos_range)))
+        self.assertTrue(np.all(np.abs(obs[:, 1]) <= params.half_vel_range))
+        mask = np.arange(self.n_envs) % 2 == 0
+        obs_reset = self.batched_env.reset_idx(mask)
+        self.assertEqual(obs_reset.shape, (mask.sum(), 4))
+        np.testing.assert_array_equal(self.batched_env.states[~mask], obs[~mask])
+
+
+class Test_MassSpringEnv_OptL_HwAsPolicy_SubstepCoupling(unittest.TestCase):
+    def make_env(self, **overrides):
+        env_params = types.SimpleNamespace(**{k: v for k, v in vars(params).items() if not k.startswith('__')})
+        env_params.__dict__.update(overrides)
+        env = MassSpringEnv_OptL_HwAsPolicy_SubstepCoupling(env_params)
+        env.reset()
+        env.y1, env.v1, env.y2, env.v2 = 0.1, 0.5, 0.25, 0.5
+        return env
+
+    def rollout(self, env, n_steps):
+        obs_arr = np.zeros((n_steps, 4))
+        for i in range(n_steps):
+            obs, reward, done, info = env.step(np.array([0.2, 1.0]))
+            obs_arr[i] = obs
+        return obs_arr
+
+    def setUp(self):
+        # reference: explicit substeps 50x finer
+        self.obs_ref = self.rollout(self.make_env(interface_integrator='midpoint', dt=params.dt / 50, 
+            n_steps_per_action_interface=50 * params.n_steps_per_action), 100)
+
+    def test_integrators(self):
+        obs_midpoint = self.rollout(self.make_env(interface_integrator='midpoint'), 100)
+        obs_implicit = self.rollout(self.make_env(interface_integrator='implicit_midpoint'), 100)
+        self.assertLess(np.abs(obs_midpoint - self.obs_ref)[:, 0::2].max(), 1e-2)
+        self.assertLess(np.abs(obs_implicit - self.obs_ref)[:, 0::2].max(), 1e-3)
+
+    def test_coarse_control_rate(self):
+        # 10x fewer policy calls for the same simulated time
+        obs = self.rollout(self.make_env(interface_integrator='implicit_midpoint', n_steps_per_action_interface=10 * params.n_steps_per_action), 10)
+        self.assertLess(np.abs(obs - self.obs_ref[9::10])[:, 0::2].max(), 1e-3)
+
+    def test_implicit_large_dt(self):
+        obs = self.rollout(self.make_env(interface_integrator='implicit_midpoint', dt=10 * params.dt), 10)
+        self.assertLess(np.abs(obs - self.obs_ref[9::10])[:, 0::2].max(), 1e-2)
+
+    def test_expm_coarse_control_rate(self):
+        # exact within an action, so the action window can grow without loss
+        obs = self.rollout(self.make_env(interface_integrator='expm', n_steps_per_action_interface=10 * params.n_steps_per_action), 10)
+        self.assertLess(np.abs(obs - self.obs_ref[9::10])[:, 0::2].max(), 1e-4)
+
+
+class Test_LinearIntegrators(unittest.TestCase):
+    def setUp(self):
+        self.k, self.m, self.f = 100.0, 0.2, 0.5
+        self.A, self.B = spring_mass_matrices(self.k, self.m)
+        self.x0 = np.array([0.1, 0.3])
+
+    def exact(self, t):
+        # m y'' = f - k y
+        omega = np.sqrt(self.k / self.m)
+        y_eq = self.f / self.k
+        y = y_eq + (self.x0[0] - y_eq) * np.cos(omega * t) + self.x0[1] / omega * np.sin(omega * t)
+        v = -(self.x0[0] - y_eq) * omega * np.sin(omega * t) + self.x0[1] * np.cos(omega * t)
+        return np.array([y, v])
+
+    def test_expm(self):
+        for dt in [1e-3, 0.05, 1.0]:
+            x = LinearIntegrator('expm', dt, 5)(self.A, self.B, self.x0, [self.f])
+            np.testing.assert_allclose(x, self.exact(5 * dt), atol=1e-10)
+
+    def test_substep_convergence(self):
+        x_exact = self.exact(0.05)
+        for method, order in [('midpoint_substep', 1), ('implicit_midpoint', 2)]:
+            errors = [np.abs(LinearIntegrator(method, 0.05 / n, n)(self.A, self.B, self.x0, [self.f]) - x_exact).max() for n in [50, 100]]
+            self.assertGreater(errors[0] / errors[1], 0.9 * 2**order)
+
+    def test_hw_as_action_expm(self):
+        env_params = types.SimpleNamespace(**{k: v for k, v in vars(params).items() if not k.startswith('__')})
+        results = []
+        for integrator, dt, n_steps in [('midpoint_substep', params.dt / 100, 100 * params.n_steps_per_action),
+                                        ('expm', params.dt, params.n_steps_per_action)]:
+            env_params.integrator, env_params.dt, env_params.n_steps_per_action = integrator, dt, n_steps
+            env = MassSpringEnv_OptL_HwAsAction(env_params)
+            env.reset()
+            env.y1, env.v1 = 0.1, 0.0
+            action = np.array([1.0] + [params.l_ub] * params.n_segments)
+            results.append(np.array([env.step(action)[0] for _ in range(20)]))
+        np.testing.assert_allclose(results[1], results[0], atol=1e-3)
+
+
+class Test_MassSpringEnv_OptL_HwAsAction_Population(unittest.TestCase):
+    def test_rows_match_scalar_envs(self):
+        # each row of the population env is a MassSpringEnv_OptL_HwAsAction, the last obs column its member
+        n_members, n_envs_per_member = 3, 2
+        env = MassSpringEnv_OptL_HwAsAction_Population(params, n_members, n_envs_per_member)
+        obs = env.reset()
+        np.testing.assert_array_equal(obs[:, 2], [0, 0, 1, 1, 2, 2])
+        scalar_envs = [MassSpringEnv_OptL_HwAsAction(params) for _ in range(env.n_envs)]
+        for scalar_env, row in zip(scalar_envs, obs):
+            scalar_env.reset()
+            scalar_env.y1, scalar_env.v1 = row[0], row[1]
+        for _ in range(50):
+            actions = np.array([env.action_space.sample() for _ in range(env.n_envs)], dtype=np.float64)
+            obs, rewards, _, _ = env.step(actions)
+            for idx, scalar_env in enumerate(scalar_envs):
+                obs_ref, reward_ref, _, _ = scalar_env.step(actions[idx])
+                np.testing.assert_array_equal(obs[idx, :2], obs_ref)
+                self.assertEqual(rewards[idx], reward_ref)
+
+
+class Test_MassSpringEnv_OptL_HwConditioned(unittest.TestCase):
+    def setUp(self):
+        self.env = MassSpringEnv_OptL_HwConditioned(params)
+
+    def test_hardware_in_obs(self):
+        # drawn hardware in the search space, observed normalized to [0, 1]
+        for _ in range(20):
+            obs = self.env.reset()
+            self.assertTrue(np.all(self.env.hw >= params.l_hw.lower) and np.all(self.env.hw <= params.l_hw.upper))
+            self.assertTrue(np.all(obs[2:] >= 0.0) and np.all(obs[2:] <= 1.0))
+            self.assertAlmostEqual(self.env.l, np.sum(params.l_hw.to_elements(self.env.hw)))
+
+    def test_set_hardware(self):
+        self.env.set_hardware(params.l_hw.upper)
+        for _ in range(3):
+            obs = self.env.reset()
+            np.testing.assert_allclose(obs[2:], 1.0)
+            obs, _, _, _ = self.env.step(self.env.action_space.sample())
+            np.testing.assert_allclose(obs[2:], 1.0)
+        self.env.set_hardware(None)
+        self.assertFalse(np.allclose(self.env.reset()[2:], 1.0))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -8,18 +8,37 @@ Aurelia Guy
 Benjamin Recht 
 '''
 
+import os
+import re
+import pickle
 import numpy as np
 import time
 
 import gym
 from dowel import logger, tabular
 
-from my_garage.algos import utils
+from my_garage.algos.filter import get_filter
 from my_garage.algos.optimizers import SGD
 from my_garage.algos.shared_noise import create_shared_noise
 from my_garage.algos.shared_noise import SharedNoiseTable
 
 
+def get_param_mask(policy, perturbed_params=None):
+    """ 
+    Boolean mask over policy.get_param_values() selecting the variables whose name matches
+    one of the regular expressions in perturbed_params (e.g. ['kernel', 'bias', 'k_pre'] for
+    the MLP weights and the spring stiffnesses, leaving out log_std). All parameters if None.
+    """
+    params = policy.get_params()
+    sizes = [int(np.prod(param.shape.as_list())) for param in params]
+    if perturbed_params is None:
+        return np.ones(sum(sizes), dtype=bool)
+    mask = np.concatenate([np.full(size, any(re.search(pattern, param.name) for pattern in perturbed_params))
+                           for param, size in zip(params, sizes)])
+    assert np.any(mask), 'no policy parameter matches {}'.format(perturbed_params)
+    return mask
+
+
 class Worker(object):
     """ 
     Object class for parallel rollout generation.
@@ -33,7 +52,10 @@ class Worker(object):
                  deltas=None,
                  rollout_length=1000,
                  delta_std=0.02,
-                 discount=0.99):
+                 discount=0.99,
+                 observation_filter='NoFilter',
+                 param_mask=None,
+                 deterministic=False):
 
         # initialize OpenAI environment for each worker
         if env is not None:
@@ -55,6 +77,13 @@ class Worker(object):
         self.delta_std = delta_std
         self.rollout_length = rollout_length
         self.discount = discount
+        # only the parameters in param_mask are perturbed, and rollouts take the mean action if deterministic
+        self.param_mask = param_mask
+        self.deterministic = deterministic
+
+        # the workers share the policy object in this process, so each worker keeps
+        # its own filter and installs it on the policy for its rollouts
+        self.observation_filter = get_filter(observation_filter, shape=self.env.observation_space.shape)
 
 
     def get_weights_plus_stats(self):
@@ -78,8 +107,11 @@ class Worker(object):
         steps = 0
 
         ob = self.env.reset()
+        self.policy.reset()
         for i in range(rollout_length):
-            action, _ = self.policy.get_actions(np.array([ob]))
+            action, agent_info = self.policy.get_actions(np.array([ob]))
+            if self.deterministic:
+                action = agent_info['mean']
             ob, reward, done, _ = self.env.step(action[0])
             steps += 1
             total_reward_list.append(reward - shift)
@@ -100,6 +132,7 @@ class Worker(object):
 
         rollout_rewards, discounted_rewards, deltas_idx = [], [], []
         steps = 0
+        self.policy.observation_filter = self.observation_filter
 
         for i in range(num_rollouts):
 
@@ -117,13 +150,17 @@ class Worker(object):
                 discounted_rewards.append(discounted_reward)
                 
             else:
-                idx, delta = self.deltas.get_delta(w_policy.size)
-             
-                delta = (self.delta_std * delta).reshape(w_policy.shape)
+                if self.param_mask is None:
+                    idx, delta = self.deltas.get_delta(w_policy.size)
+                    delta = (self.delta_std * delta).reshape(w_policy.shape)
+                else:
+                    idx, delta_masked = self.deltas.get_delta(int(np.sum(self.param_mask)))
+                    delta = np.zeros(w_policy.shape)
+                    delta[self.param_mask] = self.delta_std * delta_masked
                 deltas_idx.append(idx)
 
                 # set to true so that state statistics are updated 
-                # self.policy.update_filter = True
+                self.policy.update_filter = True
 
                 # compute reward and number of timesteps used for positive perturbation rollout
                 self.policy.set_param_values(w_policy + delta)
@@ -140,17 +177,17 @@ class Worker(object):
         return {'deltas_idx': deltas_idx, 'rollout_rewards': rollout_rewards, 'discounted_rewards': discounted_rewards, "steps" : steps}
     
     def stats_increment(self):
-        self.policy.observation_filter.stats_increment()
+        self.observation_filter.stats_increment()
         return
 
     def get_weights(self):
         return self.policy.get_weights()
     
     def get_filter(self):
-        return self.policy.observation_filter
+        return self.observation_filter
 
     def sync_filter(self, other):
-        self.policy.observation_filter.sync(other)
+        self.observation_filter.sync(other)
         return
 
 
@@ -174,6 +211,9 @@ class ARS(object):
                  step_size=0.01,
                  shift='constant zero',
                  seed=123,
+                 observation_filter='NoFilter',
+                 perturbed_params=None,
+                 deterministic=False,
                  ):
 
 
@@ -192,6 +232,7 @@ class ARS(object):
         self.shift = shift
         self.max_past_avg_reward = float('-inf')
         self.num_episodes_used = float('inf')
+        self.iteration = 0 # number of finished iterations, restored by load_checkpoint
 
         
         # create shared table for storing noise
@@ -204,6 +245,10 @@ class ARS(object):
         print('Initializing workers.') 
         self.num_workers = num_workers
 
+        # parameter subspace searched by ARS, see get_param_mask
+        self.param_mask = get_param_mask(policy, perturbed_params)
+        print('Perturbing {} of {} policy parameters.'.format(np.sum(self.param_mask), self.param_mask.size))
+
         self.workers = [Worker(seed + 7 * i,
                                       env_name=env_name,
                                       env=env,
@@ -212,36 +257,31 @@ class ARS(object):
                                       deltas=deltas_id,
                                       rollout_length=rollout_length,
                                       delta_std=delta_std,
-                                      discount=discount)
+                                      discount=discount,
+                                      observation_filter=observation_filter,
+                                      param_mask=self.param_mask,
+                                      deterministic=deterministic)
                         for i in range(num_workers)]
 
         # initialize policy 
         if policy_params is None:
             self.policy = policy
             self.w_policy = self.policy.get_param_values()
+            self.observation_filter = get_filter(observation_filter, shape=env.observation_space.shape)
+            self.policy.observation_filter = self.observation_filter
 
         else:
             raise NotImplementedError
             
         # initialize optimization algorithm
-        self.optimizer = SGD(self.w_policy, self.step_size)        
+        self.optimizer = SGD(self.w_policy[self.param_mask], self.step_size)        
         print("Initialization of ARS complete.")
 
 
-    def aggregate_rollouts(self, num_rollouts = None, evaluate = False):
+    def generate_rollouts(self, num_deltas, evaluate = False):
         """ 
-        Aggregate update step from rollouts generated in parallel.
+        Rollouts of num_deltas directions spread over the workers, a list of do_rollouts results.
         """
-
-        if num_rollouts is None:
-            num_deltas = self.num_deltas
-        else:
-            num_deltas = num_rollouts
-            
-        # put policy weights in the object store
-        # policy_id = ray.put(self.w_policy)
-
-        t1 = time.time()
         num_rollouts = int(num_deltas / self.num_workers)
             
         # parallel generation of rollouts
@@ -255,20 +295,28 @@ class ARS(object):
                                                  shift = self.shift,
                                                  evaluate=evaluate) for worker in self.workers[:(num_deltas % self.num_workers)]]
 
-        # gather results 
-        results_one = rollout_ids_one
-        results_two = rollout_ids_two
+        return rollout_ids_one + rollout_ids_two
 
-        rollout_rewards, discounted_rewards, deltas_idx = [], [], []
 
-        for result in results_one:
-            if not evaluate:
-                self.timesteps += result["steps"]
-            deltas_idx += result['deltas_idx']
-            rollout_rewards += result['rollout_rewards']
-            discounted_rewards += result['discounted_rewards']
+    def aggregate_rollouts(self, num_rollouts = None, evaluate = False):
+        """ 
+        Aggregate update step from rollouts generated in parallel.
+        """
+
+        if num_rollouts is None:
+            num_deltas = self.num_deltas
+        else:
+            num_deltas = num_rollouts
+            
+        # put policy weights in the object store
+        # policy_id = ray.put(self.w_policy)
+
+        t1 = time.time()
+        results = self.generate_rollouts(num_deltas, evaluate=evaluate)
 
-        for result in results_two:
+        rollout_rewards, discounted_rewards, deltas_idx = [], [], []
+
+        for result in results:
             if not evaluate:
                 self.timesteps += result["steps"]
             deltas_idx += result['deltas_idx']
@@ -306,11 +354,10 @@ class ARS(object):
         rollout_rewards /= np.std(rollout_rewards)
 
         t1 = time.time()
-        # aggregate rollouts to form g_hat, the gradient used to compute SGD step
-        g_hat, count = utils.batched_weighted_sum(rollout_rewards[:,0] - rollout_rewards[:,1],
-                                                  (self.deltas.get(idx, self.w_policy.size)
-                                                   for idx in deltas_idx),
-                                                  batch_size = 500)
+        # aggregate rollouts to form g_hat, the gradient used to compute SGD step:
+        # the used noise slices as one (deltas_used, dim) matrix and a single matrix-vector product
+        deltas = self.deltas.get_batch(deltas_idx, int(np.sum(self.param_mask)))
+        g_hat = (rollout_rewards[:,0] - rollout_rewards[:,1]).dot(deltas)
         g_hat /= deltas_idx.size
         t2 = time.time()
         print('time to aggregate rollouts', t2 - t1)
@@ -324,21 +371,103 @@ class ARS(object):
         
         g_hat = self.aggregate_rollouts(self.num_deltas)                    
         print("Euclidean norm of update step:", np.linalg.norm(g_hat))
-        self.w_policy -= self.optimizer._compute_step(g_hat).reshape(self.w_policy.shape)
+        self.w_policy[self.param_mask] -= self.optimizer._compute_step(g_hat)
+        self.sync_filters()
+        return
+
+    def sync_filters(self):
+        """ 
+        Merge the observation statistics the workers collected in this iteration
+        into the master filter and send the result back, once per iteration.
+        Only the O(obs_dim) running statistics are exchanged.
+        """
+        for worker in self.workers:
+            self.observation_filter.update(worker.get_filter())
+        self.observation_filter.stats_increment()
+        # make sure master filter buffer is clear
+        self.observation_filter.clear_buffer()
+        for worker in self.workers:
+            worker.sync_filter(self.observation_filter)
+            worker.stats_increment()
+        self.policy.observation_filter = self.observation_filter
+        self.policy.update_filter = False
+        mean, std = self.observation_filter.get_stats()
+        if mean is not None:
+            tabular.record('ObsFilter/Count', self.observation_filter.rs.n)
+            tabular.record('ObsFilter/MeanNorm', np.linalg.norm(mean))
         return
 
-    def train(self, num_iter, dump=False):
+    def save_checkpoint(self, path):
+        """ 
+        Save everything needed to continue training exactly where it stopped: policy weights,
+        optimizer, observation filter, iteration and timestep counters, and the RNG states of the
+        noise tables and of numpy (used by the envs and the action sampling). The file is written
+        to a temporary file first and then renamed, so a crash never leaves a truncated checkpoint.
+        """
+        checkpoint = dict(iteration=self.iteration,
+                          timesteps=self.timesteps,
+                          w_policy=self.w_policy,
+                          optimizer=self.optimizer,
+                          observation_filter=self.observation_filter,
+                          deltas_rng_state=self.deltas.rg.get_state(),
+                          workers_rng_states=[worker.deltas.rg.get_state() for worker in self.workers],
+                          np_rng_state=np.random.get_state(),
+                          max_past_avg_reward=self.max_past_avg_reward)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def load_checkpoint(self, path):
+        """ 
+        Restore the state saved by save_checkpoint, the ARS object must be constructed with
+        the same policy, num_workers and noise table.
+        """
+        with open(path, 'rb') as f:
+            checkpoint = pickle.load(f)
+        assert len(checkpoint['workers_rng_states']) == self.num_workers, 'checkpoint was saved with {} workers'.format(len(checkpoint['workers_rng_states']))
+        assert checkpoint['w_policy'].shape == self.w_policy.shape, 'checkpoint was saved for another policy'
+        self.iteration = checkpoint['iteration']
+        self.timesteps = checkpoint['timesteps']
+        self.w_policy = checkpoint['w_policy']
+        self.optimizer = checkpoint['optimizer']
+        self.max_past_avg_reward = checkpoint['max_past_avg_reward']
+        self.deltas.rg.set_state(checkpoint['deltas_rng_state'])
+        for worker, state in zip(self.workers, checkpoint['workers_rng_states']):
+            worker.deltas.rg.set_state(state)
+        np.random.set_state(checkpoint['np_rng_state'])
+        self.observation_filter = checkpoint['observation_filter']
+        for worker in self.workers:
+            worker.sync_filter(self.observation_filter)
+            worker.stats_increment()
+        self.policy.observation_filter = self.observation_filter
+        self.policy.set_param_values(self.w_policy)
+        print('Resumed from {} after iteration {}'.format(path, self.iteration - 1))
+
+    def train(self, num_iter, dump=False, checkpoint_path=None, checkpoint_interval=1):
+        """ 
+        Run the iterations self.iteration, ..., num_iter - 1 (all of them unless resumed from
+        a checkpoint), saving a checkpoint to checkpoint_path every checkpoint_interval
+        iterations and after the last one if checkpoint_path is given.
+        """
 
         start = time.time()
-        for i in range(num_iter):
+        for i in range(self.iteration, num_iter):
             with logger.prefix(' | Iteration {} |'.format(i)):
                 t1 = time.time()
                 self.train_step()
+                self.iteration = i + 1
                 t2 = time.time()
                 print('total time of one step', t2 - t1)           
                 print('iter ', i,' done')
                 if dump:
+                    tabular.record('Iteration', i)
+                    tabular.record('TotalEnvSteps', self.timesteps)
                     logger.log(tabular)
                     logger.dump_all(i)
                     tabular.clear()
-        return 
\ No newline at end of file
+                if checkpoint_path is not None and (self.iteration % checkpoint_interval == 0 or self.iteration == num_iter):
+                    self.save_checkpoint(checkpoint_path)
+        return 
@@ -0,0 +1,267 @@
+'''
+Multi-node ARS: a coordinator and rollout workers talking over TCP (multiprocessing.connection).
+
+Thanks to the shared noise table, which every node rebuilds from its fixed seed, only small
+messages cross the network:
+
+    coordinator -> worker:  w_policy, the observation filter statistics, a number of directions
+                            and a seed for drawing their noise table indices
+    worker -> coordinator:  noise table indices, (pos_reward, neg_reward) pairs, step counts
+                            and the O(obs_dim) running statistics of the observations seen
+
+Every iteration the directions are split into tasks handed to idle workers. A task that has
+not come back after task_timeout seconds is handed to another idle worker as well, the first
+result wins. Tasks of a worker whose connection breaks are queued again. Workers may join at
+any time (also on other machines), so ARS scales past the cores of one box.
+
+Coordinator (in a launcher, instead of ARS):
+
+    ars = DistributedARS(address=('0.0.0.0', 6000), authkey=b'...', env_name=None, env=env,
+                         policy=policy, policy_params=None, seed=seed, **params.ars_kwargs)
+    spawn_local_nodes(__file__, 4, ('localhost', 6000), b'...')  # optional stand-in nodes
+    ars.train(n_iter)
+
+Worker (the same env and policy construction as the coordinator):
+
+    run_ars_worker(('host', 6000), b'...', env, policy)
+'''
+
+import os
+import sys
+import time
+import secrets
+import itertools
+import threading
+import subprocess
+from multiprocessing.connection import Listener, Client, wait
+
+import numpy as np
+
+from my_garage.algos.ars import ARS, Worker
+from my_garage.algos.shared_noise import create_shared_noise
+
+
+AUTHKEY_ENV_VAR = 'HWASP_ARS_AUTHKEY'
+
+
+def parse_address(address):
+    '''
+    'host:port' -> (host, port)
+    '''
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def get_authkey(generate=False):
+    '''
+    Shared secret of the coordinator and its workers, from the environment variable HWASP_ARS_AUTHKEY.
+    With generate, a random one is set if there is none (enough when all nodes are spawned locally).
+    '''
+    if generate and not os.environ.get(AUTHKEY_ENV_VAR):
+        os.environ[AUTHKEY_ENV_VAR] = secrets.token_hex(16)
+    authkey = os.environ.get(AUTHKEY_ENV_VAR)
+    assert authkey, 'set {} to the same secret on the coordinator and on the workers'.format(AUTHKEY_ENV_VAR)
+    return authkey.encode()
+
+
+class DistributedARS(ARS):
+    '''
+    ARS whose rollouts are generated by run_ars_worker processes connected over TCP.
+    The update, the filter statistics and the checkpoints are the ones of ARS.
+
+    Args:
+        address (tuple): (host, port) the coordinator listens on
+        authkey (bytes): shared secret of the coordinator and the workers
+        task_timeout (float): seconds after which an outstanding task is handed to another idle worker too
+        deltas_per_task (int): directions per task, defaults to num_deltas / (4 * number of connected workers)
+        min_nodes (int): number of workers to wait for before the first iteration
+        **ars_kwargs: as ARS, num_workers is ignored (no local workers)
+    '''
+
+    def __init__(self, address, authkey, task_timeout=60.0, deltas_per_task=None, min_nodes=1, **ars_kwargs):
+        ars_kwargs['num_workers'] = 0
+        super().__init__(**ars_kwargs)
+        self.worker_config = dict(delta_std=self.delta_std,
+                                  rollout_length=self.rollout_length,
+                                  discount=ars_kwargs.get('discount', 0.99),
+                                  observation_filter=ars_kwargs.get('observation_filter', 'NoFilter'),
+                                  param_mask=self.param_mask,
+                                  deterministic=ars_kwargs.get('deterministic', False),
+                                  seed=ars_kwargs.get('seed', 123))
+        self.task_timeout = task_timeout
+        self.deltas_per_task = deltas_per_task
+        self.min_nodes = min_nodes
+        self._filter_buffers = []
+        self._generation = 0 # iteration counter of the tasks, results of earlier ones are dropped
+        self._running = {} # conn -> (generation, task, dispatch time)
+
+        self._listener = Listener(address, authkey=authkey)
+        self._connections = []
+        self._new_connections = []
+        self._lock = threading.Lock()
+        self._node_ids = itertools.count() # never reused, the noise seed of a worker depends on its node id
+        self._accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._accept_thread.start()
+        print('ARS coordinator listening on {}:{}'.format(*self._listener.address))
+
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError: # listener closed
+                return
+            except Exception as e: # e.g. a wrong authkey, keep serving the others
+                print('Rejected an ARS worker connection: {}'.format(e))
+                continue
+            node_id = next(self._node_ids)
+            conn.send(('config', dict(self.worker_config, node_id=node_id)))
+            with self._lock:
+                self._new_connections.append(conn)
+
+
+    def _update_connections(self):
+        with self._lock:
+            self._connections += self._new_connections
+            self._new_connections = []
+        return self._connections
+
+
+    def _drop(self, conn):
+        self._connections.remove(conn)
+        try:
+            conn.close()
+        except OSError:
+            pass
+        print('Lost an ARS worker, {} left.'.format(len(self._connections)))
+
+
+    def generate_rollouts(self, num_deltas, evaluate = False):
+        '''
+        Hand out num_deltas directions to the connected workers, re-dispatch stragglers and the tasks
+        of broken connections, and return the results in task order.
+        '''
+        assert not evaluate, 'evaluation rollouts are not distributed'
+        while len(self._update_connections()) < (self.min_nodes if self._generation == 0 else 1):
+            time.sleep(0.1)
+
+        deltas_per_task = self.deltas_per_task or max(1, int(np.ceil(num_deltas / (4 * len(self._connections)))))
+        sizes = [deltas_per_task] * (num_deltas // deltas_per_task) + ([num_deltas % deltas_per_task] if num_deltas % deltas_per_task else [])
+        # the task seeds come from the coordinator's noise RNG, so the directions do not depend on which worker runs a task
+        seeds = [self.deltas.rg.randint(2**31 - 1) for _ in sizes]
+        self._generation += 1
+        results = [None] * len(sizes)
+        pending = []
+        self._filter_buffers = []
+
+        while any(result is None for result in results):
+            connections = self._update_connections()
+            # queue the tasks not in flight, at first all of them, later those of broken connections
+            in_flight = [task for generation, task, _ in self._running.values() if generation == self._generation]
+            pending += [task for task, result in enumerate(results) if result is None and task not in pending and task not in in_flight]
+
+            now = time.time()
+            for conn in [conn for conn in connections if conn not in self._running]:
+                if pending:
+                    task = pending.pop(0)
+                else: # hand a straggler to an idle worker as well, at most two copies per task
+                    stragglers = [(t0, task) for generation, task, t0 in self._running.values()
+                                  if generation == self._generation and now - t0 > self.task_timeout and in_flight.count(task) == 1]
+                    if not stragglers:
+                        break
+                    t0, task = min(stragglers)
+                    print('Re-dispatching ARS task {} after {:.0f} s'.format(task, now - t0))
+                in_flight.append(task)
+                try:
+                    conn.send(('rollouts', (self._generation, task), self.w_policy, self.observation_filter, sizes[task], seeds[task], self.shift))
+                    self._running[conn] = (self._generation, task, now)
+                except (OSError, EOFError):
+                    self._drop(conn) # its task is queued again in the next pass
+
+            if not self._running:
+                time.sleep(0.1)
+                continue
+            for conn in wait(list(self._running), timeout=1.0):
+                del self._running[conn]
+                try:
+                    _, (generation, task), result, filter_buffer = conn.recv()
+                except (OSError, EOFError):
+                    self._drop(conn)
+                    continue
+                # the first result of a re-dispatched task wins, late ones of earlier iterations are dropped
+                if generation == self._generation and results[task] is None:
+                    results[task] = result
+                    if filter_buffer is not None:
+                        self._filter_buffers.append(filter_buffer)
+        return results
+
+
+    def sync_filters(self):
+        for filter_buffer in self._filter_buffers:
+            self.observation_filter.rs.update(filter_buffer)
+        self._filter_buffers = []
+        super().sync_filters()
+
+
+    def close(self):
+        for conn in self._update_connections():
+            try:
+                conn.send(('close',))
+                conn.close()
+            except OSError:
+                pass
+        self._listener.close()
+
+
+def run_ars_worker(address, authkey, env, policy, connect_timeout=60.0):
+    '''
+    Serve rollout tasks of a DistributedARS coordinator until it closes the connection.
+    env and policy must be built as on the coordinator (same parameter layout).
+    '''
+    t0 = time.time()
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            if time.time() - t0 > connect_timeout:
+                raise
+            time.sleep(0.5)
+    _, config = conn.recv()
+    print('Connected to the ARS coordinator at {}:{} as node {}'.format(address[0], address[1], config['node_id']))
+    worker = Worker(config['seed'] + 7 * config['node_id'],
+                    env=env,
+                    policy=policy,
+                    deltas=create_shared_noise(),
+                    rollout_length=config['rollout_length'],
+                    delta_std=config['delta_std'],
+                    discount=config['discount'],
+                    observation_filter=config['observation_filter'],
+                    param_mask=config['param_mask'],
+                    deterministic=config['deterministic'])
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message[0] == 'close':
+            break
+        _, task, w_policy, observation_filter, num_rollouts, seed, shift = message
+        worker.deltas.rg.seed(seed)
+        worker.sync_filter(observation_filter)
+        worker.stats_increment()
+        result = worker.do_rollouts(w_policy, num_rollouts=num_rollouts, shift=shift)
+        conn.send(('result', task, result, getattr(worker.get_filter(), 'buffer', None)))
+    conn.close()
+
+
+def spawn_local_nodes(script, n_nodes, address, authkey, args=()):
+    '''
+    Start n_nodes local worker processes as stand-ins for remote nodes: `python script --ars_worker
+    --ars_address host:port *args` with the authkey passed in the environment. Returns the Popen objects.
+    '''
+    env = dict(os.environ, **{AUTHKEY_ENV_VAR: authkey.decode()})
+    address = '{}:{}'.format(*address)
+    return [subprocess.Popen([sys.executable, script, '--ars_worker', '--ars_address', address] + list(args), env=env)
+            for _ in range(n_nodes)]
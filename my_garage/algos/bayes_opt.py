@@ -0,0 +1,254 @@
+'''
+Gaussian-process Bayesian optimization for expensive objectives over a bounded box, e.g. the hardware
+outer loop of cmaes_ppo_opt_*, where every evaluation is a full inner PPO training.
+
+CMA-ES (popsize 8, maxiter 5) gets 40 evaluations and uses each of them only through the ranking
+of its generation. BayesOpt fits a GP to all evaluations so far and proposes the next ones by
+expected improvement, which needs far fewer evaluations on smooth, low-dimensional objectives, i.e.
+with params.hw_parameterization 'total' (where cma needs at least 2 dimensions) or a few 'groups'.
+Beyond ~10 dimensions a GP with this budget is no better than CMA-ES
+(launchers/benchmark/outer_loop_benchmark.py).
+The interface follows cma's ask / tell, and ask() returns batch_size candidates at a time so the
+inner trainings of a batch can run in parallel:
+
+    bo = BayesOpt(lower, upper, batch_size=4, n_init=8, seed=1)
+    while bo.n_evals < max_evals:
+        candidates = bo.ask()
+        bo.tell(candidates, [objective(x) for x in candidates]) # minimized
+    bo.best_x, bo.best_f
+
+    GP          : Matern 5/2 kernel with one length scale per dimension and a noise term (the inner
+                  RL returns are noisy), on the box scaled to [0, 1]^d and the standardized values.
+                  The hyperparameters maximize the marginal likelihood (L-BFGS-B, several restarts).
+    initial     : n_init points of a Latin hypercube before the GP is used
+    batch (q)   : kriging believer, each candidate is added to the GP with its posterior mean as a
+                  fantasized value before the next one is chosen, so a batch spreads out
+    acquisition : expected improvement over the best value so far, maximized from random points
+                  and the best of them refined by L-BFGS-B
+'''
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve
+from scipy.optimize import minimize
+from scipy.stats import norm
+
+
+def matern52(x1, x2, length_scales, signal_var):
+    d = np.sqrt(np.sum(((x1[:, None, :] - x2[None, :, :]) / length_scales)**2, axis=-1))
+    return signal_var * (1 + np.sqrt(5) * d + 5.0 / 3.0 * d**2) * np.exp(-np.sqrt(5) * d)
+
+
+class GaussianProcess:
+    '''
+    GP regression with a Matern 5/2 ARD kernel and a zero mean on standardized values.
+    log hyperparameters: [log signal_var, log length_scales (d), log noise_var]
+    '''
+    LOG_BOUNDS = dict(signal_var=(np.log(1e-2), np.log(1e4)), length_scale=(np.log(1e-2), np.log(1e2)), noise_var=(np.log(1e-6), np.log(1.0)))
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.log_hyper = np.concatenate([[0.0], np.full(dim, np.log(0.3)), [np.log(1e-2)]])
+
+
+    @property
+    def bounds(self):
+        b = GaussianProcess.LOG_BOUNDS
+        return [b['signal_var']] + [b['length_scale']] * self.dim + [b['noise_var']]
+
+
+    def _unpack(self, log_hyper):
+        return np.exp(log_hyper[0]), np.exp(log_hyper[1:-1]), np.exp(log_hyper[-1])
+
+
+    def _neg_log_marginal_likelihood(self, log_hyper, x, y):
+        signal_var, length_scales, noise_var = self._unpack(log_hyper)
+        K = matern52(x, x, length_scales, signal_var) + (noise_var + 1e-8) * np.eye(len(x))
+        try:
+            L = cho_factor(K, lower=True)
+        except np.linalg.LinAlgError:
+            return 1e10
+        alpha = cho_solve(L, y)
+        return 0.5 * y.dot(alpha) + np.sum(np.log(np.diag(L[0]))) + 0.5 * len(x) * np.log(2 * np.pi)
+
+
+    def fit(self, x, y, n_restarts=3, random_state=None, optimize=True):
+        '''
+        x (n, d) in [0, 1]^d, y (n,) standardized
+        '''
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        if optimize:
+            random_state = random_state or np.random
+            bounds = np.array(self.bounds)
+            starts = [self.log_hyper] + [random_state.uniform(bounds[:, 0], bounds[:, 1]) for _ in range(n_restarts)]
+            best = None
+            for start in starts:
+                res = minimize(self._neg_log_marginal_likelihood, start, args=(self.x, self.y), method='L-BFGS-B', bounds=self.bounds)
+                if best is None or res.fun < best.fun:
+                    best = res
+            self.log_hyper = best.x
+        signal_var, length_scales, noise_var = self._unpack(self.log_hyper)
+        K = matern52(self.x, self.x, length_scales, signal_var) + (noise_var + 1e-8) * np.eye(len(self.x))
+        self._L = cho_factor(K, lower=True)
+        self._alpha = cho_solve(self._L, self.y)
+        return self
+
+
+    def predict(self, x):
+        '''
+        posterior mean and std of the latent function at x (m, d)
+        '''
+        signal_var, length_scales, _ = self._unpack(self.log_hyper)
+        k = matern52(np.atleast_2d(x), self.x, length_scales, signal_var)
+        mean = k.dot(self._alpha)
+        var = signal_var - np.sum(k * cho_solve(self._L, k.T).T, axis=1)
+        return mean, np.sqrt(np.maximum(var, 1e-12))
+
+
+def expected_improvement(mean, std, best, xi=0.01):
+    '''
+    EI of a minimization below best
+    '''
+    improvement = best - mean - xi
+    z = improvement / std
+    return improvement * norm.cdf(z) + std * norm.pdf(z)
+
+
+def latin_hypercube(n, dim, random_state):
+    return (np.stack([random_state.permutation(n) for _ in range(dim)], axis=1) + random_state.uniform(size=(n, dim))) / n
+
+
+class BayesOpt:
+    '''
+    Args:
+        lower, upper (array-like): bounds of the search box
+        batch_size (int): q, candidates returned by ask()
+        n_init (int): Latin hypercube points before the GP is used (at least 2)
+        n_restarts (int): random restarts of the GP hyperparameter fit
+        n_acq_samples (int): random points for the acquisition maximization
+        xi (float): EI exploration margin, in units of the std of the values
+        seed (int)
+    '''
+    def __init__(self, lower, upper, batch_size=4, n_init=8, n_restarts=3, n_acq_samples=2000, xi=0.01, seed=None):
+        self.lower = np.asarray(lower, dtype=np.float64)
+        self.upper = np.asarray(upper, dtype=np.float64)
+        assert self.lower.shape == self.upper.shape and np.all(self.upper > self.lower), 'invalid bounds'
+        self.dim = self.lower.size
+        self.batch_size = batch_size
+        self.n_init = max(n_init, 2)
+        self.n_restarts = n_restarts
+        self.n_acq_samples = n_acq_samples
+        self.xi = xi
+        self.random_state = np.random.RandomState(seed)
+        self.gp = GaussianProcess(self.dim)
+        self.X = np.zeros((0, self.dim)) # evaluated points in the box
+        self.F = np.zeros(0)             # their values
+        self._init_design = self.lower + latin_hypercube(self.n_init, self.dim, self.random_state) * (self.upper - self.lower)
+
+
+    @property
+    def n_evals(self):
+        return len(self.F)
+
+
+    @property
+    def best_x(self):
+        return self.X[np.argmin(self.F)]
+
+
+    @property
+    def best_f(self):
+        return float(np.min(self.F))
+
+
+    def _to_unit(self, x):
+        return (np.asarray(x) - self.lower) / (self.upper - self.lower)
+
+
+    def _from_unit(self, u):
+        return self.lower + np.clip(u, 0, 1) * (self.upper - self.lower)
+
+
+    def _maximize_acquisition(self, gp, best):
+        def neg_ei(u):
+            mean, std = gp.predict(u[None])
+            return -expected_improvement(mean, std, best, self.xi)[0]
+
+        u = self.random_state.uniform(size=(self.n_acq_samples, self.dim))
+        mean, std = gp.predict(u)
+        ei = expected_improvement(mean, std, best, self.xi)
+        best_u, best_ei = u[np.argmax(ei)], np.max(ei)
+        for start in u[np.argsort(-ei)[:5]]:
+            res = minimize(neg_ei, start, method='L-BFGS-B', bounds=[(0, 1)] * self.dim)
+            if -res.fun > best_ei:
+                best_u, best_ei = res.x, -res.fun
+        return np.clip(best_u, 0, 1)
+
+
+    def _fantasize(self, u, y, c, gp):
+        # kriging believer: the posterior mean as the value of the pending candidate c, same hyperparameters
+        u, y = np.vstack([u, c]), np.append(y, gp.predict(c[None])[0])
+        gp = GaussianProcess(self.dim)
+        gp.log_hyper = self.gp.log_hyper
+        return u, y, gp.fit(u, y, optimize=False)
+
+
+    def ask(self):
+        '''
+        batch_size candidates, the Latin hypercube first, then by expected improvement
+        '''
+        candidates = list(self._init_design[self.n_evals:self.n_evals + self.batch_size])
+        if len(candidates) == self.batch_size:
+            return candidates
+        if self.n_evals < 2: # too few values for a GP
+            while len(candidates) < self.batch_size:
+                candidates.append(self._from_unit(self.random_state.uniform(size=self.dim)))
+            return candidates
+
+        # standardized values, the GP hyperparameters are refit once per batch
+        u, y = self._to_unit(self.X), (self.F - np.mean(self.F)) / (np.std(self.F) + 1e-12)
+        gp = self.gp.fit(u, y, n_restarts=self.n_restarts, random_state=self.random_state)
+        best = np.min(y)
+        for c in candidates: # the rest of the Latin hypercube in this batch is pending
+            u, y, gp = self._fantasize(u, y, self._to_unit(c), gp)
+        while len(candidates) < self.batch_size:
+            c = self._maximize_acquisition(gp, best)
+            candidates.append(self._from_unit(c))
+            u, y, gp = self._fantasize(u, y, c, gp)
+        return candidates
+
+
+    def tell(self, solutions, values):
+        solutions = np.atleast_2d(np.asarray(solutions, dtype=np.float64))
+        assert solutions.shape == (len(values), self.dim)
+        self.X = np.vstack([self.X, solutions])
+        self.F = np.append(self.F, np.asarray(values, dtype=np.float64))
+
+
+    def optimize(self, objective, max_evals, args=(), n_workers=None, callback=None):
+        '''
+        Evaluate objective(x, *args) batch by batch until max_evals, the candidates of a batch in
+        n_workers threads (default batch_size), e.g. an objective that runs a training subprocess.
+        '''
+        n_workers = n_workers or self.batch_size
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            while self.n_evals < max_evals:
+                candidates = self.ask()[:max_evals - self.n_evals]
+                values = list(executor.map(lambda x: objective(x, *args), candidates))
+                self.tell(candidates, values)
+                if callback is not None:
+                    callback(self)
+        return self
+
+
+    def save(self, path):
+        '''
+        json with the evaluated points and values, the best and the GP hyperparameters
+        '''
+        with open(path, 'w') as f:
+            json.dump(dict(lower=self.lower.tolist(), upper=self.upper.tolist(), batch_size=self.batch_size,
+                           X=self.X.tolist(), F=self.F.tolist(), best_x=self.best_x.tolist(), best_f=self.best_f,
+                           gp_log_hyper=self.gp.log_hyper.tolist()), f, indent=2)
@@ -0,0 +1,204 @@
+'''
+PPO with the state-independent dist info columns of the policy (policies/broadcast_infos.py)
+fed once per batch.
+
+garage's NPO feeds the old dist infos as (N, T, dim) arrays, although for the HwAsAction policies
+the hardware means and all log_stds are the same at every step. BroadcastInfosPPO feeds the
+per-step columns as (N, T, n_per_step) arrays and the others as (n_broadcast,) arrays, and
+rebuilds the (N, T, dim) tensors in the graph with a broadcast and a column gather.
+
+    algo = BroadcastInfosPPO(env_spec=env.spec, policy=policy, baseline=baseline, **params.ppo_algo_kwargs)
+    runner.setup(algo, env, sampler_cls=BroadcastInfosSampler)
+
+With another sampler the paths carry full agent infos, they are split in process_samples.
+'''
+
+import numpy as np
+import tensorflow as tf
+from dowel import tabular
+
+from garage.misc import tensor_utils as np_tensor_utils
+from garage.tf.algos.ppo import PPO
+from garage.tf.misc import tensor_utils
+from garage.tf.misc.tensor_utils import flatten_batch_dict
+from garage.tf.misc.tensor_utils import filter_valids_dict
+from garage.tf.misc.tensor_utils import flatten_inputs
+
+
+def split_broadcast_infos(infos, masks):
+    '''
+    (per-step infos, once-per-batch infos) of full agent infos of shape (..., dim).
+    '''
+    infos = dict(infos)
+    broadcast_infos = {}
+    for key, mask in masks.items():
+        broadcast_infos[key] = infos[key].reshape(-1, mask.size)[0, mask]
+        infos[key] = infos[key][..., ~mask]
+    return infos, broadcast_infos
+
+
+def expand_broadcast_infos(infos, broadcast_infos, masks):
+    '''
+    Full agent infos of shape (..., dim) from the per-step and the once-per-batch columns.
+    '''
+    infos = dict(infos)
+    for key, mask in masks.items():
+        full = np.empty(infos[key].shape[:-1] + mask.shape, dtype=infos[key].dtype)
+        full[..., ~mask] = infos[key]
+        full[..., mask] = broadcast_infos[key]
+        infos[key] = full
+    return infos
+
+
+def expand_broadcast_infos_sym(per_step_var, broadcast_var, mask, name=None):
+    '''
+    (N, T, dim) tensor from the per-step columns (N, T, n_per_step) and the once-per-batch columns (n_broadcast,).
+    '''
+    with tf.name_scope(name, 'expand_broadcast_infos', [per_step_var, broadcast_var]):
+        broadcast_ts = tf.broadcast_to(broadcast_var, tf.concat([tf.shape(per_step_var)[:2], [int(np.sum(mask))]], axis=0))
+        # column i of the result is column order[i] of [per_step, broadcast]
+        order = np.argsort(np.concatenate([np.flatnonzero(~mask), np.flatnonzero(mask)]))
+        return tf.gather(tf.concat([per_step_var, broadcast_ts], axis=-1), order, axis=2)
+
+
+class BroadcastInfosPPO(PPO):
+    '''
+    PPO for policies with broadcast_info_masks (policies/broadcast_infos.py), same arguments as PPO.
+    For other policies it is PPO.
+    '''
+    def __init__(self, env_spec, policy, baseline, **kwargs):
+        super().__init__(env_spec=env_spec, policy=policy, baseline=baseline, **kwargs)
+        # the per-episode hardware enters the objective at the first step only, whose advantage is the
+        # return of the episode minus the baseline only without GAE (policies/episode_hardware.py)
+        assert getattr(policy, 'hw_sampling', 'per_step') != 'per_episode' or self.gae_lambda == 1, \
+            'hw_sampling per_episode needs gae_lambda = 1, got {}'.format(self.gae_lambda)
+
+
+    @property
+    def _broadcast_info_masks(self):
+        return getattr(self.policy, 'broadcast_info_masks', {})
+
+
+    def _build_inputs(self):
+        policy_loss_inputs, policy_opt_inputs = super()._build_inputs()
+        masks = self._broadcast_info_masks
+        if not masks:
+            return policy_loss_inputs, policy_opt_inputs
+
+        # the (N, T, dim) placeholders of NPO for the keys in masks stay in the graph unfed,
+        # everything downstream is built from the expanded tensors instead
+        old_dist_info_vars = dict(policy_loss_inputs.policy_old_dist_info_vars)
+        self._per_step_info_vars = {}
+        self._broadcast_info_vars = {}
+        with tf.name_scope('inputs'):
+            for key, mask in masks.items():
+                self._per_step_info_vars[key] = tf.compat.v1.placeholder(tf.float32, shape=[None, None, int(np.sum(~mask))], name='policy_old_%s_per_step' % key)
+                self._broadcast_info_vars[key] = tf.compat.v1.placeholder(tf.float32, shape=[int(np.sum(mask))], name='policy_old_%s_broadcast' % key)
+                old_dist_info_vars[key] = expand_broadcast_infos_sym(self._per_step_info_vars[key], self._broadcast_info_vars[key], mask, name='policy_old_%s' % key)
+            with tf.name_scope('flat'):
+                old_dist_info_vars_flat = flatten_batch_dict(old_dist_info_vars, name='policy_old_dist_info_vars_flat')
+            with tf.name_scope('valid'):
+                old_dist_info_vars_valid = filter_valids_dict(old_dist_info_vars_flat, policy_loss_inputs.flat.valid_var, name='policy_old_dist_info_vars_valid')
+
+        policy_loss_inputs = policy_loss_inputs._replace(
+            policy_old_dist_info_vars=old_dist_info_vars,
+            flat=policy_loss_inputs.flat._replace(policy_old_dist_info_vars=old_dist_info_vars_flat),
+            valid=policy_loss_inputs.valid._replace(policy_old_dist_info_vars=old_dist_info_vars_valid))
+        policy_opt_inputs = policy_opt_inputs._replace(
+            policy_old_dist_info_vars_list=self._old_dist_info_list(old_dist_info_vars, self._per_step_info_vars, self._broadcast_info_vars))
+        return policy_loss_inputs, policy_opt_inputs
+
+
+    def _old_dist_info_list(self, dist_infos, per_step_infos, broadcast_infos):
+        # per-step columns in place of the full infos of the keys in masks, then their once-per-batch columns
+        keys = self.policy.distribution.dist_info_keys
+        masks = self._broadcast_info_masks
+        return [per_step_infos[k] if k in masks else dist_infos[k] for k in keys] + [broadcast_infos[k] for k in keys if k in masks]
+
+
+    def _policy_opt_input_values(self, samples_data):
+        if not self._broadcast_info_masks:
+            return super()._policy_opt_input_values(samples_data)
+        agent_infos = samples_data['agent_infos']
+        policy_opt_input_values = self._policy_opt_inputs._replace(
+            obs_var=samples_data['observations'],
+            action_var=samples_data['actions'],
+            reward_var=samples_data['rewards'],
+            baseline_var=samples_data['baselines'],
+            valid_var=samples_data['valids'],
+            policy_state_info_vars_list=[agent_infos[k] for k in self.policy.state_info_keys],
+            policy_old_dist_info_vars_list=self._old_dist_info_list(agent_infos, agent_infos, samples_data['broadcast_infos']),
+        )
+        return flatten_inputs(policy_opt_input_values)
+
+
+    def process_samples(self, itr, paths):
+        '''
+        As BatchPolopt.process_samples, with samples_data['agent_infos'] holding only the per-step
+        columns of the keys in policy.broadcast_info_masks and samples_data['broadcast_infos'] the others.
+        '''
+        masks = self._broadcast_info_masks
+        if not masks:
+            return super().process_samples(itr, paths)
+        broadcast_infos = paths[0].get('broadcast_infos')
+
+        max_path_length = self.max_path_length
+        paths = [dict(observations=self.env_spec.observation_space.flatten_n(path['observations']) if self.flatten_input else path['observations'],
+                      actions=self.env_spec.action_space.flatten_n(path['actions']),
+                      rewards=path['rewards'],
+                      env_infos=path['env_infos'],
+                      agent_infos=path['agent_infos']) for path in paths]
+
+        if hasattr(self.baseline, 'predict_n'):
+            all_path_baselines = self.baseline.predict_n(paths)
+        else:
+            all_path_baselines = [self.baseline.predict(path) for path in paths]
+
+        for path, path_baselines in zip(paths, all_path_baselines):
+            deltas = path['rewards'] + self.discount * np.append(path_baselines, 0)[1:] - path_baselines
+            path['advantages'] = np_tensor_utils.discount_cumsum(deltas, self.discount * self.gae_lambda)
+            path['deltas'] = deltas
+            path['baselines'] = path_baselines
+            path['returns'] = np_tensor_utils.discount_cumsum(path['rewards'], self.discount)
+
+        def pad(key):
+            return tensor_utils.pad_tensor_n([path[key] for path in paths], max_path_length)
+
+        agent_infos = tensor_utils.stack_tensor_dict_list([tensor_utils.pad_tensor_dict(path['agent_infos'], max_path_length) for path in paths])
+        env_infos = tensor_utils.stack_tensor_dict_list([tensor_utils.pad_tensor_dict(path['env_infos'], max_path_length) for path in paths])
+        if broadcast_infos is None: # full agent infos from a sampler other than BroadcastInfosSampler
+            agent_infos, broadcast_infos = split_broadcast_infos(agent_infos, masks)
+        valids = tensor_utils.pad_tensor_n([np.ones_like(path['returns']) for path in paths], max_path_length)
+
+        undiscounted_returns = [sum(path['rewards']) for path in paths]
+        self.episode_reward_mean.extend(undiscounted_returns)
+
+        # the full infos only for the entropy, not kept
+        ent = np.sum(self.policy.distribution.entropy(expand_broadcast_infos(agent_infos, broadcast_infos, masks)) * valids) / np.sum(valids)
+
+        samples_data = dict(
+            observations=pad('observations'),
+            actions=pad('actions'),
+            rewards=pad('rewards'),
+            baselines=pad('baselines'),
+            returns=pad('returns'),
+            valids=valids,
+            agent_infos=agent_infos,
+            broadcast_infos=broadcast_infos,
+            env_infos=env_infos,
+            paths=paths,
+            average_return=np.mean(undiscounted_returns),
+        )
+
+        tabular.record('Iteration', itr)
+        tabular.record('AverageDiscountedReturn', np.mean([path['returns'][0] for path in paths]))
+        tabular.record('AverageReturn', np.mean(undiscounted_returns))
+        tabular.record('Extras/EpisodeRewardMean', np.mean(self.episode_reward_mean))
+        tabular.record('NumTrajs', len(paths))
+        tabular.record('Entropy', ent)
+        tabular.record('Perplexity', np.exp(ent))
+        tabular.record('StdReturn', np.std(undiscounted_returns))
+        tabular.record('MaxReturn', np.max(undiscounted_returns))
+        tabular.record('MinReturn', np.min(undiscounted_returns))
+
+        return samples_data
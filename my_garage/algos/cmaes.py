@@ -0,0 +1,56 @@
+'''
+CMA-ES variants for high-dimensional searches (many springs / segments).
+
+    'full' : cma.CMAEvolutionStrategy as before, a full n x n covariance matrix, whose
+             eigendecomposition makes a generation O(n^2) to O(n^3) and the memory O(n^2)
+    'sep'  : separable CMA-ES (Ros & Hansen 2008, cma's CMA_diagonal), a diagonal covariance
+             matrix with O(n) memory and update cost, and the covariance learning rates scaled up
+             by about n / 3. It cannot learn correlations between the variables, e.g. the direction
+             of the sum of the k's / l's that the hardware objective depends on, so for small n it
+             may need more generations than 'full' (or use params.hw_parameterization = 'total').
+
+launchers/benchmark/cmaes_benchmark.py compares the two over the dimension.
+'''
+
+import cma
+
+from garage.np.algos import CMAES as GarageCMAES
+
+
+CMAES_VARIANTS = ['full', 'sep']
+
+
+def make_cma_es(x0, sigma0, options=None, variant='full'):
+    '''
+    cma.CMAEvolutionStrategy of one of CMAES_VARIANTS, same arguments as cma.CMAEvolutionStrategy.
+    '''
+    assert variant in CMAES_VARIANTS, 'unknown CMA-ES variant {}, choose from {}'.format(variant, CMAES_VARIANTS)
+    options = dict(options or {})
+    if variant == 'sep':
+        options['CMA_diagonal'] = True
+    return cma.CMAEvolutionStrategy(x0, sigma0, options)
+
+
+class CMAES(GarageCMAES):
+    '''
+    garage's CMAES over the policy parameters with the CMA-ES variant selectable.
+
+    Args:
+        variant (str): one of CMAES_VARIANTS
+        **kwargs: as garage.np.algos.CMAES
+    '''
+
+    def __init__(self, variant='full', **kwargs):
+        super().__init__(**kwargs)
+        assert variant in CMAES_VARIANTS, 'unknown CMA-ES variant {}, choose from {}'.format(variant, CMAES_VARIANTS)
+        self.variant = variant
+
+
+    def train(self, runner):
+        init_mean = self.policy.get_param_values()
+        self.es = make_cma_es(init_mean, self.sigma0, {'popsize': self.n_samples}, variant=self.variant)
+        self.all_params = self._sample_params()
+        self.cur_params = self.all_params[0]
+        self.policy.set_param_values(self.cur_params)
+        self.all_returns = []
+        return super(GarageCMAES, self).train(runner) # BatchPolopt.train, the es is created above
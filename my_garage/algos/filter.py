@@ -0,0 +1,182 @@
+# Code in this file is adapted from
+# https://github.com/modestyachts/ARS (filter.py), with the running statistics
+# kept as arrays and merged in closed form instead of per-sample pushes.
+
+import numpy as np
+
+
+class RunningStat(object):
+    '''
+    Welford running mean / variance of vectors of a fixed shape, stored as
+    (n, mean, m2) with m2 the sum of squared deviations from the mean.
+    Two RunningStats merge in O(dim) (Chan et al.), so workers only exchange
+    these arrays, never the observations themselves.
+    '''
+
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        self.n = 0
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.m2 = np.zeros(shape, dtype=np.float64)
+
+    def push(self, x):
+        '''
+        Add a batch of samples, x of shape (batch_size,) + shape or shape.
+        '''
+        x = np.asarray(x, dtype=np.float64).reshape((-1,) + self.shape)
+        n = x.shape[0]
+        if n == 0:
+            return
+        mean = x.mean(axis=0)
+        m2 = ((x - mean)**2).sum(axis=0)
+        self._merge(n, mean, m2)
+
+    def update(self, other):
+        '''
+        Merge the samples of another RunningStat.
+        '''
+        self._merge(other.n, other.mean, other.m2)
+
+    def _merge(self, n, mean, m2):
+        if n == 0:
+            return
+        n_total = self.n + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * n / n_total
+        self.m2 = self.m2 + m2 + delta**2 * self.n * n / n_total
+        self.n = n_total
+
+    @property
+    def var(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else np.square(self.mean)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def copy(self):
+        other = RunningStat(self.shape)
+        other.n, other.mean, other.m2 = self.n, self.mean.copy(), self.m2.copy()
+        return other
+
+    def as_array(self):
+        '''
+        Flat (1 + 2*dim,) array [n, mean, m2], e.g. for checkpoints or sending to another process.
+        '''
+        return np.concatenate([[self.n], self.mean.ravel(), self.m2.ravel()])
+
+    @classmethod
+    def from_array(cls, array, shape):
+        stat = cls(shape)
+        dim = stat.mean.size
+        stat.n = int(array[0])
+        stat.mean = np.array(array[1:1 + dim], dtype=np.float64).reshape(shape)
+        stat.m2 = np.array(array[1 + dim:1 + 2*dim], dtype=np.float64).reshape(shape)
+        return stat
+
+
+class NoFilter(object):
+    '''
+    Identity filter with the MeanStdFilter interface.
+    '''
+
+    def __init__(self, shape=None):
+        self.shape = shape
+
+    def __call__(self, x, update=True):
+        return np.asarray(x)
+
+    def update(self, other):
+        pass
+
+    def stats_increment(self):
+        pass
+
+    def clear_buffer(self):
+        pass
+
+    def sync(self, other):
+        pass
+
+    def copy(self):
+        return NoFilter(self.shape)
+
+    def get_stats(self):
+        return None, None
+
+
+class MeanStdFilter(object):
+    '''
+    Observation filter y = (x - mean) / std.
+
+    rs holds the statistics agreed on by all workers, buffer the observations
+    this filter has seen since the last synchronization. The mean and std
+    applied in __call__ are frozen at stats_increment, so all rollouts of an
+    iteration (both sides of every perturbation) see the same normalization.
+
+    Per iteration the master merges the buffers of the workers (update),
+    freezes the result (stats_increment), clears its buffer and sends rs
+    back to the workers (sync).
+    '''
+
+    def __init__(self, shape, demean=True, destd=True):
+        self.shape = tuple(shape)
+        self.demean = demean
+        self.destd = destd
+        self.rs = RunningStat(shape)
+        self.buffer = RunningStat(shape)
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.std = np.ones(shape, dtype=np.float64)
+
+    def __call__(self, x, update=True):
+        x = np.asarray(x, dtype=np.float64)
+        if update:
+            self.buffer.push(x)
+        if self.demean:
+            x = x - self.mean
+        if self.destd:
+            x = x / (self.std + 1e-8)
+        return x
+
+    def update(self, other):
+        '''
+        Merge the buffer of another filter (a worker's) into rs.
+        '''
+        self.rs.update(other.buffer)
+
+    def stats_increment(self):
+        '''
+        Freeze the statistics of rs for the next rollouts.
+        '''
+        self.mean = self.rs.mean.copy()
+        std = self.rs.std
+        std[std < 1e-7] = float('inf') # constant observations are zeroed
+        self.std = std if self.rs.n > 1 else np.ones(self.shape)
+
+    def clear_buffer(self):
+        self.buffer = RunningStat(self.shape)
+
+    def sync(self, other):
+        '''
+        Take over the statistics rs of another filter (the master's) and clear the buffer.
+        '''
+        self.rs = other.rs.copy()
+        self.clear_buffer()
+
+    def copy(self):
+        other = MeanStdFilter(self.shape, self.demean, self.destd)
+        other.sync(self)
+        other.buffer = self.buffer.copy()
+        other.mean, other.std = self.mean.copy(), self.std.copy()
+        return other
+
+    def get_stats(self):
+        return self.mean, self.std
+
+
+def get_filter(filter_type, shape):
+    if filter_type == 'MeanStdFilter':
+        return MeanStdFilter(shape)
+    elif filter_type == 'NoFilter':
+        return NoFilter(shape)
+    raise NotImplementedError('unknown filter {}'.format(filter_type))
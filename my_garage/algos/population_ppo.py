@@ -0,0 +1,213 @@
+'''
+PPO over a population of independent policies in one graph (policies/population.py), e.g. P hardware
+candidates of the HwAsAction setup trained in lockstep instead of one PPO run after another.
+
+The members share nothing but the session: each sample carries its member index (the last observation
+column of MassSpringEnv_Opt*_HwAsAction_Population), the advantages are centered per member, the loss
+is the sum of the members' PPO losses (each the mean over its own samples, so the gradient of a member
+is the one of its own PPO run) and PopulationBaseline fits one baseline per member. Only the optimizer
+settings and the minibatches are shared.
+
+    env = TfEnv(MassSpringEnv_OptK_HwAsAction_Population(params, n_members, n_envs_per_member))
+    policy = CompMechPolicy_OptK_HwAsAction_Population(env_spec=env.spec, comp_mech_policy_model=...)
+    baseline = PopulationBaseline(env_spec=env.spec, n_members=n_members)
+    algo = PopulationPPO(env_spec=env.spec, policy=policy, baseline=baseline, hw_info_key='k', **params.ppo_algo_kwargs)
+    runner.setup(algo, env, sampler_cls=BatchedOnPolicyVectorizedSampler, sampler_args=dict(batched_env=...))
+'''
+
+import numpy as np
+import tensorflow as tf
+from dowel import tabular
+
+from garage.np.baselines import LinearFeatureBaseline
+from garage.np.baselines.base import Baseline
+from garage.tf.algos.ppo import PPO
+from garage.tf.misc.tensor_utils import compile_function
+from garage.tf.misc.tensor_utils import compute_advantages
+from garage.tf.misc.tensor_utils import discounted_returns
+from garage.tf.misc.tensor_utils import filter_valids
+from garage.tf.misc.tensor_utils import filter_valids_dict
+from garage.tf.misc.tensor_utils import flatten_batch
+from garage.tf.misc.tensor_utils import flatten_inputs
+
+from policies.population import member_index
+
+
+def path_member(path):
+    return int(round(path['observations'][0][-1]))
+
+
+def center_advs_per_member(advs, members, n_members, eps, name=None):
+    '''
+    center_advs with the mean and variance of each sample's member
+    '''
+    with tf.name_scope(name, 'center_adv_per_member', [advs, members]):
+        mean = tf.math.unsorted_segment_mean(advs, members, n_members)
+        centered = advs - tf.gather(mean, members)
+        var = tf.math.unsorted_segment_mean(tf.square(centered), members, n_members)
+        return centered * tf.math.rsqrt(tf.gather(var, members) + eps)
+
+
+def positive_advs_per_member(advs, members, n_members, eps, name=None):
+    '''
+    positive_advs with the minimum of each sample's member
+    '''
+    with tf.name_scope(name, 'positive_adv_per_member', [advs, members]):
+        return advs - tf.gather(tf.math.unsorted_segment_min(advs, members, n_members), members) + eps
+
+
+class PopulationBaseline(Baseline):
+    '''
+    One baseline per member (baseline_cls(env_spec), LinearFeatureBaseline by default) on the
+    observations without the member column.
+    '''
+    def __init__(self, env_spec, n_members, baseline_cls=LinearFeatureBaseline, name='PopulationBaseline'):
+        super().__init__(env_spec)
+        self.n_members = n_members
+        self.name = name
+        self.baselines = [baseline_cls(env_spec=env_spec) for _ in range(n_members)]
+
+
+    @staticmethod
+    def _member_path(path):
+        return dict(path, observations=np.asarray(path['observations'])[:, :-1])
+
+
+    def fit(self, paths):
+        for member, baseline in enumerate(self.baselines):
+            member_paths = [self._member_path(path) for path in paths if path_member(path) == member]
+            if member_paths:
+                baseline.fit(member_paths)
+
+
+    def predict(self, path):
+        return self.baselines[path_member(path)].predict(self._member_path(path))
+
+
+    def get_param_values(self, **tags):
+        return [baseline.get_param_values() for baseline in self.baselines]
+
+
+    def set_param_values(self, val, **tags):
+        for baseline, values in zip(self.baselines, val):
+            baseline.set_param_values(values)
+
+
+class PopulationPPO(PPO):
+    '''
+    PPO for policies with a population axis (policies/population.PopulationParams).
+
+    Args:
+        hw_info_key (str): agent info of the hardware ('k' / 'l', the sum of the k's / l's), logged per member
+        **kwargs: as PPO, the optimizer settings are the same for all members
+    '''
+
+    def __init__(self, hw_info_key=None, **kwargs):
+        super().__init__(**kwargs)
+        assert not self.policy.recurrent, 'PopulationPPO supports non-recurrent policies only'
+        self.n_members = self.policy.n_members
+        self.hw_info_key = hw_info_key
+        self.member_average_returns = np.full(self.n_members, np.nan) # of the last iteration
+
+
+    def _build_policy_loss(self, i):
+        '''
+        NPO._build_policy_loss (non-recurrent) with the advantages centered per member and the sum
+        of the members' mean objectives as the loss.
+        '''
+        pol_dist = self.policy.distribution
+        policy_entropy = self._build_entropy_term(i)
+        rewards = i.reward_var
+
+        if self._maximum_entropy:
+            with tf.name_scope('augmented_rewards'):
+                rewards = i.reward_var + self.policy_ent_coeff * policy_entropy
+
+        with tf.name_scope('policy_loss'):
+            adv = compute_advantages(self.discount,
+                                     self.gae_lambda,
+                                     self.max_path_length,
+                                     i.baseline_var,
+                                     rewards,
+                                     name='adv')
+
+            adv_flat = flatten_batch(adv, name='adv_flat')
+            adv_valid = filter_valids(adv_flat, i.flat.valid_var, name='adv_valid')
+            member_valid = filter_valids(member_index(i.flat.obs_var), i.flat.valid_var, name='member_valid')
+
+            eps = tf.constant(1e-8, dtype=tf.float32)
+            if self.center_adv:
+                adv_valid = center_advs_per_member(adv_valid, member_valid, self.n_members, eps)
+            if self.positive_adv:
+                adv_valid = positive_advs_per_member(adv_valid, member_valid, self.n_members, eps)
+
+            policy_dist_info_flat = self.policy.dist_info_sym(
+                i.flat.obs_var,
+                i.flat.policy_state_info_vars,
+                name='policy_dist_info_flat')
+            policy_dist_info_valid = filter_valids_dict(
+                policy_dist_info_flat,
+                i.flat.valid_var,
+                name='policy_dist_info_valid')
+
+            with tf.name_scope('kl'):
+                kl = pol_dist.kl_sym(i.valid.policy_old_dist_info_vars, policy_dist_info_valid)
+                pol_mean_kl = tf.reduce_mean(kl)
+
+            with tf.name_scope('vanilla_loss'):
+                ll = pol_dist.log_likelihood_sym(i.valid.action_var, policy_dist_info_valid, name='log_likelihood')
+                vanilla = ll * adv_valid
+
+            with tf.name_scope('surrogate_loss'):
+                lr = pol_dist.likelihood_ratio_sym(i.valid.action_var, i.valid.policy_old_dist_info_vars, policy_dist_info_valid, name='lr')
+                surrogate = lr * adv_valid
+
+            with tf.name_scope('loss'):
+                if self._pg_loss == 'vanilla':
+                    obj = tf.identity(vanilla, name='vanilla_obj')
+                elif self._pg_loss == 'surrogate':
+                    obj = tf.identity(surrogate, name='surr_obj')
+                elif self._pg_loss == 'surrogate_clip':
+                    lr_clip = tf.clip_by_value(lr, 1 - self.lr_clip_range, 1 + self.lr_clip_range, name='lr_clip')
+                    obj = tf.minimum(surrogate, lr_clip * adv_valid, name='surr_obj')
+
+                if self._entropy_regularzied:
+                    obj += self.policy_ent_coeff * policy_entropy
+
+                # members without samples in a minibatch contribute 0
+                loss = -tf.reduce_sum(tf.math.unsorted_segment_mean(obj, member_valid, self.n_members))
+
+            self.f_policy_kl = compile_function(flatten_inputs(self._policy_opt_inputs), pol_mean_kl, log_name='f_policy_kl')
+            self.f_rewards = compile_function(flatten_inputs(self._policy_opt_inputs), rewards, log_name='f_rewards')
+            returns = discounted_returns(self.discount, self.max_path_length, rewards)
+            self.f_returns = compile_function(flatten_inputs(self._policy_opt_inputs), returns, log_name='f_returns')
+
+            return loss, pol_mean_kl
+
+
+    def process_samples(self, itr, paths):
+        '''
+        As BatchPolopt.process_samples, with samples_data['members'] (the member of every path) and
+        the returns (and hardware) logged per member.
+        '''
+        samples_data = super().process_samples(itr, paths)
+        members = np.array([path_member(path) for path in samples_data['paths']])
+        samples_data['members'] = members
+
+        undiscounted_returns = np.array([np.sum(path['rewards']) for path in samples_data['paths']])
+        for member in range(self.n_members):
+            member_paths = np.flatnonzero(members == member)
+            self.member_average_returns[member] = np.mean(undiscounted_returns[member_paths]) if member_paths.size else np.nan
+            tabular.record('Population/AverageReturn_{}'.format(member), self.member_average_returns[member])
+            if self.hw_info_key is not None and member_paths.size:
+                tabular.record('Population/{}_{}'.format(self.hw_info_key, member),
+                               np.mean([np.mean(samples_data['paths'][idx]['agent_infos'][self.hw_info_key]) for idx in member_paths]))
+        tabular.record('Population/BestMember', int(np.nanargmax(self.member_average_returns)))
+        tabular.record('Population/BestAverageReturn', np.nanmax(self.member_average_returns))
+        return samples_data
+
+
+    def get_itr_snapshot(self, itr):
+        snapshot = super().get_itr_snapshot(itr)
+        snapshot['member_average_returns'] = self.member_average_returns.copy()
+        return snapshot
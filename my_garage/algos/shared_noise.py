@@ -27,6 +27,17 @@ class SharedNoiseTable(object):
     def get(self, i, dim):
         return self.noise[i:i + dim]
 
+    def get_batch(self, indices, dim):
+        '''
+        Rows noise[i:i + dim] for all i in indices, gathered into one contiguous (len(indices), dim) array.
+        The rows are taken from a strided view of all windows of the table (as sliding_window_view,
+        which the numpy of garage 2019.10 does not have yet), so the table is not copied.
+        '''
+        stride = self.noise.strides[0]
+        windows = np.lib.stride_tricks.as_strided(self.noise, shape=(len(self.noise) - dim + 1, dim),
+                                                  strides=(stride, stride), writeable=False)
+        return windows[np.asarray(indices, dtype=np.int64)]
+
     def sample_index(self, dim):
         return self.rg.randint(0, len(self.noise) - dim + 1)
 
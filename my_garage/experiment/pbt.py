@@ -0,0 +1,268 @@
+'''
+Population-based training (Jaderberg et al. 2017) of the PPO co-design launchers across seeds.
+
+A seed sweep trains n independent runs and keeps the best one. PopulationBasedTraining trains the same n
+runs (members, one seed each) in rounds of `interval` epochs, each in its own TF graph in this process.
+After every round the members are ranked by their recent return. Each member of the bottom quantile
+copies the policy (weights, log_stds and the trainable hardware variable k_pre / l_pre) and the baseline
+of a random member of the top quantile (exploit), then perturbs the hardware in the pre-sigmoid space
+and multiplies some PPO settings (ppo_algo_kwargs) by a random factor (explore). A member with new PPO
+settings gets a new graph with the copied values. The total number of epochs is the one of the sweep.
+Every member keeps its own numpy / random state, swapped in around its build and train, so without
+exploit a member trains as it would alone, whatever the other members draw in between.
+
+    members = [PBTMember(build_task, log_dir_i, seed_i, params.ppo_algo_kwargs, hw_var_name='k_pre') for i ...]
+    pbt = PopulationBasedTraining(members, interval=50, **options)
+    pbt.run(n_rounds, batch_size=params.ppo_train_kwargs['batch_size'])
+
+with build_task(runner, algo_kwargs) of the launcher (e.g. launchers/train/opt_k/ppo_opt_k_hw_as_action.py),
+which builds the env, the policy, the baseline and PPO in the default graph and calls runner.setup.
+'''
+
+import os
+import re
+import copy
+import json
+import time
+import types
+import random
+import contextlib
+
+import dowel
+import numpy as np
+import tensorflow as tf
+from dowel import logger
+
+from garage.experiment import deterministic, SnapshotConfig
+from garage.tf.experiment import LocalTFRunner
+
+
+def perturb_algo_kwargs(algo_kwargs, keys, factors, random_state):
+    '''
+    Copy of algo_kwargs with the values of keys ('lr_clip_range', 'optimizer_args.learning_rate', ...)
+    multiplied by a random choice of factors
+    '''
+    algo_kwargs = copy.deepcopy(algo_kwargs)
+    for key in keys:
+        *path, name = key.split('.')
+        values = algo_kwargs
+        for part in path:
+            values = values[part]
+        values[name] = float(values[name] * random_state.choice(factors))
+    return algo_kwargs
+
+
+class PBTMember:
+    '''
+    One run of a launcher, trained round by round in its own graph and session.
+
+    Args:
+        build_fn (callable): build_fn(runner, algo_kwargs) of the launcher
+        log_dir (str): progress.csv, debug.log and the snapshot of the member
+        seed (int)
+        algo_kwargs (dict): PPO settings, as params.ppo_algo_kwargs
+        hw_var_name (str): name scope of the trainable hardware variable, 'k_pre' or 'l_pre'
+        snapshot_mode (str): as run_experiment
+    '''
+    def __init__(self, build_fn, log_dir, seed, algo_kwargs, hw_var_name, snapshot_mode='last'):
+        self.build_fn = build_fn
+        self.log_dir = log_dir
+        self.seed = seed
+        self.algo_kwargs = copy.deepcopy(algo_kwargs)
+        self.hw_var_name = hw_var_name
+        self.snapshot_mode = snapshot_mode
+        self.epoch = 0
+        self.fitness = None
+        self.runner = None
+        self._random_states = None # (numpy, random) of the member while it is not built or trained
+        self.outputs = [dowel.TextOutput(os.path.join(log_dir, 'debug.log')),
+                        dowel.CsvOutput(os.path.join(log_dir, 'progress.csv')),
+                        dowel.TensorBoardOutput(log_dir)]
+
+
+    def build(self, state=None):
+        '''
+        A new graph with the current algo_kwargs, the policy and baseline values from state (get_state()) if given
+        '''
+        rebuild = self.runner is not None
+        # the iteration / env step counters of newer garage runners, numbered on in the rebuilt runner
+        runner_stats = getattr(self.runner, '_stats', None)
+        self.close()
+        self.graph = tf.Graph()
+        with self._random_state(), self.graph.as_default():
+            if rebuild:
+                tf.compat.v1.set_random_seed(self.seed) # only the graph-level seed, the numpy / random streams go on
+            else:
+                deterministic.set_seed(self.seed)
+            self.runner = LocalTFRunner(snapshot_config=SnapshotConfig(snapshot_dir=self.log_dir, snapshot_mode=self.snapshot_mode, snapshot_gap=1))
+            if runner_stats is not None:
+                self.runner._stats = runner_stats
+            # not `with self.runner`, leaving it would close the session (tf Session.__exit__)
+            with self.runner.sess.as_default():
+                self.build_fn(self.runner, self.algo_kwargs)
+                pattern = re.compile('/{}(/|:)'.format(self.hw_var_name))
+                hw_vars = [v for v in self.runner.policy.get_params() if pattern.search(v.name)]
+                assert len(hw_vars) == 1, 'expected one trainable {} variable, found {}'.format(self.hw_var_name, [v.name for v in hw_vars])
+                self.hw_var = hw_vars[0]
+                if state is not None:
+                    self.set_state(state)
+
+
+    def train(self, n_epochs, batch_size):
+        '''
+        n_epochs more epochs, logged to log_dir and numbered on from the last round. Returns the fitness,
+        the mean undiscounted return of the last (up to 100) episodes.
+        '''
+        if self.runner is None:
+            self.build()
+        runner = self.runner
+        with self._random_state(), self.graph.as_default(), runner.sess.as_default():
+            for output in self.outputs + [dowel.StdOutput()]:
+                logger.add_output(output)
+            try:
+                # as LocalRunner.resume
+                runner.train_args = types.SimpleNamespace(n_epochs=self.epoch + n_epochs, n_epoch_cycles=1, batch_size=batch_size,
+                    plot=False, store_paths=False, pause_for_plot=False, start_epoch=self.epoch)
+                runner.plot = False
+                runner.algo.train(runner)
+            finally:
+                logger.remove_all()
+        self.epoch += n_epochs
+        self.fitness = float(np.mean(runner.algo.episode_reward_mean))
+        return self.fitness
+
+
+    @contextlib.contextmanager
+    def _random_state(self):
+        '''
+        The global numpy / random state of the member inside, the one of the caller again after
+        '''
+        outer = np.random.get_state(), random.getstate()
+        if self._random_states is not None:
+            np.random.set_state(self._random_states[0])
+            random.setstate(self._random_states[1])
+        try:
+            yield
+        finally:
+            self._random_states = np.random.get_state(), random.getstate()
+            np.random.set_state(outer[0])
+            random.setstate(outer[1])
+
+
+    def get_state(self):
+        with self.runner.sess.as_default():
+            return dict(policy=self.runner.policy.get_param_values(),
+                        baseline=copy.deepcopy(self.runner.algo.baseline.get_param_values()))
+
+
+    def set_state(self, state):
+        with self.runner.sess.as_default():
+            self.runner.policy.set_param_values(state['policy'])
+            self.runner.algo.baseline.set_param_values(copy.deepcopy(state['baseline']))
+        self.runner.algo.episode_reward_mean.clear() # the returns of the replaced policy
+
+
+    def get_hardware(self):
+        '''
+        values of the pre-sigmoid hardware variable
+        '''
+        return self.runner.sess.run(self.hw_var)
+
+
+    def perturb_hardware(self, std, random_state):
+        hw_pre = self.get_hardware()
+        self.hw_var.load(hw_pre + random_state.normal(0.0, std, size=hw_pre.shape), self.runner.sess)
+
+
+    def close(self):
+        if self.runner is not None:
+            self.runner.sess.close()
+            self.runner = None
+
+
+class PopulationBasedTraining:
+    '''
+    Args:
+        members (list[PBTMember])
+        interval (int): epochs per round
+        quantile (float): fraction of the members in the bottom (exploited) and the top (source) group
+        hw_perturb_std (float): std of the noise added to the copied pre-sigmoid hardware
+        explore_keys (list[str]): PPO settings perturbed after a copy, see perturb_algo_kwargs
+        perturb_factors (tuple): factors for the explored PPO settings
+        exploit (bool): False trains the members independently (the seed sweep with the same budget)
+        seed (int): seed of the exploit / explore choices
+    '''
+    def __init__(self, members, interval, quantile=0.25, hw_perturb_std=0.5, explore_keys=(), perturb_factors=(0.8, 1.2), exploit=True, seed=None):
+        self.members = members
+        self.interval = interval
+        self.quantile = quantile
+        self.hw_perturb_std = hw_perturb_std
+        self.explore_keys = list(explore_keys)
+        self.perturb_factors = perturb_factors
+        self.exploit = exploit
+        self.random_state = np.random.RandomState(seed)
+        self.n_rounds = 0
+        self.history = [] # one record per member and round
+
+
+    def _exploit_and_explore(self, fitness):
+        n_exploited = max(1, int(np.floor(self.quantile * len(self.members))))
+        order = np.argsort(fitness) # ascending
+        bottom, top = order[:n_exploited], order[-n_exploited:]
+        sources = {}
+        for dst in bottom:
+            src = int(self.random_state.choice(top))
+            member = self.members[dst]
+            state = self.members[src].get_state()
+            algo_kwargs = perturb_algo_kwargs(self.members[src].algo_kwargs, self.explore_keys, self.perturb_factors, self.random_state)
+            if algo_kwargs != member.algo_kwargs:
+                member.algo_kwargs = algo_kwargs
+                member.build(state) # the PPO graph depends on the settings
+            else:
+                member.set_state(state)
+            member.perturb_hardware(self.hw_perturb_std, self.random_state)
+            sources[int(dst)] = src
+        return sources
+
+
+    def step(self, batch_size):
+        '''
+        One round: every member trains interval epochs, then the bottom members exploit and explore.
+        '''
+        t1 = time.time()
+        fitness = np.array([member.train(self.interval, batch_size) for member in self.members])
+        sources = self._exploit_and_explore(fitness) if self.exploit else {}
+        for idx, member in enumerate(self.members):
+            self.history.append(dict(round=self.n_rounds, epoch=member.epoch, member=idx, seed=member.seed, fitness=float(fitness[idx]),
+                                     source=sources.get(idx), algo_kwargs=member.algo_kwargs, hw_pre=member.get_hardware().tolist()))
+        self.n_rounds += 1
+        logger.log('PBT round %d in %.1f s, fitness %s, copied (dst: src) %s' % (self.n_rounds, time.time() - t1, np.round(fitness, 2).tolist(), sources))
+        return fitness
+
+
+    def run(self, n_rounds, batch_size, callback=None):
+        for _ in range(n_rounds):
+            self.step(batch_size)
+            if callback is not None:
+                callback(self)
+        return self
+
+
+    @property
+    def best_member(self):
+        return int(np.argmax([member.fitness for member in self.members]))
+
+
+    def save(self, path):
+        '''
+        json with the settings and the history of every member
+        '''
+        with open(path, 'w') as f:
+            json.dump(dict(interval=self.interval, quantile=self.quantile, hw_perturb_std=self.hw_perturb_std, explore_keys=self.explore_keys,
+                           perturb_factors=list(self.perturb_factors), exploit=self.exploit, n_rounds=self.n_rounds,
+                           best_member=self.best_member, history=self.history), f, indent=2)
+
+
+    def close(self):
+        for member in self.members:
+            member.close()
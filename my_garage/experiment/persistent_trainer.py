@@ -0,0 +1,128 @@
+'''
+Inner-loop PPO trainings of the hardware outer loop (cmaes_ppo_opt_*) in one persistent TF graph.
+
+Every fitness evaluation used to start a subprocess (run_experiment) that imports TF, builds the env,
+the policy, the baseline and the PPO graph, initializes a session and trains. All candidates share the
+same graph and, with the same seed, the same initial values; only the non-trainable hardware variable
+(k_pre / l_pre) differs. PersistentInnerTrainer builds the graph and the session once, keeps the initial
+values of all global variables (policy, log stds, optimizer slots, ...) and, per candidate, restores them
+with one grouped assign op, in which the hardware variable gets the candidate's value. The numpy state
+(baseline fit, episode reward statistics, iteration counters of the runner) is reset as well, so the
+training equals a fresh one.
+
+    trainer = PersistentInnerTrainer(build_inner_task, hw_var_name='k_pre', seed=seed)
+    trainer.train(log_dir, k_pre, **params.ppo_inner_train_kwargs) # progress.csv and snapshot in log_dir
+'''
+
+import os
+import copy
+import time
+
+import dowel
+import numpy as np
+import tensorflow as tf
+from dowel import logger
+
+from garage.experiment import deterministic, SnapshotConfig
+from garage.experiment.snapshotter import Snapshotter
+from garage.tf.experiment import LocalTFRunner
+
+
+class PersistentInnerTrainer:
+    '''
+    Args:
+        build_fn (callable): build_fn(runner) builds the env, the policy, the baseline and the algo in the
+            default graph and calls runner.setup, as run_task of the launchers
+        hw_var_name (str): name scope of the non-trainable hardware variable, 'k_pre' or 'l_pre'
+        seed (int): seed of every training, as run_experiment(seed=seed)
+        snapshot_mode (str): as run_experiment
+    '''
+    def __init__(self, build_fn, hw_var_name, seed=None, snapshot_mode='last'):
+        self.build_fn = build_fn
+        self.hw_var_name = hw_var_name
+        self.seed = seed
+        self.snapshot_mode = snapshot_mode
+        self.runner = None
+
+
+    def _build(self, log_dir):
+        t1 = time.time()
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            if self.seed is not None:
+                deterministic.set_seed(self.seed) # the graph-level seed of the new graph
+            self.runner = LocalTFRunner(snapshot_config=SnapshotConfig(snapshot_dir=log_dir, snapshot_mode=self.snapshot_mode, snapshot_gap=1))
+            # not `with self.runner`, leaving it would close the session (tf Session.__exit__)
+            with self.runner.sess.as_default():
+                self.build_fn(self.runner)
+                variables = tf.compat.v1.global_variables()
+                hw_vars = [v for v in variables if '/{}/'.format(self.hw_var_name) in v.name and not v.trainable]
+                assert len(hw_vars) == 1, 'expected one {} variable, found {}'.format(self.hw_var_name, [v.name for v in hw_vars])
+                self._hw_index = variables.index(hw_vars[0])
+
+                with tf.name_scope('persistent_trainer'):
+                    reset_phs = [tf.compat.v1.placeholder(v.dtype.base_dtype, shape=v.shape, name='init_value') for v in variables]
+                    reset_op = tf.group(*[tf.compat.v1.assign(v, ph) for v, ph in zip(variables, reset_phs)], name='reset')
+                sess = self.runner.sess
+                self._init_values = sess.run(variables)
+                self._reset = sess.make_callable(reset_op, feed_list=reset_phs)
+                self._baseline_init = self.runner.algo.baseline.get_param_values()
+                # the iteration / env step counters of newer garage runners, kept across runner.train calls
+                self._runner_stats_init = copy.deepcopy(getattr(self.runner, '_stats', None))
+        logger.log('Inner-loop graph built in %.2f s' % (time.time() - t1))
+
+
+    def reset(self, hw_pre):
+        '''
+        All variables to their initial values, the hardware variable to hw_pre, and the numpy state of
+        the baseline, the algo and the runner, so that the next training starts as a freshly built one.
+        '''
+        t1 = time.time()
+        values = list(self._init_values)
+        hw_pre = np.asarray(hw_pre, dtype=values[self._hw_index].dtype)
+        values[self._hw_index] = hw_pre.reshape(values[self._hw_index].shape)
+        self._reset(*values)
+
+        algo = self.runner.algo
+        algo.baseline.set_param_values(self._baseline_init)
+        algo.episode_reward_mean.clear()
+        algo.policy.reset()
+        self.runner.step_itr, self.runner.step_path = 0, None
+        if self._runner_stats_init is not None:
+            self.runner._stats = copy.deepcopy(self._runner_stats_init) # Iteration / TotalEnvSteps from 0 again
+        if self.seed is not None:
+            deterministic.set_seed(self.seed) # numpy / random state of the env and the sampler
+        return time.time() - t1
+
+
+    def train(self, log_dir, hw_pre, **train_kwargs):
+        '''
+        One inner training with the hardware variable at hw_pre, logged to log_dir as run_experiment does.
+        Returns the time of the per-candidate setup [s].
+        '''
+        if self.runner is None:
+            self._build(log_dir)
+
+        with self.graph.as_default(), self.runner.sess.as_default():
+            setup_time = self.reset(hw_pre)
+            self.runner._snapshotter = Snapshotter(log_dir, self.snapshot_mode, 1)
+            outputs = [dowel.TextOutput(os.path.join(log_dir, 'debug.log')),
+                       dowel.CsvOutput(os.path.join(log_dir, 'progress.csv')),
+                       dowel.TensorBoardOutput(log_dir),
+                       dowel.StdOutput()]
+            for output in outputs:
+                logger.add_output(output)
+            try:
+                logger.log('Inner-loop trainer reset in %.4f s' % setup_time)
+                self.runner.train(**train_kwargs)
+            finally:
+                logger.remove_all()
+                for output in outputs:
+                    output.close()
+        return setup_time
+
+
+    def close(self):
+        if self.runner is not None:
+            self.runner.sess.close()
+            self.runner = None
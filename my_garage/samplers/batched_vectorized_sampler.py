@@ -0,0 +1,67 @@
+'''
+On-policy vectorized sampling with a batched env (one env object advancing n_envs systems as arrays)
+instead of garage's VecEnvExecutor, which steps a list of env copies one by one.
+'''
+
+import numpy as np
+
+from garage.sampler.on_policy_vectorized_sampler import OnPolicyVectorizedSampler
+
+
+class BatchedVecEnvExecutor:
+    '''
+    Same interface as garage.sampler.vec_env_executor.VecEnvExecutor, backed by a batched env
+    (step/reset on (n_envs, ...) arrays and reset_idx(mask), e.g. MassSpringEnv_OptL_HwAsPolicy_Batched).
+    '''
+
+    def __init__(self, batched_env, max_path_length):
+        self.batched_env = batched_env
+        self._action_space = batched_env.action_space
+        self._observation_space = batched_env.observation_space
+        self.ts = np.zeros(batched_env.n_envs, dtype='int')
+        self.max_path_length = max_path_length
+
+    def step(self, action_n):
+        obs, rewards, dones, env_infos = self.batched_env.step(np.asarray(action_n))
+        dones = np.array(dones)
+        self.ts += 1
+        if self.max_path_length is not None:
+            dones[self.ts >= self.max_path_length] = True
+        if np.any(dones):
+            obs[dones] = self.batched_env.reset_idx(dones)
+            self.ts[dones] = 0
+        return obs, rewards, dones, env_infos
+
+    def reset(self):
+        self.ts[:] = 0
+        return self.batched_env.reset()
+
+    @property
+    def num_envs(self):
+        return self.batched_env.n_envs
+
+    @property
+    def action_space(self):
+        return self._action_space
+
+    @property
+    def observation_space(self):
+        return self._observation_space
+
+    def close(self):
+        pass
+
+
+class BatchedOnPolicyVectorizedSampler(OnPolicyVectorizedSampler):
+    '''
+    OnPolicyVectorizedSampler stepping a batched env, pass it with
+    runner.setup(algo, env, sampler_cls=BatchedOnPolicyVectorizedSampler, sampler_args=dict(batched_env=...)).
+    The number of parallel envs is batched_env.n_envs.
+    '''
+
+    def __init__(self, algo, env, batched_env):
+        super().__init__(algo, env, n_envs=batched_env.n_envs)
+        self.batched_env = batched_env
+
+    def start_worker(self):
+        self.vec_env = BatchedVecEnvExecutor(self.batched_env, max_path_length=self.algo.max_path_length)
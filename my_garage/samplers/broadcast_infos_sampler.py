@@ -0,0 +1,30 @@
+'''
+On-policy vectorized sampling that stores the state-independent agent infos of a policy
+(policies/broadcast_infos.py) once per batch instead of once per step.
+'''
+
+from garage.sampler.on_policy_vectorized_sampler import OnPolicyVectorizedSampler
+
+
+class BroadcastInfosSampler(OnPolicyVectorizedSampler):
+    '''
+    OnPolicyVectorizedSampler with the policy's compact_infos set while sampling. The per-step
+    agent infos of the paths keep only the observation-dependent columns of the keys in
+    policy.broadcast_info_masks, and every path gets path['broadcast_infos'], the same dict
+    of the other columns (the policy parameters do not change within a batch).
+    Pass it with runner.setup(algo, env, sampler_cls=BroadcastInfosSampler) and use
+    my_garage.algos.broadcast_ppo.BroadcastInfosPPO. It can be combined with
+    BatchedOnPolicyVectorizedSampler: class S(BroadcastInfosSampler, BatchedOnPolicyVectorizedSampler).
+    '''
+
+    def obtain_samples(self, itr, batch_size=None, whole_paths=True):
+        policy = self.algo.policy
+        policy.compact_infos = True
+        try:
+            paths = super().obtain_samples(itr, batch_size=batch_size, whole_paths=whole_paths)
+        finally:
+            policy.compact_infos = False
+        broadcast_infos = dict(policy.broadcast_info_values or {})
+        for path in paths:
+            path['broadcast_infos'] = broadcast_infos
+        return paths
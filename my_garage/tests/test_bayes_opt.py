@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+
+from my_garage.algos.bayes_opt import BayesOpt, latin_hypercube
+
+
+def quadratic_1d(x):
+    return (x[0] - 0.3)**2 + 1.7
+
+
+def quadratic_2d(x):
+    return (x[0] - 0.5)**2 + 2.0 * (x[1] + 1.0)**2
+
+
+class Test_BayesOpt(unittest.TestCase):
+    def test_ask_batch_size_and_bounds(self):
+        lower, upper = np.array([-1.0, 0.0]), np.array([2.0, 5.0])
+        bo = BayesOpt(lower, upper, batch_size=3, n_init=4, n_acq_samples=200, seed=0)
+        for _ in range(4): # through the end of the Latin hypercube (mixed batch) and the GP batches
+            candidates = bo.ask()
+            self.assertEqual(len(candidates), 3)
+            for x in candidates:
+                self.assertEqual(np.shape(x), (2,))
+                self.assertTrue(np.all(x >= lower) and np.all(x <= upper), x)
+            bo.tell(candidates, [quadratic_2d(x) for x in candidates])
+        self.assertEqual(bo.n_evals, 12)
+
+    def test_latin_hypercube(self):
+        # one point in every of the n strata of every dimension
+        u = latin_hypercube(7, 3, np.random.RandomState(1))
+        self.assertEqual(u.shape, (7, 3))
+        for d in range(3):
+            self.assertEqual(sorted(np.floor(u[:, d] * 7).astype(int)), list(range(7)))
+
+        lower, upper = np.array([-2.0, 10.0]), np.array([2.0, 20.0])
+        bo = BayesOpt(lower, upper, batch_size=3, n_init=6, seed=2)
+        initial = []
+        for _ in range(2):
+            candidates = bo.ask()
+            initial.extend(candidates)
+            bo.tell(candidates, [quadratic_2d(x) for x in candidates])
+        np.testing.assert_array_equal(initial, bo._init_design)
+        strata = np.floor((np.array(initial) - lower) / (upper - lower) * 6).astype(int)
+        for d in range(2):
+            self.assertEqual(sorted(strata[:, d]), list(range(6)))
+
+    def test_batch_spread(self):
+        # kriging believer: the candidates of a batch are distinct, not the EI maximum batch_size times
+        bo = BayesOpt([-2.0, -2.0], [2.0, 2.0], batch_size=4, n_init=6, n_acq_samples=500, seed=3)
+        x0 = bo.ask() + bo.ask()[:2]
+        bo.tell(x0, [quadratic_2d(x) for x in x0])
+        candidates = np.array(bo.ask())
+        self.assertEqual(len(candidates), 4)
+        distances = np.linalg.norm(candidates[:, None] - candidates[None], axis=-1)[np.triu_indices(4, k=1)]
+        self.assertGreater(np.min(distances), 1e-3)
+
+    def test_quadratic_1d(self):
+        bo = BayesOpt([-2.0], [2.0], batch_size=2, n_init=4, seed=4)
+        bo.optimize(quadratic_1d, max_evals=10)
+        self.assertEqual(bo.n_evals, 10)
+        self.assertLess(bo.best_f, 1.7 + 1e-2)
+        self.assertLess(abs(bo.best_x[0] - 0.3), 0.1)
+
+    def test_quadratic_2d(self):
+        bo = BayesOpt([-3.0, -3.0], [3.0, 3.0], batch_size=4, n_init=8, seed=5)
+        bo.optimize(quadratic_2d, max_evals=24, n_workers=1)
+        self.assertEqual(bo.n_evals, 24)
+        self.assertLess(bo.best_f, 0.05)
+        np.testing.assert_allclose(bo.best_x, [0.5, -1.0], atol=0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
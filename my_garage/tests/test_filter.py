@@ -0,0 +1,97 @@
+import types
+import unittest
+import numpy as np
+
+from my_garage.algos.ars import ARS, Worker
+from my_garage.algos.filter import MeanStdFilter, RunningStat
+
+
+class Test_RunningStat(unittest.TestCase):
+    def test_merge(self):
+        # merging the batches in any split gives the mean / var of all the samples
+        random_state = np.random.RandomState(0)
+        batches = [random_state.normal(3.0, 2.0, size=(n, 4)) for n in [1, 7, 30, 2]]
+        samples = np.concatenate(batches)
+
+        pushed = RunningStat((4,))
+        for batch in batches:
+            pushed.push(batch)
+        merged = RunningStat((4,))
+        for batch in batches:
+            other = RunningStat((4,))
+            for x in batch: # one sample at a time
+                other.push(x)
+            merged.update(other)
+
+        for stat in [pushed, merged]:
+            self.assertEqual(stat.n, len(samples))
+            np.testing.assert_allclose(stat.mean, np.mean(samples, axis=0))
+            np.testing.assert_allclose(stat.var, np.var(samples, axis=0, ddof=1))
+
+    def test_as_array(self):
+        stat = RunningStat((2, 3))
+        stat.push(np.random.RandomState(1).normal(size=(5, 2, 3)))
+        other = RunningStat.from_array(stat.as_array(), (2, 3))
+        self.assertEqual(other.n, stat.n)
+        np.testing.assert_array_equal(other.mean, stat.mean)
+        np.testing.assert_array_equal(other.m2, stat.m2)
+
+
+class Test_MeanStdFilter(unittest.TestCase):
+    def test_frozen_between_increments(self):
+        obs_filter = MeanStdFilter((3,))
+        x = np.array([1.0, -2.0, 0.5])
+        np.testing.assert_allclose(obs_filter(x, update=False), x) # no statistics yet
+
+        samples = np.random.RandomState(2).normal(5.0, 3.0, size=(20, 3))
+        outputs = [obs_filter(sample) for sample in samples]
+        np.testing.assert_allclose(outputs, samples) # the new samples only go to the buffer
+        self.assertEqual(obs_filter.buffer.n, 20)
+        self.assertEqual(obs_filter.rs.n, 0)
+
+        obs_filter.rs.update(obs_filter.buffer)
+        np.testing.assert_allclose(obs_filter(x, update=False), x) # still frozen until stats_increment
+        obs_filter.stats_increment()
+        np.testing.assert_allclose(obs_filter(x, update=False), (x - samples.mean(axis=0)) / (samples.std(axis=0, ddof=1) + 1e-8))
+
+
+class Test_SyncFilters(unittest.TestCase):
+    def test_two_workers(self):
+        # the master merges the buffers of both workers, and both workers normalize with the result
+        random_state = np.random.RandomState(3)
+        master = ARS.__new__(ARS)
+        master.observation_filter = MeanStdFilter((2,))
+        master.policy = types.SimpleNamespace()
+        master.workers = []
+        batches = [random_state.normal(-1.0, 0.5, size=(15, 2)), random_state.normal(4.0, 2.0, size=(25, 2))]
+        for batch in batches:
+            worker = Worker.__new__(Worker)
+            worker.observation_filter = MeanStdFilter((2,))
+            for x in batch:
+                worker.observation_filter(x)
+            master.workers.append(worker)
+
+        master.sync_filters()
+
+        samples = np.concatenate(batches)
+        mean, std = samples.mean(axis=0), samples.std(axis=0, ddof=1)
+        self.assertEqual(master.observation_filter.rs.n, len(samples))
+        self.assertEqual(master.observation_filter.buffer.n, 0)
+        self.assertIs(master.policy.observation_filter, master.observation_filter)
+        x = np.array([0.3, 2.0])
+        for obs_filter in [master.observation_filter] + [worker.observation_filter for worker in master.workers]:
+            np.testing.assert_allclose(obs_filter.rs.mean, mean)
+            np.testing.assert_allclose(obs_filter(x, update=False), (x - mean) / (std + 1e-8))
+            self.assertEqual(obs_filter.buffer.n, 0)
+
+        # the next round only merges the samples seen since the sync
+        for worker, batch in zip(master.workers, batches):
+            worker.observation_filter(batch[0])
+        master.sync_filters()
+        self.assertEqual(master.observation_filter.rs.n, len(samples) + 2)
+        for worker in master.workers:
+            self.assertEqual(worker.observation_filter.rs.n, len(samples) + 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import csv
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1' # only show warning and errors in TF
+import tensorflow as tf
+
+from my_garage.experiment.persistent_trainer import PersistentInnerTrainer
+from launchers.train.opt_k import cmaes_ppo_opt_k
+
+
+TRAIN_KWARGS = dict(n_epochs=2, batch_size=200, plot=False)
+
+
+class Test_PersistentInnerTrainer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        tf.compat.v1.reset_default_graph()
+
+
+    def train(self, trainer, name, k_pre):
+        '''
+        One inner training, returns the first row of its progress.csv without the timings.
+        '''
+        log_dir = os.path.join(self.tmp_dir, name)
+        os.makedirs(log_dir)
+        trainer.train(log_dir, k_pre, **TRAIN_KWARGS)
+        with open(os.path.join(log_dir, 'progress.csv')) as f:
+            row = next(csv.DictReader(f))
+        return {key: float(value) for key, value in row.items() if 'Time' not in key and value != ''}
+
+
+    def test_consecutive_trainings(self):
+        # the second training of the persistent graph starts as a freshly built one with the same seed
+        k_pre_a = np.full(cmaes_ppo_opt_k.params.k_hw.dim, -0.5)
+        k_pre_b = np.full(cmaes_ppo_opt_k.params.k_hw.dim, 0.5)
+
+        trainer = PersistentInnerTrainer(cmaes_ppo_opt_k.build_inner_task, hw_var_name='k_pre', seed=1)
+        try:
+            self.train(trainer, 'persistent_a', k_pre_a)
+            second = self.train(trainer, 'persistent_b', k_pre_b)
+        finally:
+            trainer.close()
+
+        fresh_trainer = PersistentInnerTrainer(cmaes_ppo_opt_k.build_inner_task, hw_var_name='k_pre', seed=1)
+        try:
+            fresh = self.train(fresh_trainer, 'fresh_b', k_pre_b)
+        finally:
+            fresh_trainer.close()
+
+        self.assertEqual(sorted(second), sorted(fresh))
+        self.assertEqual(second['Iteration'], 0)
+        for key in fresh:
+            np.testing.assert_allclose(second[key], fresh[key], rtol=1e-5, err_msg=key)
+
+
+if __name__ == '__main__':
+    unittest.main()
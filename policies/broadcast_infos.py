@@ -0,0 +1,39 @@
+'''
+Agent infos that do not depend on the observation, kept once per batch instead of once per step.
+
+In the HwAsAction policies the hardware means (k's / l's) and all log_stds are parameter() variables,
+so get_actions returns the same values in every row of its (n, action_dim) 'mean' and 'log_std'
+arrays, which the sampler stores for every step and PPO feeds back as (N, T, action_dim) arrays.
+A policy marks these columns in broadcast_info_masks. While compact_infos is set (by
+my_garage.samplers.broadcast_infos_sampler.BroadcastInfosSampler), get_actions returns only the
+other columns per step and keeps the marked ones in broadcast_info_values, which the sampler
+stores once per batch and my_garage.algos.broadcast_ppo.BroadcastInfosPPO broadcasts in the graph.
+'''
+
+
+class BroadcastInfos:
+    '''
+    Mixin for policies with state-independent dist info columns. Define broadcast_info_masks
+    and pass the info of get_actions through _compact_infos.
+    '''
+    compact_infos = False # set by BroadcastInfosSampler while sampling
+    broadcast_info_values = None
+
+
+    @property
+    def broadcast_info_masks(self):
+        '''
+        {agent info key: bool mask over its last axis, True for the columns that do not depend on the observation}
+        '''
+        return {}
+
+
+    def _compact_infos(self, info):
+        if not self.compact_infos:
+            return info
+        values = {}
+        for key, mask in self.broadcast_info_masks.items():
+            values[key] = info[key][0, mask]
+            info[key] = info[key][:, ~mask] # (n, 0) if the whole key is state-independent
+        self.broadcast_info_values = values
+        return info
@@ -0,0 +1,142 @@
+'''
+Per-episode hardware sampling for the HwAsAction policies (params.hw_sampling = 'per_episode').
+
+The hardware part of the action (k or l of every spring / segment) is drawn once at the start of an
+episode from the mech distribution and held until the next reset, as the physical hardware would be.
+Only the input force is sampled at every step. The action stays [f, hardware...] (1 + n wide) at every
+step, the held hardware is repeated after the first one, so the envs and the samplers are unchanged.
+The policy marks the first step of each episode in its agent infos ('episode_start'), and
+EpisodeHardwareGaussian counts the hardware dims in the log-likelihood, KL and entropy only there, so
+their log-likelihood enters the PPO objective once per episode, weighted by the advantage of the first
+step. That is the discounted return of the episode minus the baseline only with gae_lambda = 1, which
+the PPO launchers set for 'per_episode' (BroadcastInfosPPO asserts it).
+
+NPO computes one advantage per step in its graph for the whole action, so gae_lambda = 1 also holds for
+the force: its advantages are Monte-Carlo returns minus the baseline, unbiased but with more variance
+than GAE with params.ppo_algo_kwargs['gae_lambda']. A separate advantage for the hardware term would
+need a policy loss of its own.
+'''
+
+import numpy as np
+import tensorflow as tf
+
+from garage.tf.distributions.diagonal_gaussian import DiagonalGaussian
+
+
+class EpisodeHardwareGaussian(DiagonalGaussian):
+    '''
+    Diagonal Gaussian over [per-step dims, per-episode dims] for the HwAsAction policies with
+    per-episode hardware sampling: the last n_episode_dims (the hardware) are drawn once at the
+    start of an episode and held, so they count in the log-likelihood, KL and entropy only at the
+    steps where the dist info 'episode_start' is 1.
+    '''
+    def __init__(self, dim, n_episode_dims, name='EpisodeHardwareGaussian'):
+        super().__init__(dim=dim, name=name)
+        self._n_episode_dims = n_episode_dims
+        self._step_mask = np.float32([1.0] * (dim - n_episode_dims) + [0.0] * n_episode_dims)
+        self._episode_mask = 1.0 - self._step_mask
+
+
+    def _weights(self, dist_info):
+        # (?, dim): 1 for the per-step dims, episode_start for the per-episode ones
+        return self._step_mask + dist_info['episode_start'] * self._episode_mask
+
+
+    def kl(self, old_dist_info, new_dist_info):
+        old_std = np.exp(old_dist_info['log_std'])
+        new_std = np.exp(new_dist_info['log_std'])
+        numerator = np.square(old_dist_info['mean'] - new_dist_info['mean']) + np.square(old_std) - np.square(new_std)
+        denominator = 2 * np.square(new_std) + 1e-8
+        kl = numerator / denominator + new_dist_info['log_std'] - old_dist_info['log_std']
+        return np.sum(kl * self._weights(new_dist_info), axis=-1)
+
+
+    def kl_sym(self, old_dist_info_vars, new_dist_info_vars, name=None):
+        with tf.name_scope(name, 'kl_sym', [old_dist_info_vars, new_dist_info_vars]):
+            old_std = tf.exp(old_dist_info_vars['log_std'])
+            new_std = tf.exp(new_dist_info_vars['log_std'])
+            numerator = tf.square(old_dist_info_vars['mean'] - new_dist_info_vars['mean']) + tf.square(old_std) - tf.square(new_std)
+            denominator = 2 * tf.square(new_std) + 1e-8
+            kl = numerator / denominator + new_dist_info_vars['log_std'] - old_dist_info_vars['log_std']
+            return tf.reduce_sum(kl * self._weights(new_dist_info_vars), axis=-1)
+
+
+    def log_likelihood_sym(self, x_var, dist_info_vars, name=None):
+        with tf.name_scope(name, 'log_likelihood_sym', [x_var, dist_info_vars]):
+            log_stds = dist_info_vars['log_std']
+            zs = (x_var - dist_info_vars['mean']) / tf.exp(log_stds)
+            logli = -log_stds - 0.5 * tf.square(zs) - 0.5 * np.log(2 * np.pi)
+            return tf.reduce_sum(logli * self._weights(dist_info_vars), axis=-1)
+
+
+    def log_likelihood(self, xs, dist_info):
+        log_stds = dist_info['log_std']
+        zs = (xs - dist_info['mean']) / np.exp(log_stds)
+        logli = -log_stds - 0.5 * np.square(zs) - 0.5 * np.log(2 * np.pi)
+        return np.sum(logli * self._weights(dist_info), axis=-1)
+
+
+    def entropy(self, dist_info):
+        return np.sum((dist_info['log_std'] + np.log(np.sqrt(2 * np.pi * np.e))) * self._weights(dist_info), axis=-1)
+
+
+    def entropy_sym(self, dist_info_var, name=None):
+        with tf.name_scope(name, 'entropy_sym', [dist_info_var]):
+            return tf.reduce_sum((dist_info_var['log_std'] + np.log(np.sqrt(2 * np.pi * np.e))) * self._weights(dist_info_var), axis=-1)
+
+
+    @property
+    def dist_info_specs(self):
+        return [('mean', (self.dim, )), ('log_std', (self.dim, )), ('episode_start', (1, ))]
+
+
+class EpisodeHardwareSampling:
+    '''
+    Mixin for the HwAsAction policies, whose actions are [f, hardware...]. Call
+    _init_hw_sampling in __init__, _hold_hardware on the samples of get_actions
+    and _add_episode_start on the dict of dist_info_sym.
+    '''
+    def _init_hw_sampling(self, hw_sampling):
+        assert hw_sampling in ['per_step', 'per_episode'], 'unknown hw_sampling {}'.format(hw_sampling)
+        self.hw_sampling = hw_sampling
+        self._held_hw = None
+        self._episode_start = None
+        if hw_sampling == 'per_episode':
+            self._dist = EpisodeHardwareGaussian(dim=self.action_dim, n_episode_dims=self.action_dim - 1)
+
+
+    @property
+    def state_info_specs(self):
+        return [('episode_start', (1, ))] if self.hw_sampling == 'per_episode' else []
+
+
+    def reset(self, dones=None):
+        '''
+        Mark the envs in dones (all if None) as starting a new episode, their hardware is drawn at the next action.
+        '''
+        if self.hw_sampling != 'per_episode':
+            return
+        dones = np.ones(1, dtype=bool) if dones is None else np.asarray(dones, dtype=bool)
+        if self._episode_start is None or len(self._episode_start) != len(dones):
+            self._held_hw = np.zeros((len(dones), self.action_dim - 1))
+            self._episode_start = np.ones(len(dones), dtype=bool)
+        self._episode_start[dones] = True
+
+
+    def _hold_hardware(self, samples, info):
+        if self.hw_sampling != 'per_episode':
+            return samples, info
+        if self._episode_start is None or len(self._episode_start) != len(samples):
+            self.reset(np.ones(len(samples), dtype=bool))
+        start = self._episode_start
+        self._held_hw[start] = samples[start, 1:]
+        samples = np.concatenate([samples[:, :1], self._held_hw], axis=1)
+        info['episode_start'] = start.astype(np.float32)[:, None]
+        self._episode_start = np.zeros(len(samples), dtype=bool)
+        return samples, info
+
+
+    def _add_episode_start(self, dist_info, state_info_vars):
+        if self.hw_sampling == 'per_episode':
+            dist_info['episode_start'] = state_info_vars['episode_start']
+        return dist_info
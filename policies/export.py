@@ -0,0 +1,439 @@
+'''
+Lightweight export of the comp-mech policies: config + parameters in one npz.
+
+A garage snapshot (params.pkl) holds the algo, the env and the policy, and
+unpickling the policy rebuilds its TF graph and session through __setstate__.
+For playback, evaluation and CMA-ES warm starts only the policy config and its
+parameter values are needed, with the map of the hardware variable to the
+per-element k's / l's (policies/hw_parameterization.py) and the frozen
+observation filter of ARS policies:
+
+    export_policy(policy, 'policy.npz')              # from a live TF policy
+    policy = load_numpy_policy('policy.npz')         # pure numpy forward pass, no TF
+    policy = load_tf_policy('policy.npz')            # rebuilds the TF policy in the default session
+    x0 = load_flat_params('policy.npz')              # same layout as policy.get_param_values()
+
+Usage:
+    python policies/export.py data/local/.../params.pkl policy.npz
+'''
+
+import os
+import re
+import json
+import argparse
+import importlib
+import importlib.util
+
+import numpy as np
+
+from policies.hw_parameterization import HwParameterization
+from my_garage.algos.filter import MeanStdFilter
+
+
+FORMAT_VERSION = 2 # 2: hardware map and observation filter in the export
+
+# policy class -> (case, hardware param name)
+_POLICY_CASES = {
+    'CompMechPolicy_OptK_HwAsAction': ('opt_k', 'k'),
+    'CompMechPolicy_OptK_HwAsPolicy': ('opt_k', 'k'),
+    'CompMechPolicy_OptK_HwInPolicyAndAction': ('opt_k', 'k'),
+    'CompMechPolicy_OptL_HwAsAction': ('opt_l', 'l'),
+    'CompMechPolicy_OptL_HwAsPolicy': ('opt_l', 'l'),
+}
+
+# numbers from the params module needed by the forward pass, stored in the config
+_CONFIG_PARAMS = {
+    'opt_k': ['pos_range', 'half_vel_range', 'half_force_range', 'k_range', 'k_lb', 'n_springs', 'trq_const', 'r_shaft'],
+    'opt_l': ['pos_range', 'half_vel_range', 'half_force_range', 'l_range', 'l_lb', 'n_segments', 'k_interface', 'b_interface'],
+}
+
+_PARAMS_MODULES = {'opt_k': 'shared_params.params_opt_k', 'opt_l': 'shared_params.params_opt_l'}
+
+# env vars read by the params modules at import, see load_params
+_N_ELEMENTS_ENV_VARS = {'opt_k': 'HWASP_N_SPRINGS', 'opt_l': 'HWASP_N_SEGMENTS'}
+
+
+def _policy_case(class_name):
+    if class_name not in _POLICY_CASES:
+        raise ValueError('unsupported policy class {} for export, supported: {}'.format(class_name, sorted(_POLICY_CASES)))
+    return _POLICY_CASES[class_name]
+
+
+def policy_mode(policy):
+    '''
+    One of 'fixed_hw', 'hw_as_action', 'hw_as_policy', 'hw_as_policy_substep_coupling', 'hw_in_policy_and_action'.
+    '''
+    class_name = type(policy).__name__
+    if class_name.endswith('HwInPolicyAndAction'):
+        return 'hw_in_policy_and_action'
+    if type(policy.mech_policy_model).__name__.endswith('SubstepCoupling'):
+        return 'hw_as_policy_substep_coupling'
+    if class_name.endswith('HwAsPolicy'):
+        return 'hw_as_policy'
+    if type(policy.mech_policy_model).__name__.endswith('FixedHW'):
+        return 'fixed_hw'
+    return 'hw_as_action'
+
+
+def _relative_name(var_name, scope_name):
+    name = var_name.split(':')[0]
+    if name.startswith(scope_name + '/'):
+        name = name[len(scope_name) + 1:]
+    return name
+
+
+def _hw_config(policy, params, hw_name, n_pre):
+    '''
+    Map of the {k,l}_pre variable (n_pre entries) to the per-element hardware: the search space k_hw / l_hw
+    of the FixedHW and HwAsAction mech models, one entry per element in the others.
+    '''
+    if policy_mode(policy) in ('fixed_hw', 'hw_as_action'):
+        hw = getattr(policy.mech_policy_model, '{}_hw'.format(hw_name))
+    else:
+        hw = HwParameterization(n_pre, getattr(params, '{}_lb'.format(hw_name)), getattr(params, '{}_ub'.format(hw_name)))
+    return dict(parameterization=hw.mode, n_groups=int(params.hw_n_groups), n_elements=int(hw.n_elements),
+                element_index=hw.element_index.tolist(), element_scale=float(hw.element_scale),
+                lower=hw.lower.tolist(), upper=hw.upper.tolist())
+
+
+def save_export(path, config, names, values, n_trainable, observation_filter=None):
+    '''
+    Write an export: config, the named parameter values (the first n_trainable in get_param_values()
+    order) and the frozen mean / std of a MeanStdFilter if given.
+    '''
+    config = dict(config, observation_filter=None)
+    arrays = {'param_{}'.format(i): np.asarray(val) for i, val in enumerate(values)}
+    if observation_filter is not None and observation_filter.get_stats()[0] is not None:
+        config['observation_filter'] = dict(demean=bool(observation_filter.demean), destd=bool(observation_filter.destd))
+        arrays['obs_filter_mean'], arrays['obs_filter_std'] = observation_filter.get_stats()
+    np.savez_compressed(path,
+                        config=np.array(json.dumps(config)),
+                        param_names=np.array(names),
+                        n_trainable=np.array(n_trainable),
+                        flat_params=np.concatenate([np.reshape(v, -1) for v in values[:n_trainable]]) if n_trainable else np.zeros(0),
+                        **arrays)
+    return config
+
+
+def export_policy(policy, path, params_module=None, sess=None):
+    '''
+    Write the config and parameter values of a comp-mech TF policy to a compressed npz.
+
+    Args:
+        policy: one of the CompMechPolicy_* policies, built in the default (or given) session
+        path (str): output .npz file
+        params_module (str): module the policy was built with, default: shared_params.params_opt_k / _l
+    '''
+    class_name = type(policy).__name__
+    case, hw_name = _policy_case(class_name)
+
+    import tensorflow as tf
+
+    sess = sess or tf.compat.v1.get_default_session()
+    params_module = params_module or _PARAMS_MODULES[case]
+    params = importlib.import_module(params_module)
+
+    scope_name = policy._variable_scope.name
+    trainable_vars = policy.get_params()
+    # fixed hardware (k_pre / l_pre) is not trainable but is part of the policy
+    fixed_vars = [v for v in tf.compat.v1.get_collection(tf.compat.v1.GraphKeys.GLOBAL_VARIABLES, scope=scope_name)
+                  if v not in trainable_vars and re.search(r'(^|/)[kl]_pre(/|$)', _relative_name(v.name, scope_name))]
+    trainable_values = sess.run(trainable_vars)
+    fixed_values = sess.run(fixed_vars)
+
+    names = [_relative_name(v.name, scope_name) for v in trainable_vars + fixed_vars]
+    values = trainable_values + fixed_values
+    config = dict(format_version=FORMAT_VERSION,
+                  policy_class=class_name,
+                  case=case,
+                  mode=policy_mode(policy),
+                  hw_name=hw_name,
+                  policy_name=policy.name,
+                  params_module=params_module,
+                  obs_dim=int(policy.obs_dim),
+                  action_dim=int(policy.action_dim),
+                  hidden_sizes=[],
+                  params={key: float(getattr(params, key)) for key in _CONFIG_PARAMS[case]})
+    named = dict(zip(names, values))
+    config['hw'] = _hw_config(policy, params, hw_name, np.size(named[_find(names, r'(^|/){}_pre(/|$)'.format(hw_name))]))
+    config['hidden_sizes'] = [int(named[n].shape[1]) for n in _mlp_layer_names(names)[:-1]]
+    # the observations are filtered before the forward pass (policies/opt_*/policies.py, set by ARS)
+    return save_export(path, config, names, values, len(trainable_vars), observation_filter=policy.observation_filter)
+
+
+def load_export(path):
+    '''
+    Returns:
+        config (dict), named parameter values (dict), names of the trainable params in get_param_values() order
+        and the frozen observation filter (MeanStdFilter or None)
+    '''
+    with np.load(path) as data:
+        config = json.loads(str(data['config']))
+        names = [str(n) for n in data['param_names']]
+        named = {name: data['param_{}'.format(i)] for i, name in enumerate(names)}
+        n_trainable = int(data['n_trainable'])
+        observation_filter = None
+        if config.get('observation_filter') is not None:
+            mean = data['obs_filter_mean']
+            observation_filter = MeanStdFilter(mean.shape, **config['observation_filter'])
+            observation_filter.mean, observation_filter.std = mean.astype(np.float64), data['obs_filter_std'].astype(np.float64)
+    return config, named, names[:n_trainable], observation_filter
+
+
+def load_params(config):
+    '''
+    The params module of an export. It reads the number of springs / segments and the hardware
+    parameterization from env vars at import, so it is imported afresh (not in sys.modules) with the
+    values of the export.
+    '''
+    hw = config.get('hw')
+    if hw is None: # format 1
+        return importlib.import_module(config['params_module'])
+    env_vars = {_N_ELEMENTS_ENV_VARS[config['case']]: str(hw['n_elements']), 'HWASP_HW_PARAMETERIZATION': hw['parameterization']}
+    saved = {key: os.environ.get(key) for key in env_vars}
+    os.environ.update(env_vars)
+    try:
+        spec = importlib.util.find_spec(config['params_module'])
+        params = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(params)
+    finally:
+        for key, val in saved.items():
+            if val is None:
+                del os.environ[key]
+            else:
+                os.environ[key] = val
+    if config['mode'] in ('fixed_hw', 'hw_as_action'):
+        params_hw = getattr(params, '{}_hw'.format(config['hw_name']))
+        if params_hw.element_index.tolist() != hw['element_index'] or not np.allclose(params_hw.upper, hw['upper']):
+            raise ValueError('{} gives {}, the export has a {} hardware parameterization with {} groups'.format(
+                config['params_module'], params_hw, hw['parameterization'], hw['n_groups']))
+    return params
+
+
+def load_flat_params(path):
+    '''
+    The trainable parameters as one flat vector, same layout as policy.get_param_values().
+    '''
+    with np.load(path) as data:
+        return data['flat_params'].copy()
+
+
+def _mlp_layer_names(names):
+    '''
+    Kernel names of the (single) MLP in the policy, ordered hidden_0, hidden_1, ..., output.
+    '''
+    hidden = sorted((int(m.group(1)), n) for n in names for m in [re.search(r'(?:^|/)hidden_(\d+)/kernel$', n)] if m)
+    output = [n for n in names if re.search(r'(?:^|/)output/kernel$', n)]
+    return [n for _, n in hidden] + output
+
+
+def _find(names, pattern):
+    matches = [n for n in names if re.search(pattern, n)]
+    if len(matches) != 1:
+        raise ValueError('expected exactly one parameter matching {}, found {}'.format(pattern, matches))
+    return matches[0]
+
+
+def _sigmoid(x):
+    return 1/(1 + np.exp(-x))
+
+
+class NumpyCompMechPolicy:
+    '''
+    Numpy re-implementation of the forward pass of the CompMechPolicy_* policies,
+    with the same get_action(s) outputs (mean, log_std and the hardware sum k / l).
+    '''
+    def __init__(self, config, named_params, trainable_names, observation_filter=None):
+        self.config = config
+        self.case = config['case']
+        self.mode = config['mode']
+        self.hw_name = config['hw_name']
+        self.obs_dim = config['obs_dim']
+        self.action_dim = config['action_dim']
+        self.p = config['params']
+        self._trainable_names = list(trainable_names)
+        self._shapes = [np.shape(named_params[n]) for n in self._trainable_names]
+        self._named = {n: np.asarray(v, dtype=np.float64) for n, v in named_params.items()}
+
+        names = list(self._named)
+        kernels = _mlp_layer_names(names)
+        self._layers = [(k, k[:-len('kernel')] + 'bias') for k in kernels]
+        self._hw_pre_name = _find(names, r'(^|/){}_pre(/|$)'.format(self.hw_name))
+        self._log_std_name = _find(names, r'(^|/)log_std(/|$)')
+        self.observation_filter = observation_filter
+
+        hw = config.get('hw')
+        if hw is None: # format 1, one pre-sigmoid entry per element
+            n_elements = self._named[self._hw_pre_name].size
+            lb, hw_range = self.p['{}_lb'.format(self.hw_name)], self.p['{}_range'.format(self.hw_name)]
+            hw = dict(element_index=np.arange(n_elements), element_scale=1.0, lower=[lb] * n_elements, upper=[lb + hw_range] * n_elements)
+        # as _hw_ts of the mech models
+        self._element_index = np.asarray(hw['element_index'], dtype=int)
+        self._element_scale = hw['element_scale']
+        self._hw_lower = np.asarray(hw['lower'], dtype=np.float64)
+        self._hw_upper = np.asarray(hw['upper'], dtype=np.float64)
+
+
+    @property
+    def vectorized(self):
+        return True
+
+
+    def _mlp(self, x):
+        for kernel, bias in self._layers:
+            x = np.tanh(x.dot(self._named[kernel]) + self._named[bias]) # tanh hidden and output nonlinearities
+        return x
+
+
+    def hardware(self):
+        '''
+        Per-element hardware values (k_i or l_i).
+        '''
+        hw_compact = _sigmoid(self._named[self._hw_pre_name].reshape(-1)) * (self._hw_upper - self._hw_lower) + self._hw_lower
+        return hw_compact[self._element_index] * self._element_scale
+
+
+    def dist_info(self, observations):
+        obs = np.asarray(observations, dtype=np.float64).reshape(-1, self.obs_dim)
+        if self.observation_filter is not None:
+            obs = self.observation_filter(obs, update=False)
+        n = obs.shape[0]
+        hw = self.hardware()
+        obs_normalized = obs[:, :2] / [self.p['pos_range'], self.p['half_vel_range']]
+        if self.mode in ('hw_as_action', 'fixed_hw'):
+            f = self._mlp(obs_normalized) * self.p['half_force_range']
+            mean = np.concatenate([f, np.tile(hw, (n, 1))], axis=1)
+        elif self.mode == 'hw_in_policy_and_action':
+            hw_normalized = _sigmoid(self._named[self._hw_pre_name].reshape(-1))
+            f = self._mlp(np.concatenate([obs_normalized, np.tile(hw_normalized, (n, 1))], axis=1)) * self.p['half_force_range']
+            mean = np.concatenate([f, np.tile(hw, (n, 1))], axis=1)
+        elif self.case == 'opt_k': # hw_as_policy, the comp policy sees the raw obs
+            f = self._mlp(obs)[:, 0] * self.p['trq_const'] / self.p['r_shaft'] * self.p['half_force_range']
+            pi = f - obs[:, 0] * np.sum(hw)
+            mean = np.stack([pi, f], axis=1)
+        elif self.mode == 'hw_as_policy_substep_coupling': # opt_l, the env computes the interface force from l
+            f = self._mlp(obs[:, 0:2])[:, 0] * self.p['half_force_range']
+            mean = np.stack([np.full(n, np.sum(hw)), f], axis=1)
+        else: # opt_l hw_as_policy
+            f = self._mlp(obs[:, 0:2])[:, 0] * self.p['half_force_range']
+            l = np.sum(hw)
+            f1 = 0.5 * self.p['k_interface'] * (obs[:, 2] - obs[:, 0] - l) + 0.5 * self.p['b_interface'] * (obs[:, 3] - obs[:, 1])
+            mean = np.stack([f1, -f1, f], axis=1)
+        log_std = np.tile(self._named[self._log_std_name].reshape(-1), (n, 1))
+        return mean, log_std
+
+
+    def get_actions(self, observations):
+        means, log_stds = self.dist_info(observations)
+        samples = np.random.normal(size=means.shape) * np.exp(log_stds) + means
+        info = dict(mean=means, log_std=log_stds)
+        hw_sum = np.full(means.shape[0], np.sum(self.hardware()))
+        info['k_sum' if self.mode == 'hw_in_policy_and_action' else self.hw_name] = hw_sum
+        return samples, info
+
+
+    def get_action(self, observation):
+        samples, info = self.get_actions([observation])
+        return samples[0], {key: val[0] for key, val in info.items()}
+
+
+    def get_param_values(self):
+        return np.concatenate([self._named[n].reshape(-1) for n in self._trainable_names])
+
+
+    def set_param_values(self, flat_params):
+        flat_params = np.asarray(flat_params, dtype=np.float64)
+        offset = 0
+        for name, shape in zip(self._trainable_names, self._shapes):
+            size = int(np.prod(shape))
+            self._named[name] = flat_params[offset:offset + size].reshape(shape)
+            offset += size
+
+
+    def reset(self, dones=None):
+        pass
+
+
+def load_numpy_policy(path):
+    config, named, trainable_names, observation_filter = load_export(path)
+    return NumpyCompMechPolicy(config, named, trainable_names, observation_filter)
+
+
+def make_env(config, params=None, tf_env=True):
+    '''
+    The env the exported policy was trained on (wrapped in a TfEnv if tf_env).
+    '''
+    params = params or load_params(config)
+    if config['case'] == 'opt_k':
+        from mass_spring_envs.envs import mass_spring_env_opt_k as envs
+        env_class = envs.MassSpringEnv_OptK_HwAsPolicy if config['mode'] == 'hw_as_policy' else envs.MassSpringEnv_OptK_HwAsAction
+    else:
+        from mass_spring_envs.envs import mass_spring_env_opt_l as envs
+        env_class = {'hw_as_policy': envs.MassSpringEnv_OptL_HwAsPolicy,
+                     'hw_as_policy_substep_coupling': envs.MassSpringEnv_OptL_HwAsPolicy_SubstepCoupling}.get(config['mode'], envs.MassSpringEnv_OptL_HwAsAction)
+    if not tf_env:
+        return env_class(params)
+    from garage.tf.envs import TfEnv
+    return TfEnv(env_class(params))
+
+
+def load_tf_policy(path, env_spec=None, sess=None):
+    '''
+    Rebuild the TF policy from an export in the default (or given) session and load its parameters.
+    '''
+    import tensorflow as tf
+    from garage.tf.models.mlp_model import MLPModel
+
+    config, named, _, observation_filter = load_export(path)
+    params = load_params(config)
+    if env_spec is None:
+        env_spec = make_env(config, params).spec
+    sess = sess or tf.compat.v1.get_default_session()
+
+    if config['case'] == 'opt_k':
+        from policies.opt_k import models, policies
+        case_cls = 'OptK'
+    else:
+        from policies.opt_l import models, policies
+        case_cls = 'OptL'
+
+    if config['mode'] == 'hw_in_policy_and_action':
+        model = getattr(models, 'CompMechPolicyModel_{}_HwInPolicyAndAction'.format(case_cls))(params)
+        policy = getattr(policies, config['policy_class'])(name=config['policy_name'], env_spec=env_spec, comp_mech_policy_model=model)
+    else:
+        comp_policy_model = MLPModel(output_dim=1,
+            hidden_sizes=tuple(config['hidden_sizes']),
+            hidden_nonlinearity=tf.nn.tanh,
+            output_nonlinearity=tf.nn.tanh)
+        mech_mode = {'fixed_hw': 'FixedHW', 'hw_as_action': 'HwAsAction', 'hw_as_policy': 'HwAsPolicy',
+                     'hw_as_policy_substep_coupling': 'HwAsPolicy_SubstepCoupling'}[config['mode']]
+        mech_policy_model = getattr(models, 'MechPolicyModel_{}_{}'.format(case_cls, mech_mode))(params)
+        policy = getattr(policies, config['policy_class'])(name=config['policy_name'], env_spec=env_spec,
+            comp_policy_model=comp_policy_model, mech_policy_model=mech_policy_model)
+
+    scope_name = policy._variable_scope.name
+    policy_vars = tf.compat.v1.get_collection(tf.compat.v1.GraphKeys.GLOBAL_VARIABLES, scope=scope_name)
+    sess.run(tf.compat.v1.variables_initializer(policy_vars))
+    vars_by_name = {_relative_name(v.name, scope_name): v for v in policy_vars}
+    for name, value in named.items():
+        vars_by_name[name].load(value, sess)
+    if observation_filter is not None:
+        policy.observation_filter = observation_filter
+        policy.update_filter = False
+    return policy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('snapshot', type=str, help='path to the garage snapshot file (params.pkl)')
+    parser.add_argument('output', type=str, help='path of the exported .npz')
+    parser.add_argument('--params_module', type=str, default=None, help='params module the policy was trained with')
+    args = parser.parse_args()
+
+    import joblib
+    import tensorflow as tf
+
+    with tf.compat.v1.Session():
+        data = joblib.load(args.snapshot)
+        config = export_policy(data['algo'].policy, args.output, params_module=args.params_module)
+    print(json.dumps(config, indent=2))
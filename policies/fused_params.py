@@ -0,0 +1,69 @@
+'''
+Flat parameter vector get/set for the comp-mech policies in one session call each.
+
+garage's Policy.set_param_values loads every variable separately (one session.run per variable),
+and get_param_values fetches the variables as a list that is flattened in numpy. ARS sets the
+parameters twice per direction and CMA-ES once per candidate, so this overhead is paid per rollout.
+FusedParamValues builds, once per policy, a single float32 placeholder split into the variable
+shapes with one grouped assign op, and a single concatenated tensor of all variables, both run
+through session callables. The flat layout is the same as garage's (get_params() order, row-major).
+'''
+
+import numpy as np
+import tensorflow as tf
+
+
+class FusedParamValues:
+    '''
+    Mixin for garage TF policies, put it before the garage base class:
+
+        class MyBasePolicy_OptK(FusedParamValues, StochasticPolicy)
+    '''
+
+    def _fused_param_ops(self):
+        params = self.get_params()
+        key = tuple(param.name for param in params)
+        ops = self.__dict__.get('_fused_params')
+        if ops is None or ops['key'] != key:
+            sess = tf.compat.v1.get_default_session()
+            shapes = [param.shape.as_list() for param in params]
+            sizes = [int(np.prod(shape)) for shape in shapes]
+            with tf.name_scope('{}_fused_params'.format(self.name)):
+                flat_ph = tf.compat.v1.placeholder(params[0].dtype.base_dtype, shape=(sum(sizes),), name='flat_param_values')
+                assign_op = tf.group(*[tf.compat.v1.assign(param, tf.reshape(value, shape))
+                                       for param, value, shape in zip(params, tf.split(flat_ph, sizes), shapes)], name='assign')
+                flat_ts = tf.concat([tf.reshape(param, [-1]) for param in params], axis=0, name='flat_param_values')
+            ops = dict(key=key,
+                       size=sum(sizes),
+                       set=sess.make_callable(assign_op, feed_list=[flat_ph]),
+                       get=sess.make_callable(flat_ts))
+            self._fused_params = ops
+        return ops
+
+
+    def get_param_values(self, **tags):
+        '''
+        All trainable parameters as one flat array, fetched in a single session call.
+        '''
+        if tags:
+            return super().get_param_values(**tags)
+        return self._fused_param_ops()['get']()
+
+
+    def set_param_values(self, param_values, name=None, **tags):
+        '''
+        Assign a flat array (as returned by get_param_values) to all trainable parameters
+        through one placeholder and one grouped assign op.
+        '''
+        if tags:
+            return super().set_param_values(param_values, name=name, **tags)
+        ops = self._fused_param_ops()
+        param_values = np.asarray(param_values).reshape(-1)
+        assert param_values.size == ops['size'], 'expected {} parameter values, got {}'.format(ops['size'], param_values.size)
+        ops['set'](param_values)
+
+
+    def __getstate__(self):
+        new_dict = super().__getstate__()
+        new_dict.pop('_fused_params', None) # session callables, rebuilt on the first call
+        return new_dict
@@ -0,0 +1,76 @@
+'''
+Reduced-dimension search spaces for the hardware (the k's of the springs / the l's of the segments).
+
+The envs only use the sum of the elements, so searching every element separately spends most of the
+outer-loop dimensions (CMA-ES) and of the perturbed parameters (ARS) on directions that do not change
+the dynamics. HwParameterization maps a compact vector x to the n per-element values:
+
+    'per_element' : x has n entries, element i = x[i]                    (the previous behaviour)
+    'total'       : x has 1 entry, the total in [n*lb, n*ub], element i = x[0] / n
+    'groups'      : x has n_groups entries, the elements of a group (contiguous, sizes differ by at most one)
+                    share its value, element i = x[group of i]
+
+Every mode maps its box [lower, upper] into the per-element box [lb, ub], so the elements keep their bounds.
+The map is elements = x[..., element_index] * element_scale, the same gather in numpy and TF (the mech models).
+'''
+
+import numpy as np
+
+
+HW_PARAMETERIZATIONS = ['per_element', 'total', 'groups']
+
+
+class HwParameterization:
+    '''
+    Args:
+        n_elements (int): number of springs / segments
+        lb, ub (float): bounds of each element
+        mode (str): one of HW_PARAMETERIZATIONS
+        n_groups (int): number of groups for 'groups'
+    '''
+    def __init__(self, n_elements, lb, ub, mode='per_element', n_groups=1):
+        assert mode in HW_PARAMETERIZATIONS, 'unknown hardware parameterization {}, choose from {}'.format(mode, HW_PARAMETERIZATIONS)
+        self.n_elements = n_elements
+        self.lb = lb
+        self.ub = ub
+        self.mode = mode
+        if mode == 'per_element':
+            self.element_index = np.arange(n_elements)
+            self.element_scale = 1.0
+        elif mode == 'total':
+            self.element_index = np.zeros(n_elements, dtype=int)
+            self.element_scale = 1.0 / n_elements
+        else:
+            assert 1 <= n_groups <= n_elements, 'n_groups must be between 1 and {}'.format(n_elements)
+            self.element_index = np.concatenate([[i] * len(group) for i, group in enumerate(np.array_split(np.arange(n_elements), n_groups))]).astype(int)
+            self.element_scale = 1.0
+        self.dim = int(self.element_index.max()) + 1
+        self.lower = np.full(self.dim, lb / self.element_scale)
+        self.upper = np.full(self.dim, ub / self.element_scale)
+
+
+    @property
+    def center(self):
+        return (self.lower + self.upper) / 2
+
+
+    def to_elements(self, x):
+        '''
+        (..., dim) -> (..., n_elements)
+        '''
+        return np.asarray(x)[..., self.element_index] * self.element_scale
+
+
+    def from_elements(self, elements):
+        '''
+        (..., n_elements) -> (..., dim), the least-squares x of the per-element values (their mean per group,
+        their sum for 'total'), to_elements(from_elements(e)) == e if e is representable.
+        '''
+        elements = np.asarray(elements, dtype=np.float64)
+        counts = np.bincount(self.element_index, minlength=self.dim)
+        sums = np.stack([elements[..., self.element_index == i].sum(axis=-1) for i in range(self.dim)], axis=-1)
+        return sums / counts / self.element_scale
+
+
+    def __repr__(self):
+        return 'HwParameterization({}, n_elements={}, dim={})'.format(self.mode, self.n_elements, self.dim)
@@ -0,0 +1,255 @@
+'''
+Model-based fitness of hardware candidates: the LQR controller of the linear spring-mass model.
+
+For a fixed hardware both envs are linear in the state x = (y1, v1) with a constant offset,
+
+    (m1 + m2) y1'' = b u + (m1 + m2) g - k y1,   y2 = y1 + l,
+
+with the action u (b = trq_const / r_shaft for opt_k, whose action is the motor current, 1 for opt_l),
+k the sum of the springs (opt_k) or params.k (opt_l) and l params.l (opt_k) or the sum of the segments
+(opt_l). The goal y2 = h is the equilibrium x_ref = (h - l, 0) held by u_eq = (k (h - l) - (m1 + m2) g) / b.
+Over one action (n_steps_per_action substeps of dt) the deviations from it follow dx' = A dx + B du with
+the integrator of params.integrator. The discounted Riccati equation of a quadratic proxy of calc_reward
+
+    q_y (y2 - h)^2 + q_v v1^2 + r (b du)^2,   q_y = alpha / pos_scale, q_v = beta / vel_scale, r = gamma / force_scale
+
+(each absolute-value penalty of calc_reward replaced by the quadratic that equals it at the given scale)
+gives the gain of u = u_eq - gain dx. The fitness of a candidate is the mean discounted return of this
+controller with the env's reward, action and state clipping over a batch of initial states, drawn as by
+reset and shared by all candidates. Everything is batched over the candidates, so thousands of them cost
+about one rollout:
+
+    fitness = LQRFitness(params, n_episodes=16, discount=params.ppo_algo_kwargs['discount'])
+    fitness(candidates)         # (M, hw.dim) in the search space of params.k_hw / l_hw -> (M,)
+    hw, best = fitness.search() # the best total stiffness / length, e.g. x0 of the CMA-ES outer loop
+    fitness.controller(hw)      # LinearController, a numpy policy for evaluate_envs
+
+The fitness has the interface of launchers/play/evaluate_hw_conditioned.HwConditionedEvaluator, so
+search_hardware works on it too.
+'''
+
+import numpy as np
+
+from mass_spring_envs.envs.mass_spring_env_opt_k import get_soft_conditioned_val_batched
+
+
+# sigmoid_coeff of the force penalty switch in calc_reward of mass_spring_env_opt_k / opt_l
+REWARD_SWITCH_SHARPNESS = dict(opt_k=10.0, opt_l=50.0)
+
+
+def spring_mass_propagator(stiffness, mass, dt, n_steps, integrator):
+    '''
+    Batched (Phi, Gamma) of one action of m y'' = u - k y, x_next = Phi x + Gamma u, for the integrators of
+    the envs: 'midpoint' (spring force held over the action), 'midpoint_substep', 'implicit_midpoint' or
+    'expm' (mass_spring_envs/envs/linear_integrators.py). stiffness (N,) -> (N, 2, 2), (N, 2, 1)
+    '''
+    k = np.asarray(stiffness, dtype=np.float64).reshape(-1)
+    zeros, ones = np.zeros_like(k), np.ones_like(k)
+    T = dt * n_steps
+    if integrator == 'midpoint':
+        # the acceleration of the start of the action held for all substeps: y += v T + a T^2 / 2, v += a T
+        phi = np.stack([np.stack([1 - k * T**2 / (2 * mass), T * ones], -1), np.stack([-k * T / mass, ones], -1)], -2)
+        gamma = np.stack([T**2 / (2 * mass) * ones, T / mass * ones], -1)[..., None]
+        return phi, gamma
+    if integrator == 'expm':
+        # exact, with sinc for k -> 0: sin(w T) / w and (1 - cos(w T)) / w^2
+        w = np.sqrt(k / mass)
+        cos = np.cos(w * T)
+        sin_w = T * np.sinc(w * T / np.pi)
+        one_minus_cos_w2 = T**2 / 2 * np.sinc(w * T / (2 * np.pi))**2
+        phi = np.stack([np.stack([cos, sin_w], -1), np.stack([-k / mass * sin_w, cos], -1)], -2)
+        gamma = np.stack([one_minus_cos_w2 / mass, sin_w / mass], -1)[..., None]
+        return phi, gamma
+    if integrator == 'midpoint_substep':
+        step_state = np.stack([np.stack([1 - k * dt**2 / (2 * mass), dt * ones], -1), np.stack([-k * dt / mass, ones], -1)], -2)
+        step_input = np.stack([dt**2 / (2 * mass) * ones, dt / mass * ones], -1)[..., None]
+    elif integrator == 'implicit_midpoint':
+        A = np.stack([np.stack([zeros, ones], -1), np.stack([-k / mass, zeros], -1)], -2)
+        B = np.stack([zeros, ones / mass], -1)[..., None]
+        lhs = np.eye(2) - 0.5 * dt * A
+        step_state = np.linalg.solve(lhs, np.eye(2) + 0.5 * dt * A)
+        step_input = np.linalg.solve(lhs, dt * B)
+    else:
+        raise ValueError('no propagator for the integrator {}'.format(integrator))
+    phi, gamma = np.broadcast_to(np.eye(2), step_state.shape).copy(), np.zeros_like(step_input)
+    for _ in range(n_steps):
+        phi, gamma = step_state @ phi, step_state @ gamma + step_input
+    return phi, gamma
+
+
+def solve_dare(A, B, Q, R, tol=1e-10, max_iter=100):
+    '''
+    Batched solution P of the discrete algebraic Riccati equation
+    P = Q + A^T P A - A^T P B (R + B^T P B)^-1 B^T P A by the structure-preserving doubling algorithm
+    (quadratic convergence, no eigendecomposition). A (N, n, n), B (N, n, m), Q (n, n), R (m, m) -> (N, n, n)
+    '''
+    A = np.asarray(A, dtype=np.float64)
+    B = np.asarray(B, dtype=np.float64)
+    eye = np.eye(A.shape[-1])
+    G = B @ np.linalg.solve(R, np.swapaxes(B, -1, -2))
+    H = np.broadcast_to(np.asarray(Q, dtype=np.float64), A.shape).copy()
+    for _ in range(max_iter):
+        W = eye + G @ H
+        W_inv_A = np.linalg.solve(W, A)
+        H_next = H + np.swapaxes(A, -1, -2) @ H @ W_inv_A
+        G = G + A @ np.linalg.solve(W, G @ np.swapaxes(A, -1, -2))
+        A = A @ W_inv_A
+        converged = np.max(np.abs(H_next - H) / (np.abs(H_next) + 1e-12)) < tol
+        H = H_next
+        if converged:
+            break
+    return 0.5 * (H + np.swapaxes(H, -1, -2))
+
+
+class LinearController:
+    '''
+    u = clip(u_eq - gain (x - x_ref)) on the first two observation columns (y1, v1), with the get_actions
+    interface of the garage policies, e.g. for launchers/play/evaluate_policy.evaluate_envs on
+    MassSpringEnv_Opt*_HwConditioned with the same hardware.
+    '''
+    def __init__(self, gain, x_ref, u_eq, half_force_range):
+        self.gain = np.asarray(gain, dtype=np.float64).reshape(2)
+        self.x_ref = np.asarray(x_ref, dtype=np.float64).reshape(2)
+        self.u_eq = float(u_eq)
+        self.half_force_range = half_force_range
+
+
+    def get_actions(self, observations):
+        x = np.asarray(observations, dtype=np.float64)[:, :2]
+        actions = np.clip(self.u_eq - (x - self.x_ref) @ self.gain, -self.half_force_range, self.half_force_range)[:, None]
+        return actions, dict(mean=actions)
+
+
+    def get_action(self, observation):
+        actions, infos = self.get_actions([observation])
+        return actions[0], dict(mean=infos['mean'][0])
+
+
+    def reset(self, dones=None):
+        pass
+
+
+class LQRFitness:
+    '''
+    Args:
+        params: shared_params.params_opt_k or params_opt_l
+        n_episodes (int): initial states per candidate
+        seed (int): seed of the initial states, the same for every candidate
+        discount (float): of the return and the Riccati equation
+        max_path_length (int): steps per episode, params.n_steps_per_episode by default
+        pos_scale, vel_scale, force_scale (float): scales of the quadratic proxy, by default the position
+            and velocity errors at which the penalty reaches reward_switch_pos_vel_thresh, and half_force_range
+    '''
+    def __init__(self, params, n_episodes=16, seed=0, discount=0.99, max_path_length=None, pos_scale=None, vel_scale=None, force_scale=None):
+        self.case = 'opt_k' if hasattr(params, 'k_hw') else 'opt_l'
+        self.hw = params.k_hw if self.case == 'opt_k' else params.l_hw
+        self.params = params
+        self.mass = params.m1 + params.m2
+        self.force_per_action = params.trq_const / params.r_shaft if self.case == 'opt_k' else 1.0
+        self.discount = discount
+        self.max_path_length = max_path_length or params.n_steps_per_episode
+        random_state = np.random.RandomState(seed)
+        # as reset
+        v1 = random_state.uniform(-params.half_vel_range, params.half_vel_range, size=n_episodes)
+        y1 = random_state.uniform(0, params.pos_range, size=n_episodes)
+        self.initial_states = np.stack([y1, v1], axis=1)
+
+        pos_scale = pos_scale or params.reward_switch_pos_vel_thresh / params.reward_alpha
+        vel_scale = vel_scale or params.reward_switch_pos_vel_thresh / params.reward_beta
+        force_scale = force_scale or params.half_force_range
+        self.Q = np.diag([params.reward_alpha / pos_scale, params.reward_beta / vel_scale])
+        self.R = np.array([[params.reward_gamma / force_scale * self.force_per_action**2]])
+        self.n_evals = 0
+
+
+    def stiffness_and_length(self, candidates):
+        '''
+        candidates (M, hw.dim) -> stiffness (M,), bar length (M,)
+        '''
+        total = np.sum(self.hw.to_elements(np.atleast_2d(np.asarray(candidates, dtype=np.float64))), axis=-1)
+        if self.case == 'opt_k':
+            return total, np.full_like(total, self.params.l)
+        return np.full_like(total, self.params.k), total
+
+
+    def solve(self, candidates):
+        '''
+        The LQR controllers of the candidates: dict of A (M, 2, 2), B (M, 2, 1) (deviations per action),
+        P (M, 2, 2), gain (M, 2), x_ref (M, 2), u_eq (M,), stiffness (M,), length (M,)
+        '''
+        stiffness, length = self.stiffness_and_length(candidates)
+        A, B = spring_mass_propagator(stiffness, self.mass, self.params.dt, self.params.n_steps_per_action, self.params.integrator)
+        B = B * self.force_per_action
+        sqrt_discount = np.sqrt(self.discount)
+        P = solve_dare(sqrt_discount * A, sqrt_discount * B, self.Q, self.R)
+        B_T_P = np.swapaxes(B, -1, -2) @ P
+        gain = np.linalg.solve(self.R + self.discount * B_T_P @ B, self.discount * B_T_P @ A)[:, 0, :]
+        y_ref = self.params.h - length
+        u_eq = (stiffness * y_ref - self.mass * self.params.g) / self.force_per_action
+        return dict(A=A, B=B, P=P, gain=gain, x_ref=np.stack([y_ref, np.zeros_like(y_ref)], axis=1), u_eq=u_eq,
+                    stiffness=stiffness, length=length)
+
+
+    def rollout(self, candidates, initial_states=None):
+        '''
+        Closed-loop episodes of every candidate from every initial state (n_episodes, 2), with the reward,
+        the action clipping and the state clipping of the envs. Returns the (M, n_episodes) returns and
+        discounted returns.
+        '''
+        params = self.params
+        lqr = self.solve(candidates)
+        initial_states = self.initial_states if initial_states is None else np.atleast_2d(np.asarray(initial_states, dtype=np.float64))
+        # candidates on the first axis, episodes on the second, the 2x2 products written out
+        (a00, a01), (a10, a11) = [[lqr['A'][:, i, j, None] for j in range(2)] for i in range(2)]
+        b0, b1 = lqr['B'][:, 0], lqr['B'][:, 1]
+        g0, g1 = lqr['gain'][:, 0, None], lqr['gain'][:, 1, None]
+        y_ref, u_eq, length = lqr['x_ref'][:, 0, None], lqr['u_eq'][:, None], lqr['length'][:, None]
+        n_candidates = len(u_eq)
+        dy = initial_states[None, :, 0] - y_ref
+        v = np.repeat(initial_states[None, :, 1], n_candidates, axis=0)
+        returns = np.zeros(dy.shape)
+        discounted_returns = np.zeros(dy.shape)
+        sharpness = REWARD_SWITCH_SHARPNESS[self.case]
+        force_penalty_max = params.reward_gamma * np.abs(params.half_force_range)
+        for t in range(self.max_path_length):
+            du = np.clip(u_eq - g0 * dy - g1 * v, -params.half_force_range, params.half_force_range) - u_eq
+            dy, v = a00 * dy + a01 * v + b0 * du, a10 * dy + a11 * v + b1 * du
+            dy = np.clip(dy + y_ref, 0.0, params.pos_range) - y_ref
+            v = np.clip(v, -params.half_vel_range, params.half_vel_range)
+
+            # calc_reward
+            pos_penalty = params.reward_alpha * np.abs(dy + y_ref + length - params.h)
+            vel_penalty = params.reward_beta * np.abs(v)
+            force_penalty = get_soft_conditioned_val_batched(params.reward_gamma * np.abs(self.force_per_action * (du + u_eq)), force_penalty_max,
+                                                             pos_penalty + vel_penalty, params.reward_switch_pos_vel_thresh, sharpness)
+            reward = -pos_penalty - vel_penalty - force_penalty
+            returns += reward
+            discounted_returns += self.discount**t * reward
+        return dict(returns=returns, discounted_returns=discounted_returns)
+
+
+    def __call__(self, candidates):
+        '''
+        candidates (M, hw.dim) -> (M,) mean discounted returns
+        '''
+        candidates = np.atleast_2d(np.asarray(candidates, dtype=np.float64))
+        self.n_evals += len(candidates)
+        return self.rollout(candidates)['discounted_returns'].mean(axis=1)
+
+
+    def search(self, n_candidates=1024):
+        '''
+        The fitness depends on the hardware only through the total stiffness (opt_k) or length (opt_l),
+        so the search is a grid of n_candidates totals over the bounds, each as equal elements.
+        Returns (best hardware in the search space of hw, its fitness).
+        '''
+        totals = np.linspace(self.hw.lb, self.hw.ub, n_candidates) * self.hw.n_elements
+        candidates = self.hw.from_elements(np.repeat(totals[:, None] / self.hw.n_elements, self.hw.n_elements, axis=1))
+        fitness = self(candidates)
+        best = int(np.argmax(fitness))
+        return candidates[best], float(fitness[best])
+
+
+    def controller(self, candidate):
+        lqr = self.solve(candidate)
+        return LinearController(lqr['gain'][0], lqr['x_ref'][0], lqr['u_eq'][0], self.params.half_force_range)
@@ -0,0 +1,168 @@
+'''
+Differentiable, batched rollout of the Optimization Case I dynamics (optimizing the spring stiffness k).
+
+The graph reproduces MassSpringEnv_OptK_HwAsAction step by step (action clipping, mid-point Euler
+sub-steps, state clipping and the soft-conditioned reward) for a batch of initial states, driven by
+the mean action of the computational policy and the spring stiffnesses k = sigmoid(k_pre) * k_range + k_lb.
+The episode is unrolled with tf.while_loop, so tf.gradients gives the exact d(return)/d(k_pre) and
+d(return)/d(controller weights) instead of the sampled estimates of PPO / CMA-ES / ARS.
+'''
+
+import numpy as np
+import tensorflow as tf
+
+
+def soft_conditioned_val(value1, value2, test_value, criterion, sigmoid_coeff=1.0):
+    '''
+    Elementwise TF version of get_soft_conditioned_val in mass_spring_env_opt_k:
+
+    if test_value < criterion:
+        return value1
+    else:
+        return value2
+    '''
+    up = tf.math.sigmoid(sigmoid_coeff * (test_value - criterion)) * (value2 - value1) + value1
+    down = tf.math.sigmoid(sigmoid_coeff * (-test_value + criterion)) * (value1 - value2) + value2
+    return tf.compat.v1.where(value1 < value2, up, down)
+
+
+class DifferentiableRollout_OptK:
+    '''
+    Batched differentiable rollout of MassSpringEnv_OptK_HwAsAction with a deterministic controller.
+    '''
+    reward_sigmoid_coeff = 10.0 # as in MassSpringEnv_OptK.calc_reward
+
+    def __init__(self, params, comp_policy_model, n_steps=None, discount=0.99, name='differentiable_rollout'):
+        '''
+        Args:
+            params: shared_params.params_opt_k
+            comp_policy_model: the computational policy (garage MLPModel, normalized y1 and v1 in, normalized current out),
+                the same model the CompMechPolicy_OptK_* policies use, its variables are shared
+            n_steps (int): number of actions per episode, defaults to params.n_steps_per_episode
+            discount (float): discount of the discounted return
+        '''
+        self.comp_policy_model = comp_policy_model
+        self.n_steps = params.n_steps_per_episode if n_steps is None else n_steps
+        self.discount = discount
+        self.name = name
+
+        self.r_shaft = params.r_shaft
+        self.trq_const = params.trq_const
+        self.half_force_range = params.half_force_range
+        self.k_lb = params.k_lb
+        self.k_ub = params.k_ub
+        self.k_range = params.k_range
+        self.k_pre_init = params.k_pre_init
+        self.n_springs = params.n_springs
+        self.pos_range = params.pos_range
+        self.half_vel_range = params.half_vel_range
+        self.m1 = params.m1
+        self.m2 = params.m2
+        self.h = params.h
+        self.l = params.l
+        self.g = params.g
+        self.dt = params.dt
+        self.n_steps_per_action = params.n_steps_per_action
+        self.reward_alpha = params.reward_alpha
+        self.reward_beta = params.reward_beta
+        self.reward_gamma = params.reward_gamma
+        self.reward_switch_pos_vel_thresh = params.reward_switch_pos_vel_thresh
+
+
+    def sample_initial_states(self, batch_size):
+        '''
+        Initial states drawn as in MassSpringEnv_OptK.reset, returns y1 (batch_size,), v1 (batch_size,)
+        '''
+        v1 = np.random.uniform(-self.half_vel_range, self.half_vel_range, size=batch_size)
+        y1 = np.random.uniform(0, self.pos_range, size=batch_size)
+        return y1, v1
+
+
+    def controller(self, y1, v1, name):
+        '''
+        Mean input current of the computational policy, (?,)
+        '''
+        y1_and_v1_normalized = tf.stack([y1 / self.pos_range, v1 / self.half_vel_range], axis=1)
+        return self.comp_policy_model.build(y1_and_v1_normalized, name=name)[:, 0] * self.half_force_range
+
+
+    def calc_reward(self, y2, f, v2):
+        pos_penalty = self.reward_alpha * tf.abs(y2 - self.h)
+        vel_penalty = self.reward_beta * tf.abs(v2)
+        force_penalty = soft_conditioned_val(self.reward_gamma * tf.abs(f),
+            self.reward_gamma * np.abs(self.half_force_range) * tf.ones_like(f),
+            pos_penalty + vel_penalty, self.reward_switch_pos_vel_thresh, self.reward_sigmoid_coeff)
+        return -pos_penalty - vel_penalty - force_penalty
+
+
+    def step(self, y1, v1, k_sum, i):
+        '''
+        One env step (n_steps_per_action mid-point Euler sub-steps), returns y1, v1, reward
+        '''
+        i = tf.clip_by_value(i, -self.half_force_range, self.half_force_range)
+        f = self.trq_const * i / self.r_shaft
+        f_total = f + (self.m1 + self.m2) * self.g - k_sum * y1
+        a = f_total / (self.m1 + self.m2)
+        for _ in range(self.n_steps_per_action):
+            y1 = y1 + v1 * self.dt + 0.5 * a * self.dt**2 # mid-point Euler integration
+            v1 = v1 + a * self.dt
+        y1 = tf.clip_by_value(y1, 0.0, self.pos_range)
+        v1 = tf.clip_by_value(v1, -self.half_vel_range, self.half_vel_range)
+        reward = self.calc_reward(y1 + self.l, f, v1)
+        return y1, v1, reward
+
+
+    def build(self, y1_init=None, v1_init=None, k_pre=None):
+        '''
+        Build the rollout graph.
+
+        Args:
+            y1_init, v1_init (tf.Tensor): (?,) initial states, placeholders are created if None
+            k_pre (tf.Tensor): (n_springs,) pre-sigmoid stiffnesses, a trainable variable initialized at params.k_pre_init is created if None
+        Returns:
+            dict of tensors: returns and discounted_returns (?,), their batch means, k (n_springs,), k_sum,
+            and the gradients of the average discounted return w.r.t. k_pre and the controller weights
+        '''
+        with tf.compat.v1.variable_scope(self.name):
+            self.y1_init = tf.compat.v1.placeholder(tf.float32, shape=(None,), name='y1_init') if y1_init is None else y1_init
+            self.v1_init = tf.compat.v1.placeholder(tf.float32, shape=(None,), name='v1_init') if v1_init is None else v1_init
+            if k_pre is None:
+                k_pre = tf.compat.v1.get_variable('k_pre', initializer=np.float32([self.k_pre_init,] * self.n_springs), trainable=True)
+                tf.compat.v1.get_default_session().run(k_pre.initializer)
+            self.k_pre = k_pre
+            self.k_ts = tf.clip_by_value(tf.math.sigmoid(k_pre) * self.k_range + self.k_lb, self.k_lb, self.k_ub, name='k')
+            self.k_sum_ts = tf.reduce_sum(self.k_ts, name='k_sum')
+
+            # the first build creates the controller variables, which must not happen inside the while loop
+            if not self.comp_policy_model.networks:
+                self.controller(self.y1_init, self.v1_init, name='{}_init'.format(self.name))
+
+            def body(t, y1, v1, returns, discounted_returns):
+                i = self.controller(y1, v1, name='{}_step'.format(self.name))
+                y1, v1, reward = self.step(y1, v1, self.k_sum_ts, i)
+                discounted_returns = discounted_returns + tf.pow(self.discount, tf.cast(t, tf.float32)) * reward
+                return t + 1, y1, v1, returns + reward, discounted_returns
+
+            zeros = tf.zeros_like(self.y1_init)
+            _, self.y1_final, self.v1_final, self.returns_ts, self.discounted_returns_ts = tf.while_loop(
+                lambda t, *_: t < self.n_steps,
+                body,
+                (tf.constant(0), self.y1_init, self.v1_init, zeros, zeros),
+                swap_memory=True)
+
+            self.average_return_ts = tf.reduce_mean(self.returns_ts, name='average_return')
+            self.average_discounted_return_ts = tf.reduce_mean(self.discounted_returns_ts, name='average_discounted_return')
+
+        self.controller_vars = self.comp_policy_model._variable_scope.trainable_variables()
+        grads = tf.gradients(self.average_discounted_return_ts, [self.k_pre] + self.controller_vars)
+        self.grad_k_pre_ts = grads[0]
+        self.grad_controller_ts = grads[1:]
+
+        return dict(returns=self.returns_ts,
+                    discounted_returns=self.discounted_returns_ts,
+                    average_return=self.average_return_ts,
+                    average_discounted_return=self.average_discounted_return_ts,
+                    k=self.k_ts,
+                    k_sum=self.k_sum_ts,
+                    grad_k_pre=self.grad_k_pre_ts,
+                    grad_controller=self.grad_controller_ts)
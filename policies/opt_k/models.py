@@ -35,6 +35,8 @@ from garage.tf.models.base import Model
 from garage.tf.models.parameter import parameter
 from garage.tf.models.mlp import mlp
 
+from policies.population import member_index, population_mlp
+
 
 #################################### Base Class ####################################
 
@@ -53,6 +55,7 @@ class MyBaseModel_OptK(Model):
         self.k_range = params.k_range
         self.k_lb = params.k_lb
         self.n_springs = params.n_springs
+        self.k_hw = params.k_hw # search space of the k pre-sigmoid variable (policies/hw_parameterization.py)
     
         self.trq_const = params.trq_const
         self.r_shaft = params.r_shaft
@@ -81,6 +84,15 @@ class MyBaseModel_OptK(Model):
         raise NotImplementedError
 
 
+    def _hw_ts(self, k_pre_var):
+        '''
+        Per-element k's (?, n_springs) of the compact pre-sigmoid variable (?, k_hw.dim), each in [k_lb, k_ub]
+        '''
+        k_compact_ts = tf.math.add(tf.math.sigmoid(k_pre_var) * tf.compat.v1.constant(self.k_hw.upper - self.k_hw.lower, dtype=tf.float32, name='k_range'), 
+            tf.compat.v1.constant(self.k_hw.lower, dtype=tf.float32, name='k_lb'))
+        return tf.math.multiply(tf.gather(k_compact_ts, self.k_hw.element_index, axis=1), self.k_hw.element_scale, name='k')
+
+
 #################################### Fixed Hardware ####################################
 
 
@@ -113,14 +125,12 @@ class MechPolicyModel_OptK_FixedHW(MyBaseModel_OptK):
 
         self.k_pre_var = parameter(
             input_var=inputs[0],
-            length=self.n_springs,
+            length=self.k_hw.dim,
             initializer=tf.constant_initializer(self.k_pre_init),
             trainable=False, 
             name='k_pre')
 
-        self.k_ts = tf.math.add(tf.math.sigmoid(self.k_pre_var) * tf.compat.v1.constant(self.k_range, dtype=tf.float32, name='k_range'), 
-            tf.compat.v1.constant(self.k_lb, dtype=tf.float32, name='k_lb'), 
-            name='k')
+        self.k_ts = self._hw_ts(self.k_pre_var)
 
         # the mean in the output of this model only contains k's,but log_std contains the stds for f and k's
         self.log_std_var = parameter(
@@ -191,14 +201,12 @@ class MechPolicyModel_OptK_HwAsAction(MyBaseModel_OptK):
 
         self.k_pre_var = parameter(
             input_var=inputs[0],
-            length=self.n_springs,
+            length=self.k_hw.dim,
             initializer=tf.random_uniform_initializer(minval=self.k_pre_init_lb, maxval=self.k_pre_init_ub), 
             trainable=True, 
             name='k_pre')
 
-        self.k_ts = tf.math.add(tf.math.sigmoid(self.k_pre_var) * tf.compat.v1.constant(self.k_range, dtype=tf.float32, name='k_range'), 
-            tf.compat.v1.constant(self.k_lb, dtype=tf.float32, name='k_lb'), 
-            name='k')
+        self.k_ts = self._hw_ts(self.k_pre_var)
 
         # the mean in the output of this model only contains k's,but log_std contains the stds for f and k's
         self.log_std_var = parameter(
@@ -437,4 +445,122 @@ class CompMechPolicyModel_OptK_HwInPolicyAndAction(MyBaseModel_OptK):
         del new_dict['f_ts']
         del new_dict['debug_ts']
         del new_dict['log_std_var']
-        return new_dict
\ No newline at end of file
+        return new_dict
+
+
+################################### Hardware-Conditioned Controller ###################################
+
+
+class CompPolicyModel_OptK_HwConditioned(MyBaseModel_OptK):
+    '''
+    Controller f = pi(y1, v1, hardware) for any hardware in the search space of params.k_hw
+    (MassSpringEnv_OptK_HwConditioned, the hardware is part of the observation, normalized to [0, 1]).
+    '''
+    def __init__(self, params, name='comp_policy_model'):
+        super().__init__(params, name=name)
+        self.f_log_std_init = [params.f_log_std_init_action,]
+        self.pos_range = params.pos_range
+        self.half_vel_range = params.half_vel_range
+        self.comp_policy_network_size = params.comp_policy_network_size
+        self.half_force_range = params.half_force_range
+
+
+    def _build(self, *inputs, name=None):
+        # the inputs are obs_ph: y1, v1 and the normalized hardware
+        obs_ph = inputs[0]
+
+        obs_ph_normalized = obs_ph / ([self.pos_range, self.half_vel_range] + [1.0,] * self.k_hw.dim)
+
+        f_ts_normalized = mlp(obs_ph_normalized, 1, self.comp_policy_network_size, name='mlp', hidden_nonlinearity=tf.math.tanh, output_nonlinearity=tf.math.tanh)
+
+        self.f_ts = f_ts_normalized * self.half_force_range
+
+        self.log_std_var = parameter(
+            input_var=obs_ph,
+            length=1,
+            initializer=tf.constant_initializer(
+                self.f_log_std_init),
+            trainable=True,
+            name='log_std')
+
+        return self.f_ts, self.log_std_var
+
+
+    def network_input_spec(self):
+        return ['obs']
+
+
+    def network_output_spec(self):
+        return ['f', 'log_std']
+
+
+    def __getstate__(self):
+        """Object.__getstate__."""
+        new_dict = super().__getstate__()
+        del new_dict['f_ts']
+        del new_dict['log_std_var']
+        return new_dict
+
+
+################################### Hardware as Action, Population ###################################
+
+
+class CompMechPolicyModel_OptK_HwAsAction_Population(MyBaseModel_OptK):
+    '''
+    n_members independent HwAsAction policies (comp MLP, k_pre and log_std) with stacked variables,
+    each sample uses the ones of its member (policies/population.py).
+    Input: obs (?, 3) of MassSpringEnv_OptK_HwAsAction_Population, y1, v1 and the member index.
+    Output: f_and_k (?, 1+n_springs) and log_std (?, 1+n_springs) as CompMechPolicy_OptK_HwAsAction.
+    '''
+    def __init__(self, params, n_members, name='comp_mech_policy_model'):
+        super().__init__(params, name=name)
+        self.n_members = n_members
+        self.f_and_k_log_std_init = [params.f_log_std_init_action,] + [params.k_log_std_init_action,] * self.n_springs
+        self.pos_range = params.pos_range
+        self.half_vel_range = params.half_vel_range
+        self.comp_policy_network_size = params.comp_policy_network_size
+        self.half_force_range = params.half_force_range
+
+
+    def _build(self, *inputs, name=None):
+        obs_ph = inputs[0]
+        member_ts = member_index(obs_ph)
+        y1_and_v1_ph_normalized = obs_ph[:, :2] / [self.pos_range, self.half_vel_range]
+
+        f_ts_normalized = population_mlp(y1_and_v1_ph_normalized, member_ts, self.n_members, 1, self.comp_policy_network_size, name='mlp',
+            hidden_nonlinearity=tf.math.tanh, output_nonlinearity=tf.math.tanh)
+        self.f_ts = f_ts_normalized * self.half_force_range
+
+        # one row per member, each drawn from the init range as in MechPolicyModel_OptK_HwAsAction
+        self.k_pre_var = tf.compat.v1.get_variable(
+            'k_pre',
+            shape=(self.n_members, self.k_hw.dim),
+            initializer=tf.random_uniform_initializer(minval=self.k_pre_init_lb, maxval=self.k_pre_init_ub),
+            trainable=True)
+        self.k_ts = self._hw_ts(tf.gather(self.k_pre_var, member_ts))
+
+        self.log_std_var = tf.compat.v1.get_variable(
+            'log_std',
+            initializer=np.tile(np.float32(self.f_and_k_log_std_init), (self.n_members, 1)),
+            trainable=True)
+
+        f_and_k_ts = tf.concat([self.f_ts, self.k_ts], axis=1, name='f_and_k')
+        return f_and_k_ts, tf.gather(self.log_std_var, member_ts)
+
+
+    def network_input_spec(self):
+        return ['obs']
+
+
+    def network_output_spec(self):
+        return ['f_and_k', 'log_std']
+
+
+    def __getstate__(self):
+        """Object.__getstate__."""
+        new_dict = super().__getstate__()
+        del new_dict['f_ts']
+        del new_dict['k_pre_var']
+        del new_dict['k_ts']
+        del new_dict['log_std_var']
+        return new_dict
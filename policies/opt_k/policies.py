@@ -4,11 +4,21 @@ import tensorflow as tf
 from garage.tf.policies.base import StochasticPolicy
 from garage.tf.distributions.diagonal_gaussian import DiagonalGaussian
 
+from policies.fused_params import FusedParamValues
+from policies.episode_hardware import EpisodeHardwareSampling
+from policies.broadcast_infos import BroadcastInfos
+from policies.population import PopulationParams
+
 from shared_params import params_opt_k as params
 
 #################################### Base Class ####################################
 
-class MyBasePolicy_OptK(StochasticPolicy):
+class MyBasePolicy_OptK(FusedParamValues, StochasticPolicy):
+    # optional observation filter applied to the observations before the forward pass
+    # (e.g. my_garage.algos.filter.MeanStdFilter, set by ARS), updated with them if update_filter
+    observation_filter = None
+    update_filter = True
+
     def __init__(self, env_spec, name='my_base_policy'):
         super().__init__(env_spec=env_spec, name=name)
         self.obs_dim = env_spec.observation_space.flat_dim
@@ -36,6 +46,8 @@ class MyBasePolicy_OptK(StochasticPolicy):
                 distribution.
         '''
         flat_obs = self.observation_space.flatten_n(observations)
+        if self.observation_filter is not None:
+            flat_obs = self.observation_filter(flat_obs, update=self.update_filter)
         means, log_stds = self._policy_callable(flat_obs)
         rnd = np.random.normal(size=means.shape)
         samples = rnd * np.exp(log_stds) + means
@@ -63,6 +75,8 @@ class MyBasePolicy_OptK(StochasticPolicy):
                 distribution.
         '''
         flat_obs = self.observation_space.flatten(observation)
+        if self.observation_filter is not None:
+            flat_obs = self.observation_filter(flat_obs, update=self.update_filter)
         mean, log_std = self._policy_callable([flat_obs])
         rnd = np.random.normal(size=mean.shape)
         sample = rnd * np.exp(log_std) + mean
@@ -133,14 +147,20 @@ class MyBasePolicy_OptK(StochasticPolicy):
 #################################### Hardware as Action ####################################
 
 
-class CompMechPolicy_OptK_HwAsAction(MyBasePolicy_OptK):
+class CompMechPolicy_OptK_HwAsAction(BroadcastInfos, EpisodeHardwareSampling, MyBasePolicy_OptK):
     def __init__(self, env_spec,
                 comp_policy_model, 
                 mech_policy_model, 
-                name='comp_mech_policy'):
+                name='comp_mech_policy',
+                hw_sampling='per_step'):
+        '''
+        hw_sampling: 'per_step' (hardware sampled with every action) or 'per_episode'
+            (drawn at the first step after reset and held, see policies/episode_hardware.py)
+        '''
         super().__init__(env_spec=env_spec, name=name)
         self.comp_policy_model = comp_policy_model
         self.mech_policy_model = mech_policy_model
+        self._init_hw_sampling(hw_sampling)
         self._initialize()
 
 
@@ -179,21 +199,31 @@ class CompMechPolicy_OptK_HwAsAction(MyBasePolicy_OptK):
 
             f_and_k_ts = tf.concat([f_ts, k_ts], axis=1, name='action')
 
-        return dict(
+        return self._add_episode_start(dict(
             mean = f_and_k_ts,
             log_std = log_std_ts
-        )
+        ), state_info_vars)
+
+
+    @property
+    def broadcast_info_masks(self):
+        # f's mean depends on the observation, the k's (parameter variables) and all log_stds do not
+        return dict(mean=np.arange(self.action_dim) > 0, log_std=np.ones(self.action_dim, dtype=bool))
 
 
     def get_actions(self, observations):
         samples, info = super().get_actions(observations)
+        samples, info = self._hold_hardware(samples, info)
         means = info['mean']
         k_sum = np.sum(means[:, 1:], axis=1) # the first one in mean is f, all others are k's
         info['k'] = k_sum
-        return samples, info
+        return samples, self._compact_infos(info)
 
 
     def get_action(self, observation):
+        if self.hw_sampling == 'per_episode':
+            samples, info = self.get_actions([observation])
+            return samples[0], {key: value[0] for key, value in info.items()}
         sample, info = super().get_action(observation)
         mean = info['mean']
         k_sum = np.sum(mean[1:]) # the first one in mean is f, all others are k's
@@ -382,4 +412,118 @@ class CompMechPolicy_OptK_HwInPolicyAndAction(MyBasePolicy_OptK):
         """Object.__getstate__."""
         new_dict = super().__getstate__()
         del new_dict['_debug_callable']
-        return new_dict
\ No newline at end of file
+        return new_dict
+
+
+#################################### Hardware-Conditioned Controller ####################################
+
+
+class CompPolicy_OptK_HwConditioned(MyBasePolicy_OptK):
+    '''
+    One controller for all hardware candidates, trained on MassSpringEnv_OptK_HwConditioned
+    (launchers/train/opt_k/ppo_opt_k_hw_conditioned.py), the hardware is the last part of the observation.
+    '''
+    def __init__(self,
+                env_spec,
+                comp_policy_model,
+                name='comp_policy'
+                ):
+        super().__init__(env_spec=env_spec, name=name)
+        self.comp_policy_model = comp_policy_model
+        self._initialize()
+
+
+    def _initialize(self):
+        obs_ph = tf.compat.v1.placeholder(tf.float32, shape=(None, self.obs_dim), name='obs_ph') # obs: y1, v1 and the normalized hardware
+        with tf.compat.v1.variable_scope(self.name) as vs:
+            self._variable_scope = vs
+            f_ts, log_std_ts = self.comp_policy_model.build(obs_ph)
+
+        self._policy_callable = tf.compat.v1.get_default_session().make_callable([f_ts, log_std_ts], feed_list=[obs_ph])
+
+
+    def dist_info_sym(self, obs_var, state_info_vars, name='default'):
+        """
+        Symbolic graph of the distribution.
+
+        Return the symbolic distribution information about the actions.
+        Args:
+            obs_var (tf.Tensor): symbolic variable for observations
+            state_info_vars (dict): a dictionary whose values should contain
+                information about the state of the policy at the time it
+                received the observation.
+            name (str): Name of the symbolic graph.
+
+        :return:
+        """
+        with tf.compat.v1.variable_scope(self._variable_scope):
+            f_ts, log_std_ts = self.comp_policy_model.build(obs_var, name=name)
+
+        return dict(
+            mean = f_ts,
+            log_std = log_std_ts
+        )
+
+
+#################################### Hardware as Action, Population ####################################
+
+
+class CompMechPolicy_OptK_HwAsAction_Population(PopulationParams, MyBasePolicy_OptK):
+    '''
+    n_members independent CompMechPolicy_OptK_HwAsAction policies in one graph, trained together by
+    my_garage.algos.population_ppo.PopulationPPO on MassSpringEnv_OptK_HwAsAction_Population
+    (the last observation column is the member). The k's are sampled with every action ('per_step').
+    '''
+    def __init__(self,
+                env_spec,
+                comp_mech_policy_model,
+                name='comp_mech_policy'
+                ):
+        super().__init__(env_spec=env_spec, name=name)
+        self.comp_mech_policy_model = comp_mech_policy_model
+        self.n_members = comp_mech_policy_model.n_members
+        self._initialize()
+
+
+    def _initialize(self):
+        obs_ph = tf.compat.v1.placeholder(tf.float32, shape=(None, self.obs_dim), name='obs_ph') # obs: y1, v1 and the member
+        with tf.compat.v1.variable_scope(self.name) as vs:
+            self._variable_scope = vs
+            f_and_k_ts, log_std_ts = self.comp_mech_policy_model.build(obs_ph)
+
+        self._policy_callable = tf.compat.v1.get_default_session().make_callable([f_and_k_ts, log_std_ts], feed_list=[obs_ph])
+
+
+    def dist_info_sym(self, obs_var, state_info_vars, name='default'):
+        """
+        Symbolic graph of the distribution.
+
+        Return the symbolic distribution information about the actions.
+        Args:
+            obs_var (tf.Tensor): symbolic variable for observations
+            state_info_vars (dict): a dictionary whose values should contain
+                information about the state of the policy at the time it
+                received the observation.
+            name (str): Name of the symbolic graph.
+
+        :return:
+        """
+        with tf.compat.v1.variable_scope(self._variable_scope):
+            f_and_k_ts, log_std_ts = self.comp_mech_policy_model.build(obs_var, name=name)
+
+        return dict(
+            mean = f_and_k_ts,
+            log_std = log_std_ts
+        )
+
+
+    def get_actions(self, observations):
+        samples, info = super().get_actions(observations)
+        info['k'] = np.sum(info['mean'][:, 1:], axis=1) # the first one in mean is f, all others are k's
+        return samples, info
+
+
+    def get_action(self, observation):
+        sample, info = super().get_action(observation)
+        info['k'] = np.sum(info['mean'][1:]) # the first one in mean is f, all others are k's
+        return sample, info
@@ -35,6 +35,8 @@ from garage.tf.models.base import Model
 from garage.tf.models.parameter import parameter
 from garage.tf.models.mlp import mlp
 
+from policies.population import member_index, population_mlp
+
 
 #################################### Base Class ####################################
 
@@ -53,6 +55,7 @@ class MyBaseModel_OptL(Model):
         self.l_range = params.l_range
         self.l_lb = params.l_lb
         self.n_segments = params.n_segments
+        self.l_hw = params.l_hw # search space of the l pre-sigmoid variable (policies/hw_parameterization.py)
     
 
     def network_input_spec(self):
@@ -79,6 +82,15 @@ class MyBaseModel_OptL(Model):
         raise NotImplementedError
 
 
+    def _hw_ts(self, l_pre_var):
+        '''
+        Per-element l's (?, n_segments) of the compact pre-sigmoid variable (?, l_hw.dim), each in [l_lb, l_ub]
+        '''
+        l_compact_ts = tf.math.add(tf.math.sigmoid(l_pre_var) * tf.compat.v1.constant(self.l_hw.upper - self.l_hw.lower, dtype=tf.float32, name='l_range'), 
+            tf.compat.v1.constant(self.l_hw.lower, dtype=tf.float32, name='l_lb'))
+        return tf.math.multiply(tf.gather(l_compact_ts, self.l_hw.element_index, axis=1), self.l_hw.element_scale, name='l')
+
+
 #################################### Fixed Hardware ####################################
 
 
@@ -111,14 +123,12 @@ class MechPolicyModel_OptL_FixedHW(MyBaseModel_OptL):
 
         self.l_pre_var = parameter(
             input_var=inputs,
-            length=self.n_segments,
+            length=self.l_hw.dim,
             initializer=tf.constant_initializer(self.l_pre_init), 
             trainable=False,  
             name='l_pre')
 
-        self.l_ts = tf.math.add(tf.math.sigmoid(self.l_pre_var) * tf.compat.v1.constant(self.l_range, dtype=tf.float32, name='l_range'), 
-            tf.compat.v1.constant(self.l_lb, dtype=tf.float32, name='l_lb'), 
-            name='l')
+        self.l_ts = self._hw_ts(self.l_pre_var)
 
         # the mean in the output of this model only contains l's,but log_std contains the stds for f and l's
         self.log_std_var = parameter(
@@ -199,14 +209,12 @@ class MechPolicyModel_OptL_HwAsAction(MyBaseModel_OptL):
 
         self.l_pre_var = parameter(
             input_var=inputs,
-            length=self.n_segments,
+            length=self.l_hw.dim,
             initializer=tf.random_uniform_initializer(minval=self.l_pre_init_lb, maxval=self.l_pre_init_ub),
             trainable=True,
             name='l_pre')
 
-        self.l_ts = tf.math.add(tf.math.sigmoid(self.l_pre_var) * tf.compat.v1.constant(self.l_range, dtype=tf.float32, name='l_range'), 
-            tf.compat.v1.constant(self.l_lb, dtype=tf.float32, name='l_lb'), 
-            name='l')
+        self.l_ts = self._hw_ts(self.l_pre_var)
 
         # the mean in the output of this model only contains l's,but log_std contains the stds for f and l's
         self.log_std_var = parameter(
@@ -359,3 +367,218 @@ class MechPolicyModel_OptL_HwAsPolicy(MyBaseModel_OptL):
         del new_dict['debug_ts']
         return new_dict
 
+
+#################################### Hardware as Policy, Substep Coupling ####################################
+
+
+class MechPolicyModel_OptL_HwAsPolicy_SubstepCoupling(MyBaseModel_OptL):
+    '''
+    For MassSpringEnv_OptL_HwAsPolicy_SubstepCoupling: the policy emits the interface parameter (the total bar length l)
+    and the env evaluates the interface force at every substep.
+    '''
+    def __init__(self, params, name='mech_policy_model'):
+        super().__init__(params, name=name)
+
+        self.l_f_log_std_init = [params.l_total_log_std_init_action, params.f_log_std_init_action]
+        self.half_force_range = params.half_force_range
+
+
+    def _build(self, inputs, name=None):
+        """
+        Output of the model given input placeholder(s).
+
+        User should implement _build() inside their subclassed model,
+        and construct the computation graphs in this function.
+
+        Args:
+            inputs: Tensor input(s), recommended to be position arguments, e.g.
+              def _build(self, state_input, action_input, name=None).
+              It would be usually same as the inputs in build().
+            name (str): Inner model name, also the variable scope of the
+                inner model, if exist. One example is
+                garage.tf.models.Sequential.
+
+        Return:
+            output: Tensor output(s) of the model.
+        """
+        f_ph_normalized, y1_v1_y2_v2_ph = inputs # f_ph_normalized: (?, 1), y1_v1_y2_v2_ph: (?, 4)
+
+        f_ts = tf.multiply(f_ph_normalized[:, 0], tf.compat.v1.constant(self.half_force_range, dtype=tf.float32, name='half_force_range'), name='f') # scalar-tensor multiplication # f_ts: (?,)
+
+        l_pre_var = parameter(
+            input_var=y1_v1_y2_v2_ph,
+            length=self.n_segments,
+            initializer=tf.random_uniform_initializer(minval=self.l_pre_init_lb, maxval=self.l_pre_init_ub),
+            trainable=True,
+            name='l_pre')
+
+        l_segment_ts = tf.math.add(tf.math.sigmoid(l_pre_var) * tf.compat.v1.constant(self.l_range, dtype=tf.float32, name='l_range'), 
+            tf.compat.v1.constant(self.l_lb, dtype=tf.float32, name='l_lb'), 
+            name='l')
+        
+        self.l_ts = tf.math.reduce_sum(l_segment_ts, axis=-1)
+
+        l_f_ts = tf.stack([self.l_ts, f_ts], axis=1, name='l_f')
+
+        self.debug_ts = self.l_ts
+
+        log_std_var = parameter(
+            input_var=y1_v1_y2_v2_ph, # actually not linked to the input, this is just to match the dimension of the inputs for batches
+            length=2,
+            initializer=tf.constant_initializer(self.l_f_log_std_init),
+            trainable=True,
+            name='log_std') 
+            # shape: (?, 2)
+
+        return l_f_ts, log_std_var
+
+
+    def network_input_spec(self):
+        """
+        Network input spec.
+
+        Return:
+            *inputs (list[str]): List of key(str) for the network inputs.
+        """
+        return ['f', 'y1_v1_y2_v2']     
+
+
+    def network_output_spec(self):
+        """
+        Network output spec.
+
+        Return:
+            *inputs (list[str]): List of key(str) for the network outputs.
+        """
+        return ['l_f', 'log_std']
+
+
+    def get_tensors(self):
+        return dict(l_ts=self.l_ts, 
+                    debug_ts=self.debug_ts)
+
+
+    def __getstate__(self):
+        """Object.__getstate__."""
+        new_dict = super().__getstate__()
+        del new_dict['l_ts']
+        del new_dict['debug_ts']
+        return new_dict
+
+
+################################### Hardware-Conditioned Controller ###################################
+
+
+class CompPolicyModel_OptL_HwConditioned(MyBaseModel_OptL):
+    '''
+    Controller f = pi(y1, v1, hardware) for any hardware in the search space of params.l_hw
+    (MassSpringEnv_OptL_HwConditioned, the hardware is part of the observation, normalized to [0, 1]).
+    '''
+    def __init__(self, params, name='comp_policy_model'):
+        super().__init__(params, name=name)
+        self.f_log_std_init = [params.f_log_std_init_action,]
+        self.pos_range = params.pos_range
+        self.half_vel_range = params.half_vel_range
+        self.comp_policy_network_size = params.comp_policy_network_size
+        self.half_force_range = params.half_force_range
+
+
+    def _build(self, *inputs, name=None):
+        # the inputs are obs_ph: y1, v1 and the normalized hardware
+        obs_ph = inputs[0]
+
+        obs_ph_normalized = obs_ph / ([self.pos_range, self.half_vel_range] + [1.0,] * self.l_hw.dim)
+
+        f_ts_normalized = mlp(obs_ph_normalized, 1, self.comp_policy_network_size, name='mlp', hidden_nonlinearity=tf.math.tanh, output_nonlinearity=tf.math.tanh)
+
+        self.f_ts = f_ts_normalized * self.half_force_range
+
+        self.log_std_var = parameter(
+            input_var=obs_ph,
+            length=1,
+            initializer=tf.constant_initializer(
+                self.f_log_std_init),
+            trainable=True,
+            name='log_std')
+
+        return self.f_ts, self.log_std_var
+
+
+    def network_input_spec(self):
+        return ['obs']
+
+
+    def network_output_spec(self):
+        return ['f', 'log_std']
+
+
+    def __getstate__(self):
+        """Object.__getstate__."""
+        new_dict = super().__getstate__()
+        del new_dict['f_ts']
+        del new_dict['log_std_var']
+        return new_dict
+
+
+################################### Hardware as Action, Population ###################################
+
+
+class CompMechPolicyModel_OptL_HwAsAction_Population(MyBaseModel_OptL):
+    '''
+    n_members independent HwAsAction policies (comp MLP, l_pre and log_std) with stacked variables,
+    each sample uses the ones of its member (policies/population.py).
+    Input: obs (?, 3) of MassSpringEnv_OptL_HwAsAction_Population, y1, v1 and the member index.
+    Output: f_and_l (?, 1+n_segments) and log_std (?, 1+n_segments) as CompMechPolicy_OptL_HwAsAction.
+    '''
+    def __init__(self, params, n_members, name='comp_mech_policy_model'):
+        super().__init__(params, name=name)
+        self.n_members = n_members
+        self.f_and_l_log_std_init = [params.f_log_std_init_action,] + [params.l_log_std_init_action,] * self.n_segments
+        self.pos_range = params.pos_range
+        self.half_vel_range = params.half_vel_range
+        self.comp_policy_network_size = params.comp_policy_network_size
+        self.half_force_range = params.half_force_range
+
+
+    def _build(self, *inputs, name=None):
+        obs_ph = inputs[0]
+        member_ts = member_index(obs_ph)
+        y1_and_v1_ph_normalized = obs_ph[:, :2] / [self.pos_range, self.half_vel_range]
+
+        f_ts_normalized = population_mlp(y1_and_v1_ph_normalized, member_ts, self.n_members, 1, self.comp_policy_network_size, name='mlp',
+            hidden_nonlinearity=tf.math.tanh, output_nonlinearity=tf.math.tanh)
+        self.f_ts = f_ts_normalized * self.half_force_range
+
+        # one row per member, each drawn from the init range as in MechPolicyModel_OptL_HwAsAction
+        self.l_pre_var = tf.compat.v1.get_variable(
+            'l_pre',
+            shape=(self.n_members, self.l_hw.dim),
+            initializer=tf.random_uniform_initializer(minval=self.l_pre_init_lb, maxval=self.l_pre_init_ub),
+            trainable=True)
+        self.l_ts = self._hw_ts(tf.gather(self.l_pre_var, member_ts))
+
+        self.log_std_var = tf.compat.v1.get_variable(
+            'log_std',
+            initializer=np.tile(np.float32(self.f_and_l_log_std_init), (self.n_members, 1)),
+            trainable=True)
+
+        f_and_l_ts = tf.concat([self.f_ts, self.l_ts], axis=1, name='f_and_l')
+        return f_and_l_ts, tf.gather(self.log_std_var, member_ts)
+
+
+    def network_input_spec(self):
+        return ['obs']
+
+
+    def network_output_spec(self):
+        return ['f_and_l', 'log_std']
+
+
+    def __getstate__(self):
+        """Object.__getstate__."""
+        new_dict = super().__getstate__()
+        del new_dict['f_ts']
+        del new_dict['l_pre_var']
+        del new_dict['l_ts']
+        del new_dict['log_std_var']
+        return new_dict
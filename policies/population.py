@@ -0,0 +1,93 @@
+'''
+A population axis for the comp-mech policies: P independent policies (MLP weights, hardware and
+log_stds) in one graph, trained in lockstep by my_garage.algos.population_ppo.PopulationPPO.
+
+One PPO run per hardware candidate builds a tiny graph (a (32, 32) MLP and the hardware logits), whose
+session calls are too small to keep a multi-core CPU busy. Here every variable has a leading
+(n_members,) axis and each sample carries the index of its member (the last observation column of
+MassSpringEnv_Opt*_HwAsAction_Population). A layer gathers the weights of the sample's member and
+applies them as one batched matmul over the whole batch, so P members cost one op per layer instead of P.
+
+    f = population_mlp(y1_and_v1_normalized, member_ts, n_members, 1, (32, 32), name='mlp')
+'''
+
+import numpy as np
+import tensorflow as tf
+
+
+def member_index(obs_var):
+    '''
+    int32 member indices (?,) of observations whose last column is the member
+    '''
+    return tf.cast(tf.round(obs_var[:, -1]), tf.int32, name='member')
+
+
+def population_dense(input_var, member_var, n_members, output_dim, name, nonlinearity=None):
+    '''
+    y[i] = nonlinearity(x[i] W[member[i]] + b[member[i]]) with W (n_members, input_dim, output_dim),
+    initialized per member as garage's mlp (Glorot uniform weights, zero biases).
+    '''
+    input_dim = int(input_var.shape[-1])
+    limit = np.sqrt(6.0 / (input_dim + output_dim))
+    with tf.compat.v1.variable_scope(name):
+        kernel = tf.compat.v1.get_variable('kernel', shape=(n_members, input_dim, output_dim), dtype=tf.float32,
+            initializer=tf.compat.v1.random_uniform_initializer(minval=-limit, maxval=limit))
+        bias = tf.compat.v1.get_variable('bias', shape=(n_members, output_dim), dtype=tf.float32,
+            initializer=tf.compat.v1.zeros_initializer())
+        output = tf.matmul(tf.expand_dims(input_var, 1), tf.gather(kernel, member_var))[:, 0, :] + tf.gather(bias, member_var)
+    if nonlinearity is not None:
+        output = nonlinearity(output)
+    return output
+
+
+def population_mlp(input_var, member_var, n_members, output_dim, hidden_sizes, name,
+                   hidden_nonlinearity=tf.math.tanh, output_nonlinearity=None):
+    '''
+    garage's mlp with one set of weights per member, see population_dense
+    '''
+    with tf.compat.v1.variable_scope(name):
+        h = input_var
+        for idx, hidden_size in enumerate(hidden_sizes):
+            h = population_dense(h, member_var, n_members, hidden_size, name='hidden_{}'.format(idx), nonlinearity=hidden_nonlinearity)
+        return population_dense(h, member_var, n_members, output_dim, name='output', nonlinearity=output_nonlinearity)
+
+
+class PopulationParams:
+    '''
+    Mixin for policies whose trainable variables all have a leading (n_members,) axis, put it before
+    MyBasePolicy_Opt*. The flat parameters of one member, in the layout of get_param_values, are
+    its slice of every variable.
+    '''
+
+    def _member_index(self):
+        # indices into the flat parameter vector of every member, (n_members, n_params_per_member)
+        index = self.__dict__.get('_member_param_index')
+        if index is None:
+            sizes = [int(np.prod(param.shape.as_list())) for param in self.get_params()]
+            offsets = np.cumsum([0] + sizes[:-1])
+            index = np.concatenate([offset + np.arange(size).reshape(self.n_members, -1) for offset, size in zip(offsets, sizes)], axis=1)
+            self._member_param_index = index
+        return index
+
+
+    def get_member_param_values(self, member):
+        return self.get_param_values()[self._member_index()[member]]
+
+
+    def set_member_param_values(self, member, param_values):
+        values = self.get_param_values()
+        values[self._member_index()[member]] = param_values
+        self.set_param_values(values)
+
+
+    def copy_member(self, src, dst):
+        '''
+        Copy the weights, hardware and log_stds of member src into member dst.
+        '''
+        self.set_member_param_values(dst, self.get_member_param_values(src))
+
+
+    def __getstate__(self):
+        new_dict = super().__getstate__()
+        new_dict.pop('_member_param_index', None)
+        return new_dict
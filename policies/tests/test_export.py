@@ -0,0 +1,182 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from my_garage.algos.filter import MeanStdFilter
+from policies.export import export_policy, load_export, load_numpy_policy, load_params, save_export
+
+
+P_OPT_K = dict(pos_range=0.5, half_vel_range=2.0, half_force_range=10.0, k_range=2.0, k_lb=0.0, n_springs=4.0, trq_const=0.001, r_shaft=0.002)
+P_OPT_L = dict(pos_range=0.5, half_vel_range=2.0, half_force_range=5.0, l_range=0.1, l_lb=0.0, n_segments=4.0, k_interface=200.0, b_interface=10.0)
+
+# 4 elements in [0, 2] (k) or [0, 0.1] (l)
+HW_PER_ELEMENT = dict(parameterization='per_element', n_groups=2, n_elements=4, element_index=[0, 1, 2, 3], element_scale=1.0)
+HW_TOTAL = dict(parameterization='total', n_groups=2, n_elements=4, element_index=[0, 0, 0, 0], element_scale=0.25)
+HW_GROUPS = dict(parameterization='groups', n_groups=2, n_elements=4, element_index=[0, 0, 1, 1], element_scale=1.0)
+
+
+def sigmoid(x):
+    return 1/(1 + np.exp(-x))
+
+
+class Test_NumpyCompMechPolicy(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.random_state = np.random.RandomState(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def export(self, case, mode, n_mlp_inputs, hw_pre, hw, action_dim, obs_dim, observation_filter=None, policy_class='CompMechPolicy_OptK_HwAsAction'):
+        '''
+        Export of a policy with an MLP of one hidden layer (3 units), returns the loaded numpy policy and the values.
+        '''
+        hw_name = 'k' if case == 'opt_k' else 'l'
+        p = P_OPT_K if case == 'opt_k' else P_OPT_L
+        if hw is not None:
+            hw_ub = p['{}_lb'.format(hw_name)] + p['{}_range'.format(hw_name)]
+            hw = dict(hw, lower=[0.0] * len(hw_pre), upper=[hw_ub / hw['element_scale']] * len(hw_pre))
+        names = ['comp_policy_model/mlp/hidden_0/kernel', 'comp_policy_model/mlp/hidden_0/bias',
+                 'comp_policy_model/mlp/output/kernel', 'comp_policy_model/mlp/output/bias',
+                 'mech_policy_model/log_std/parameter', 'mech_policy_model/{}_pre/parameter'.format(hw_name)]
+        values = [self.random_state.normal(size=(n_mlp_inputs, 3)), self.random_state.normal(size=3),
+                  self.random_state.normal(size=(3, 1)), self.random_state.normal(size=1),
+                  self.random_state.normal(size=action_dim), np.asarray(hw_pre, dtype=np.float64)]
+        config = dict(format_version=1 if hw is None else 2, policy_class=policy_class, case=case, mode=mode, hw_name=hw_name,
+                      policy_name='comp_mech_policy', params_module='shared_params.params_{}'.format(case),
+                      obs_dim=obs_dim, action_dim=action_dim, hidden_sizes=[3], params=p)
+        if hw is not None:
+            config['hw'] = hw
+        path = os.path.join(self.tmp_dir, 'policy.npz')
+        save_export(path, config, names, values, n_trainable=len(values) - (mode == 'fixed_hw'), observation_filter=observation_filter)
+        return load_numpy_policy(path), dict(zip(['w0', 'b0', 'w1', 'b1', 'log_std', 'hw_pre'], values))
+
+
+    @staticmethod
+    def mlp(x, v):
+        return np.tanh(np.tanh(x.dot(v['w0']) + v['b0']).dot(v['w1']) + v['b1'])
+
+
+    def test_hw_as_action_parameterizations(self):
+        # every parameterization expands the compact k_pre to the 4 k's, as _hw_ts of the mech models
+        obs = self.random_state.normal(size=(5, 2))
+        for hw, hw_pre, k_expected in [(HW_PER_ELEMENT, [0.1, -0.2, 0.3, 0.4], lambda pre: sigmoid(pre) * 2.0),
+                                       (HW_TOTAL, [0.7], lambda pre: np.full(4, sigmoid(pre[0]) * 8.0 / 4)),
+                                       (HW_GROUPS, [0.5, -1.0], lambda pre: sigmoid(pre)[[0, 0, 1, 1]] * 2.0)]:
+            for mode in ['hw_as_action', 'fixed_hw']:
+                policy, v = self.export('opt_k', mode, 2, hw_pre, hw, action_dim=5, obs_dim=2)
+                k = k_expected(np.asarray(hw_pre))
+                mean, log_std = policy.dist_info(obs)
+                np.testing.assert_allclose(policy.hardware(), k)
+                np.testing.assert_allclose(mean[:, 0], self.mlp(obs / [0.5, 2.0], v)[:, 0] * 10.0)
+                np.testing.assert_allclose(mean[:, 1:], np.tile(k, (5, 1)))
+                np.testing.assert_allclose(log_std, np.tile(v['log_std'], (5, 1)))
+                samples, info = policy.get_actions(obs)
+                self.assertEqual(samples.shape, (5, 5))
+                np.testing.assert_allclose(info['k'], np.sum(k))
+
+    def test_opt_k_hw_as_policy(self):
+        obs = self.random_state.normal(size=(5, 2))
+        policy, v = self.export('opt_k', 'hw_as_policy', 2, [0.1, -0.2, 0.3, 0.4], HW_PER_ELEMENT, action_dim=2, obs_dim=2,
+                                policy_class='CompMechPolicy_OptK_HwAsPolicy')
+        k_sum = np.sum(sigmoid(v['hw_pre']) * 2.0)
+        f = self.mlp(obs, v)[:, 0] * 0.001 / 0.002 * 10.0
+        mean, _ = policy.dist_info(obs)
+        np.testing.assert_allclose(mean, np.stack([f - obs[:, 0] * k_sum, f], axis=1))
+
+    def test_opt_k_hw_in_policy_and_action(self):
+        obs = self.random_state.normal(size=(5, 2))
+        policy, v = self.export('opt_k', 'hw_in_policy_and_action', 6, [0.1, -0.2, 0.3, 0.4], HW_PER_ELEMENT, action_dim=5, obs_dim=2,
+                                policy_class='CompMechPolicy_OptK_HwInPolicyAndAction')
+        k_normalized = sigmoid(v['hw_pre'])
+        f = self.mlp(np.concatenate([obs / [0.5, 2.0], np.tile(k_normalized, (5, 1))], axis=1), v)[:, 0] * 10.0
+        mean, _ = policy.dist_info(obs)
+        np.testing.assert_allclose(mean, np.concatenate([f[:, None], np.tile(k_normalized * 2.0, (5, 1))], axis=1))
+        _, info = policy.get_actions(obs)
+        np.testing.assert_allclose(info['k_sum'], np.sum(k_normalized * 2.0))
+
+    def test_opt_l_hw_as_policy(self):
+        obs = self.random_state.normal(size=(5, 4))
+        l_pre = [0.1, -0.2, 0.3, 0.4]
+        l_sum = np.sum(sigmoid(np.asarray(l_pre)) * 0.1)
+        for mode in ['hw_as_policy', 'hw_as_policy_substep_coupling']:
+            policy, v = self.export('opt_l', mode, 2, l_pre, HW_PER_ELEMENT, action_dim=3 if mode == 'hw_as_policy' else 2, obs_dim=4,
+                                    policy_class='CompMechPolicy_OptL_HwAsPolicy')
+            f = self.mlp(obs[:, :2], v)[:, 0] * 5.0
+            mean, _ = policy.dist_info(obs)
+            if mode == 'hw_as_policy':
+                f1 = 0.5 * 200.0 * (obs[:, 2] - obs[:, 0] - l_sum) + 0.5 * 10.0 * (obs[:, 3] - obs[:, 1])
+                np.testing.assert_allclose(mean, np.stack([f1, -f1, f], axis=1))
+            else:
+                np.testing.assert_allclose(mean, np.stack([np.full(5, l_sum), f], axis=1))
+
+    def test_opt_l_hw_as_action_total(self):
+        obs = self.random_state.normal(size=(5, 2))
+        policy, v = self.export('opt_l', 'hw_as_action', 2, [-0.3], HW_TOTAL, action_dim=5, obs_dim=2, policy_class='CompMechPolicy_OptL_HwAsAction')
+        _, info = policy.get_actions(obs)
+        np.testing.assert_allclose(info['l'], sigmoid(-0.3) * 0.4) # the total, not n times it
+
+    def test_format_1(self):
+        # exports without the hardware map have one pre-sigmoid entry per element in [lb, lb + range]
+        policy, v = self.export('opt_k', 'hw_as_action', 2, [0.1, -0.2, 0.3, 0.4], None, action_dim=5, obs_dim=2)
+        np.testing.assert_allclose(policy.hardware(), sigmoid(v['hw_pre']) * 2.0)
+
+    def test_observation_filter(self):
+        # the frozen filter of an ARS policy is applied before the forward pass
+        obs_filter = MeanStdFilter((2,))
+        obs_filter.mean, obs_filter.std = np.array([0.1, -0.5]), np.array([0.2, 3.0])
+        obs_filter.buffer.push(np.ones((3, 2))) # not exported
+        obs = self.random_state.normal(size=(5, 2))
+        policy, v = self.export('opt_k', 'hw_as_action', 2, [0.7], HW_TOTAL, action_dim=5, obs_dim=2, observation_filter=obs_filter)
+        obs_filtered = (obs - [0.1, -0.5]) / (np.array([0.2, 3.0]) + 1e-8)
+        mean, _ = policy.dist_info(obs)
+        np.testing.assert_allclose(mean[:, 0], self.mlp(obs_filtered / [0.5, 2.0], v)[:, 0] * 10.0)
+        policy.dist_info(obs)
+        self.assertEqual(policy.observation_filter.buffer.n, 0) # frozen
+
+        _, _, _, loaded_filter = load_export(os.path.join(self.tmp_dir, 'policy.npz'))
+        np.testing.assert_array_equal(loaded_filter.mean, obs_filter.mean)
+        np.testing.assert_array_equal(loaded_filter.std, obs_filter.std)
+
+    def test_param_values(self):
+        obs = self.random_state.normal(size=(5, 2))
+        policy, v = self.export('opt_k', 'hw_as_action', 2, [0.1, -0.2, 0.3, 0.4], HW_PER_ELEMENT, action_dim=5, obs_dim=2)
+        flat = policy.get_param_values()
+        np.testing.assert_array_equal(flat, np.concatenate([np.reshape(v[key], -1) for key in ['w0', 'b0', 'w1', 'b1', 'log_std', 'hw_pre']]))
+        config, named, trainable_names, _ = load_export(os.path.join(self.tmp_dir, 'policy.npz'))
+        self.assertEqual(trainable_names, list(named))
+        self.assertEqual(config['hw']['parameterization'], 'per_element')
+
+        policy.set_param_values(flat + 1.0)
+        np.testing.assert_allclose(policy.get_param_values(), flat + 1.0)
+        np.testing.assert_allclose(policy.hardware(), sigmoid(v['hw_pre'] + 1.0) * 2.0)
+        mean, _ = policy.dist_info(obs)
+        v_shifted = {key: val + 1.0 for key, val in v.items()}
+        np.testing.assert_allclose(mean[:, 0], self.mlp(obs / [0.5, 2.0], v_shifted)[:, 0] * 10.0)
+
+
+class Test_Export(unittest.TestCase):
+    def test_unsupported_policy(self):
+        for class_name in ['CompPolicy_OptK_HwConditioned', 'CompMechPolicy_OptL_HwAsAction_Population']:
+            with self.assertRaisesRegex(ValueError, 'unsupported policy class {}'.format(class_name)):
+                export_policy(type(class_name, (), {})(), 'unused.npz')
+
+    def test_load_params(self):
+        # the params module as exported, whatever the env vars are at load time
+        env = {key: os.environ.get(key) for key in ['HWASP_N_SPRINGS', 'HWASP_HW_PARAMETERIZATION']}
+        hw = dict(HW_TOTAL, n_elements=3, element_index=[0, 0, 0], element_scale=1/3, lower=[0.0], upper=[100.0])
+        params = load_params(dict(case='opt_k', mode='hw_as_action', hw_name='k', params_module='shared_params.params_opt_k', hw=hw))
+        self.assertEqual(params.n_springs, 3)
+        self.assertEqual(params.k_hw.dim, 1)
+        self.assertEqual({key: os.environ.get(key) for key in env}, env)
+
+        with self.assertRaises(ValueError):
+            load_params(dict(case='opt_k', mode='hw_as_action', hw_name='k', params_module='shared_params.params_opt_k',
+                             hw=dict(hw, parameterization='per_element')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1' # only show warning and errors in TF
+import tensorflow as tf
+
+from launchers.train.opt_k import grad_opt_k
+from launchers.train.opt_l import grad_opt_l
+
+
+class Test_GradOpt(unittest.TestCase):
+    def run_one_iteration(self, launcher, hw_name):
+        # every variable of the rollout, the controller and Adam is initialized by build_grad_opt
+        with tf.Graph().as_default(), tf.compat.v1.Session() as sess:
+            rollout, train_op = launcher.build_grad_opt(launcher.params.grad_opt_kwargs, n_steps=5)
+            y1_init, v1_init = rollout.sample_initial_states(4)
+            hw_pre_before = sess.run(getattr(rollout, hw_name))
+            avg_discounted_return, _ = sess.run([rollout.average_discounted_return_ts, train_op],
+                                                feed_dict={rollout.y1_init: y1_init, rollout.v1_init: v1_init})
+            self.assertTrue(np.isfinite(avg_discounted_return))
+            self.assertEqual(sess.run(getattr(rollout, hw_name)).shape, hw_pre_before.shape)
+
+    def test_grad_opt_k(self):
+        self.run_one_iteration(grad_opt_k, 'k_pre')
+
+    def test_grad_opt_l(self):
+        self.run_one_iteration(grad_opt_l, 'l_pre')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+
+from policies.hw_parameterization import HwParameterization
+
+
+class Test_HwParameterization(unittest.TestCase):
+    def test_dims(self):
+        self.assertEqual(HwParameterization(50, 0.0, 2.0, 'per_element').dim, 50)
+        self.assertEqual(HwParameterization(50, 0.0, 2.0, 'total').dim, 1)
+        self.assertEqual(HwParameterization(50, 0.0, 2.0, 'groups', n_groups=5).dim, 5)
+
+    def test_bounds(self):
+        # the corners of the search box map to the per-element bounds
+        for mode in ['per_element', 'total', 'groups']:
+            hw = HwParameterization(7, 0.5, 2.0, mode, n_groups=3)
+            np.testing.assert_allclose(hw.to_elements(hw.lower), [0.5] * 7)
+            np.testing.assert_allclose(hw.to_elements(hw.upper), [2.0] * 7)
+            x = np.random.uniform(hw.lower, hw.upper, size=(10, hw.dim))
+            elements = hw.to_elements(x)
+            self.assertEqual(elements.shape, (10, 7))
+            self.assertTrue(np.all((elements >= 0.5) & (elements <= 2.0)))
+            np.testing.assert_allclose(hw.from_elements(elements), x)
+
+    def test_total(self):
+        hw = HwParameterization(50, 0.0, 2.0, 'total')
+        self.assertAlmostEqual(np.sum(hw.to_elements([30.0])), 30.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
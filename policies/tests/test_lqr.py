@@ -0,0 +1,61 @@
+import unittest
+import numpy as np
+import scipy.linalg
+
+from mass_spring_envs.envs.linear_integrators import propagator, spring_mass_matrices
+from mass_spring_envs.envs.mass_spring_env_opt_k import MassSpringEnv_OptK_HwConditioned
+from mass_spring_envs.envs.mass_spring_env_opt_l import MassSpringEnv_OptL_HwConditioned
+from policies.lqr import LQRFitness, spring_mass_propagator
+from shared_params import params_opt_k, params_opt_l
+
+
+class Test_LQR(unittest.TestCase):
+    def test_propagator(self):
+        for method in ['implicit_midpoint', 'expm']:
+            phi, gamma = spring_mass_propagator([0.0, 7.0, 80.0], 0.2, 0.002, 5, method)
+            for i, k in enumerate([0.0, 7.0, 80.0]):
+                phi_ref, gamma_ref = propagator(*spring_mass_matrices(k, 0.2), 0.002, 5, method)
+                np.testing.assert_allclose(phi[i], phi_ref, atol=1e-12)
+                np.testing.assert_allclose(gamma[i], gamma_ref, atol=1e-12)
+
+    def test_riccati(self):
+        fitness = LQRFitness(params_opt_k)
+        candidates = fitness.hw.from_elements(np.outer([0.1, 1.0, 1.9], np.ones(fitness.hw.n_elements)))
+        lqr = fitness.solve(candidates)
+        for i in range(len(candidates)):
+            scale = np.sqrt(fitness.discount)
+            P = scipy.linalg.solve_discrete_are(scale * lqr['A'][i], scale * lqr['B'][i], fitness.Q, fitness.R)
+            np.testing.assert_allclose(lqr['P'][i], P, rtol=1e-8)
+
+    def test_rollout_matches_env(self):
+        # the batched closed-loop return equals the controller stepping the env with the candidate's hardware
+        for params, env_cls in [(params_opt_k, MassSpringEnv_OptK_HwConditioned), (params_opt_l, MassSpringEnv_OptL_HwConditioned)]:
+            fitness = LQRFitness(params, n_episodes=2, max_path_length=300)
+            hw = fitness.hw.lower + 0.3 * (fitness.hw.upper - fitness.hw.lower)
+            result = fitness.rollout(hw[None])
+            controller = fitness.controller(hw)
+            env = env_cls(params)
+            env.set_hardware(hw)
+            for episode, (y1, v1) in enumerate(fitness.initial_states):
+                env.reset()
+                env.y1, env.v1 = y1, v1
+                obs = env.get_obs()
+                discounted_return = 0.0
+                for t in range(300):
+                    action, _ = controller.get_action(obs)
+                    obs, reward, _, _ = env.step(action)
+                    discounted_return += fitness.discount**t * reward
+                self.assertAlmostEqual(result['discounted_returns'][0, episode], discounted_return, places=8)
+
+    def test_search(self):
+        # only the total matters: the best stiffness holds the goal without a motor force
+        fitness = LQRFitness(params_opt_k, n_episodes=4, max_path_length=300)
+        hw, _ = fitness.search(256)
+        k_sum = np.sum(fitness.hw.to_elements(hw))
+        k_neutral = (params_opt_k.m1 + params_opt_k.m2) * params_opt_k.g / (params_opt_k.h - params_opt_k.l)
+        self.assertLess(abs(k_sum - k_neutral), 2.0)
+        self.assertEqual(fitness.n_evals, 256)
+
+
+if __name__ == '__main__':
+    unittest.main()
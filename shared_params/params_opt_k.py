@@ -1,5 +1,8 @@
+import os
 import numpy as np
 
+from policies.hw_parameterization import HwParameterization
+
 # env params
 # in SI
 
@@ -20,8 +23,10 @@ g = 9.8
 dt = 0.002
 n_steps_per_action = 5
 n_steps_per_episode = 1000
+integrator = 'midpoint' # 'midpoint': spring force held over each action (mid-point Euler substeps), or 'midpoint_substep' / 'implicit_midpoint' / 'expm' (mass_spring_envs/envs/linear_integrators.py) for the spring force following the state within the action (HwAsAction only, in HwAsPolicy the spring force is part of the action)
+hw_sampling = 'per_step' # HwAsAction: 'per_step' samples the k's with every action, 'per_episode' draws them at the first step after reset and holds them for the episode (policies/episode_hardware.py)
 
-n_springs = 50 # for multi-spring cases
+n_springs = int(os.environ.get('HWASP_N_SPRINGS', 50)) # for multi-spring cases, overridable by the env var HWASP_N_SPRINGS (used by the scaling benchmark)
 
 reward_alpha = 10.0
 reward_beta = 0.5
@@ -43,6 +48,12 @@ k_pre_init = inv_sigmoid(k_init, k_lb, k_ub)
 k_pre_init_lb = -5
 k_pre_init_ub = 5
 
+# search space of the hardware (CMA-ES and the mech models' k_pre), the envs only use the sum of the spring stiffnesses:
+# 'per_element' (n_springs dims), 'total' (1 dim, the sum) or 'groups' (hw_n_groups dims shared by contiguous groups)
+hw_parameterization = os.environ.get('HWASP_HW_PARAMETERIZATION', 'per_element')
+hw_n_groups = min(5, n_springs)
+k_hw = HwParameterization(n_springs, k_lb, k_ub, hw_parameterization, hw_n_groups)
+
 # init stds
 std_range_ratio_action = 0.3
 std_range_ratio_auxiliary = 0.3
@@ -82,6 +93,11 @@ ppo_algo_kwargs = dict(
 
 
 ppo_train_kwargs = dict(n_epochs=2000, batch_size=2000, plot=False)
+ppo_hw_conditioned_train_kwargs = dict(n_epochs=2000, batch_size=4000, plot=False) # ppo_opt_*_hw_conditioned, every episode has its own hardware
+ppo_population_kwargs = dict(n_members=8, n_envs_per_member=2) # ppo_opt_*_hw_as_action_population, independent policies and hardware trained in lockstep in one graph (my_garage/algos/population_ppo.py)
+pbt_options = dict(n_members=8, interval=50, quantile=0.25, hw_perturb_std=0.5, perturb_factors=(0.8, 1.2),
+    explore_keys=['optimizer_args.learning_rate', 'lr_clip_range', 'policy_ent_coeff']) # pbt_ppo_opt_*, population-based training across seeds (my_garage/experiment/pbt.py), interval epochs per round
+pbt_options['n_rounds'] = ppo_train_kwargs['n_epochs'] // pbt_options['interval'] # the epochs of one ppo_opt_* run per member
 
 # for pure cmaes
 cmaes_algo_kwargs = dict(
@@ -89,6 +105,7 @@ cmaes_algo_kwargs = dict(
     n_samples=32,
     discount=0.99,
     sigma0=2.0,
+    variant='full', # 'full' or 'sep' (separable, O(n) per generation), my_garage/algos/cmaes.py
 )
 
 cmaes_train_kwargs = dict(n_epochs=100, batch_size=2000, plot=False)
@@ -99,9 +116,14 @@ ppo_inner_train_kwargs = dict(n_epochs=300, batch_size=500, plot=False)
 
 ppo_inner_final_average_discounted_return_window_size = 10
 
-cmaes_options = {'tolfun':1.0, 'tolx':0.1, 'popsize': 8, 'maxiter':5, 'verb_log': 1, 'bounds': [[k_lb,] * n_springs, [k_ub,] * n_springs]}
-cmaes_x0 = [(k_lb + k_ub) / 2,] * n_springs
-cmaes_sigma0 = (k_ub - k_lb) / 4  # init sigma ususally chosen as a quater of the total range
+cmaes_options = {'tolfun':1.0, 'tolx':0.1, 'popsize': 8, 'maxiter':5, 'verb_log': 1, 'bounds': [k_hw.lower.tolist(), k_hw.upper.tolist()]}
+cmaes_x0 = k_hw.center.tolist()
+cmaes_sigma0 = (k_hw.upper[0] - k_hw.lower[0]) / 4  # init sigma ususally chosen as a quater of the total range
+lqr_options = dict(n_episodes=16, n_candidates=1024) # LQR fitness of the linear model (policies/lqr.py), initial states per candidate and grid of totals for the CMA-ES x0 (--cmaes_x0 lqr)
+cmaes_variant = 'full' # 'full' or 'sep' (separable, O(n) per generation) CMA-ES for the hardware outer loop, my_garage/algos/cmaes.py
+outer_optimizer = 'cmaes' # 'cmaes' or 'bo' (Bayesian optimization, my_garage/algos/bayes_opt.py) for the hardware outer loop
+bo_options = dict(batch_size=4, n_init=8, max_evals=24) # the batch_size inner trainings of a batch run in parallel
+inner_trainer = 'subprocess' # 'subprocess' (run_experiment per candidate, the BO batches in parallel) or 'persistent' (one TF graph for all inner trainings, my_garage/experiment/persistent_trainer.py, one candidate at a time)
 
 
 # for ars
@@ -112,5 +134,16 @@ ars_kwargs = dict(num_workers=8,
                 delta_std=0.10, 
                 logdir='logdir',
                 rollout_length=n_steps_per_episode,
-                shift=0)
-ars_n_iter = int(4e6 / (2*ars_kwargs['num_deltas']*n_steps_per_episode)) + 1
\ No newline at end of file
+                shift=0,
+                observation_filter='NoFilter', # 'NoFilter' (ARS V1) or 'MeanStdFilter' (V2, observations normalized by running statistics, --ars_filter)
+                perturbed_params=None, # regexes of the perturbed policy variables, None for all, e.g. ['kernel', 'bias', 'k_pre'] for the MLP weights and hardware (--ars_perturbed_params)
+                deterministic=False) # rollouts with the mean action instead of sampling (--ars_deterministic)
+ars_n_iter = int(4e6 / (2*ars_kwargs['num_deltas']*n_steps_per_episode)) + 1
+ars_checkpoint_interval = 5 # iterations between checkpoints (models/ars_checkpoint.pkl), continue with --resume
+ars_task_timeout = 60.0 # seconds before a multi-node ARS task (--ars_address) is also handed to another worker
+
+# for gradient-based optimization through the differentiable rollout (hardware and controller jointly)
+grad_opt_kwargs = dict(n_iters=300, 
+                batch_size=64, 
+                learning_rate=1e-2, 
+                discount=0.99)